@@ -0,0 +1,222 @@
+import graphlib
+import hashlib
+import json
+import os
+import time
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.core.serializers.python import Deserializer
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from .models import FixtureLoad
+from .signals import invalidate_data_caches
+from .stats import rebuild_borough_stats, refresh_neighborhood_summaries
+
+FIXTURE_CHUNK_SIZE = 64 * 1024
+
+
+def fixture_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(FIXTURE_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_fixture(file, chunk_size=FIXTURE_CHUNK_SIZE):
+    """Yield the objects of a JSON fixture (one top-level array) one by one, reading the file in chunks."""
+    decoder = json.JSONDecoder()
+    buffer, position, started = '', 0, False
+    while True:
+        while position < len(buffer) and (buffer[position].isspace() or buffer[position] == ','):
+            position += 1
+        if position == len(buffer):
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise ValueError('Fixture ends before its closing bracket')
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+
+        if not started:
+            if buffer[position] != '[':
+                raise ValueError('A fixture must be a JSON array of objects')
+            started = True
+            position += 1
+            continue
+        if buffer[position] == ']':
+            return
+
+        try:
+            obj, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The object continues in the next chunk
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield obj
+        position = end
+
+
+def _dependencies(model, present):
+    """The models among ``present`` that the foreign keys of ``model`` point to."""
+    return {
+        field.related_model for field in model._meta.concrete_fields
+        if field.is_relation and field.related_model in present and field.related_model is not model
+    }
+
+
+def dependency_order(models):
+    """Models ordered so that every model comes after the models its foreign keys point to."""
+    present = set(models)
+    sorter = graphlib.TopologicalSorter()
+    for model in models:
+        sorter.add(model, *_dependencies(model, present))
+    # static_order() is deterministic for a given insertion order, which follows the fixture
+    return list(sorter.static_order())
+
+
+def _insert(model, objects, batch_size, using):
+    manager = model._default_manager.using(using)
+    pk_name = model._meta.pk.name
+    with_pk = [obj for obj in objects if obj.pk is not None]
+    without_pk = [obj for obj in objects if obj.pk is None]
+
+    # Rows with a primary key replace the existing row with that key, so loading twice changes nothing
+    update_fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+    if with_pk and update_fields:
+        manager.bulk_create(with_pk, batch_size=batch_size, update_conflicts=True,
+                            unique_fields=[pk_name], update_fields=update_fields)
+    elif with_pk:
+        manager.bulk_create(with_pk, batch_size=batch_size, ignore_conflicts=True)
+    # Natural-key rows not found in the database (content types, permissions); skipped if they appear meanwhile
+    if without_pk:
+        manager.bulk_create(without_pk, batch_size=batch_size, ignore_conflicts=True)
+
+
+def _set_many_to_many(model, deserialized, batch_size, using):
+    for field in model._meta.many_to_many:
+        through = field.remote_field.through
+        if not through._meta.auto_created:
+            continue
+        source = field.m2m_field_name() + '_id'
+        target = field.m2m_reverse_field_name() + '_id'
+        rows = {
+            item.object.pk: item.m2m_data[field.name]
+            for item in deserialized
+            if item.m2m_data and field.name in item.m2m_data and item.object.pk is not None
+        }
+        if not rows:
+            continue
+        through._default_manager.using(using).filter(**{f'{source}__in': list(rows)}).delete()
+        through._default_manager.using(using).bulk_create(
+            [through(**{source: pk, target: related_pk}) for pk, related in rows.items() for related_pk in related],
+            batch_size=batch_size,
+        )
+
+
+class _BatchLoader:
+    """
+    Inserts fixture objects in batches of ``batch_size`` per model. A model's
+    objects are held back only until every model it refers to is complete, so
+    a fixture in dependency order (as dumpdata writes it) never holds more
+    than one batch per model in memory.
+    """
+
+    def __init__(self, counts, batch_size, using):
+        self.remaining = dict(counts)
+        self.dependencies = {model: _dependencies(model, set(counts)) for model in counts}
+        self.pending = {model: [] for model in counts}
+        self.batch_size = batch_size
+        self.using = using
+        self.complete = set()
+        # Model -> [rows, seconds], in the order the models complete
+        self.timings = {}
+
+    def add(self, model, obj):
+        self.pending[model].append(obj)
+        self.remaining[model] -= 1
+        self._flush(model)
+
+    def finish(self):
+        # Only left over when the foreign keys form a cycle; dependency_order() then raises
+        for model in dependency_order([model for model in self.pending if model not in self.complete]):
+            self._flush(model, force=True)
+        return [(model._meta.label, rows, seconds) for model, (rows, seconds) in self.timings.items()]
+
+    def _flush(self, model, force=False):
+        if not force and not self.dependencies[model] <= self.complete:
+            return
+        pending = self.pending[model]
+        while len(pending) >= self.batch_size or (pending and self.remaining[model] == 0):
+            batch = pending[:self.batch_size]
+            del pending[:self.batch_size]
+            self._insert(model, batch)
+        if self.remaining[model] == 0 and model not in self.complete:
+            self.complete.add(model)
+            self.timings.setdefault(model, [0, 0.0])
+            # Models that waited for this one may go in now
+            for other in self.pending:
+                if other not in self.complete:
+                    self._flush(other)
+
+    def _insert(self, model, objects):
+        start = time.perf_counter()
+        deserialized = list(Deserializer(objects, using=self.using, ignorenonexistent=True))
+        _insert(model, [item.object for item in deserialized], self.batch_size, self.using)
+        _set_many_to_many(model, deserialized, self.batch_size, self.using)
+        timing = self.timings.setdefault(model, [0, 0.0])
+        timing[0] += len(deserialized)
+        timing[1] += time.perf_counter() - start
+
+
+def load_fixture(path, batch_size=1000, force=False, using=DEFAULT_DB_ALIAS):
+    """
+    Load a JSON fixture with bulk inserts of ``batch_size`` rows, in dependency
+    order and inside a single transaction. The file is streamed twice: once to
+    count the objects per model, then to insert them. Rows are upserted by
+    primary key, so the load is idempotent. BoroughStats and
+    NeighborhoodSummary are rebuilt once the load commits. Returns
+    ``(sha256, timings)`` where ``timings`` lists ``(model label, rows,
+    seconds)``, or ``(sha256, None)`` when this version of the fixture was
+    already applied and ``force`` is false.
+    """
+    name = os.path.basename(path)
+    sha256 = fixture_sha256(path)
+    if not force and FixtureLoad.objects.using(using).filter(fixture=name, sha256=sha256).exists():
+        return sha256, None
+
+    # First pass: which models the fixture holds and how many objects each
+    counts = {}
+    with open(path, encoding='utf-8') as file:
+        for obj in iter_fixture(file):
+            model = apps.get_model(obj['model'])
+            counts[model] = counts.get(model, 0) + 1
+
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        loader = _BatchLoader(counts, batch_size, using)
+        with open(path, encoding='utf-8') as file:
+            for obj in iter_fixture(file):
+                loader.add(apps.get_model(obj['model']), obj)
+        timings = loader.finish()
+
+        # Rows were inserted with explicit keys; move the sequences past them (PostgreSQL)
+        statements = connection.ops.sequence_reset_sql(no_style(), list(counts))
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+
+        FixtureLoad.objects.using(using).update_or_create(
+            fixture=name,
+            defaults={'sha256': sha256, 'rows': sum(rows for _, rows, _ in timings), 'loaded_at': timezone.now()},
+        )
+        # Bulk inserts send no signals, so the derived tables are rebuilt here
+        transaction.on_commit(rebuild_borough_stats, using=using)
+        transaction.on_commit(refresh_neighborhood_summaries, using=using)
+        transaction.on_commit(invalidate_data_caches, using=using)
+    return sha256, timings
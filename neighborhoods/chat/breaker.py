@@ -0,0 +1,202 @@
+import collections
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from ..metrics import REGISTRY, Counter
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+
+# Gauge values for chat_circuit_state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+chat_circuit_transitions = REGISTRY.register(Counter(
+    'chat_circuit_transitions', 'Circuit breaker state changes by provider.', ['provider', 'state']))
+
+
+class ProviderUnavailable(Exception):
+    """The provider was not called: its circuit is open or all of its calls are stuck."""
+
+
+class ProviderTimeout(ProviderUnavailable):
+    """The provider did not answer within its timeout; the call is left to finish in the background."""
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker.
+
+    Outcomes of the last ``window`` seconds are kept. Once at least
+    ``min_calls`` were made and the share of failures reaches
+    ``failure_rate``, the circuit opens and calls fail fast for
+    ``open_seconds``. It then turns half-open and lets ``half_open_calls``
+    trial calls through: a success closes it, a failure opens it again.
+    """
+
+    def __init__(self, name, failure_rate=0.5, min_calls=5, window=60, open_seconds=30, half_open_calls=1,
+                 clock=time.monotonic):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = None
+        self._trials = 0
+        # (time, succeeded) for calls made while closed
+        self._outcomes = collections.deque()
+
+    @property
+    def state(self):
+        with self._lock:
+            self._update(self._clock())
+            return self._state
+
+    def _update(self, now):
+        if self._state != CLOSED and now - self._opened_at >= self.open_seconds:
+            # Also re-arms the trials of a half-open circuit whose trial call never reported back
+            if self._state == OPEN:
+                self._transition(HALF_OPEN)
+            self._opened_at = now
+            self._trials = 0
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def _transition(self, state):
+        self._state = state
+        chat_circuit_transitions.inc(provider=self.name, state=state)
+        log = logger.info if state == CLOSED else logger.warning
+        log(f"Circuit for '{self.name}' is {state.replace('_', '-')}")
+
+    def allow(self):
+        """Whether a call may go ahead now; in the half-open state each True reserves a trial call."""
+        with self._lock:
+            self._update(self._clock())
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._trials < self.half_open_calls:
+                self._trials += 1
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._outcomes.clear()
+                self._transition(CLOSED)
+            elif self._state == CLOSED:
+                self._outcomes.append((self._clock(), True))
+
+    def record_failure(self):
+        with self._lock:
+            now = self._clock()
+            if self._state == HALF_OPEN:
+                self._open(now)
+            elif self._state == CLOSED:
+                self._outcomes.append((now, False))
+                self._update(now)
+                failures = sum(1 for _, succeeded in self._outcomes if not succeeded)
+                if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                    self._open(now)
+
+    def reset(self):
+        with self._lock:
+            self._outcomes.clear()
+            if self._state != CLOSED:
+                self._transition(CLOSED)
+
+    def _open(self, now):
+        self._opened_at = now
+        self._outcomes.clear()
+        self._transition(OPEN)
+
+
+class ProviderGuard:
+    """
+    Runs blocking calls to one external provider behind a circuit breaker and
+    a timeout. Each call runs in its own daemon thread; after ``timeout``
+    seconds the caller gets ``ProviderTimeout`` and the thread is abandoned.
+    At most ``max_concurrency`` calls (abandoned ones included) run at once,
+    so a hanging provider cannot pile up threads; further calls fail fast.
+    """
+
+    def __init__(self, name, timeout, breaker=None, max_concurrency=4):
+        self.name = name
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker(name)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def call(self, func, *args, failed=None, **kwargs):
+        """
+        Call ``func(*args, **kwargs)`` and return its result. Exceptions, and
+        results for which ``failed(result)`` is true, count as failures.
+        """
+        if not self.breaker.allow():
+            raise ProviderUnavailable(f"Circuit for '{self.name}' is open")
+        if not self._slots.acquire(blocking=False):
+            self.breaker.record_failure()
+            raise ProviderUnavailable(f"Too many '{self.name}' calls are still running")
+
+        done = threading.Event()
+        outcome = {}
+
+        def run():
+            try:
+                outcome['result'] = func(*args, **kwargs)
+            except BaseException as e:
+                outcome['error'] = e
+            finally:
+                self._slots.release()
+                done.set()
+
+        threading.Thread(target=run, daemon=True, name=f"{self.name}-call").start()
+        if not done.wait(self.timeout):
+            self.breaker.record_failure()
+            raise ProviderTimeout(f"'{self.name}' did not answer within {self.timeout}s")
+
+        if 'error' in outcome:
+            self.breaker.record_failure()
+            raise outcome['error']
+        if failed is not None and failed(outcome['result']):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return outcome['result']
+
+
+# Guards shared by every provider calling the same upstream, by name
+PROVIDER_GUARDS = {}
+_guards_lock = threading.Lock()
+
+
+def provider_guard(name, timeout):
+    with _guards_lock:
+        guard = PROVIDER_GUARDS.get(name)
+        if guard is None:
+            options = settings.CHAT_CIRCUIT_BREAKER
+            breaker = CircuitBreaker(
+                name,
+                failure_rate=options['failure_rate'],
+                min_calls=options['min_calls'],
+                window=options['window'],
+                open_seconds=options['open_seconds'],
+            )
+            guard = PROVIDER_GUARDS[name] = ProviderGuard(
+                name, timeout, breaker, max_concurrency=options['max_concurrency'])
+        return guard
+
+
+@REGISTRY.register_gauges
+def circuit_state_gauges():
+    for name, guard in sorted(PROVIDER_GUARDS.items()):
+        yield ('chat_circuit_state', 'Circuit breaker state per provider (0 closed, 1 half-open, 2 open).',
+               {'provider': name}, STATE_VALUES[guard.breaker.state])
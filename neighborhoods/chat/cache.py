@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries each carry their own expiry time.
+
+    With a ``path`` the entries are written to a JSON file (at most every
+    ``persist_interval`` seconds, and on ``save()``) and read back on start, so
+    warm entries survive worker restarts. Values must be JSON serializable.
+    """
+
+    def __init__(self, max_entries=1024, path=None, persist_interval=60, clock=time.time):
+        self.max_entries = max_entries
+        self.path = path
+        self.persist_interval = persist_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (expires_at, value), least recently used first
+        self._entries = OrderedDict()
+        self._dirty = False
+        self._last_save = clock()
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+            persist = self.path and self._clock() - self._last_save >= self.persist_interval
+        if persist:
+            self.save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache file {self.path}: {e}")
+            return
+
+        now = self._clock()
+        with self._lock:
+            for key, expires_at, value in entries[-self.max_entries:]:
+                if expires_at > now:
+                    self._entries[key] = (expires_at, value)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            now = self._clock()
+            entries = [[key, expires_at, value] for key, (expires_at, value) in self._entries.items() if expires_at > now]
+            self._dirty = False
+            self._last_save = now
+
+        # Write to a temporary file first so a crash never leaves a truncated cache behind
+        try:
+            directory = os.path.dirname(self.path) or '.'
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, delete=False) as f:
+                json.dump(entries, f)
+            os.replace(f.name, self.path)
+        except OSError as e:
+            logger.warning(f"Could not persist cache to {self.path}: {e}")
@@ -0,0 +1,308 @@
+import re
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max, Min, Sum
+from rapidfuzz import fuzz, process
+
+from ..models import Amenities, Borough, CrimeData, Demographics, Neighborhood, RentData, Transports
+
+CHAT_FACTS_CACHE_KEY = 'chat_fact_table'
+
+# Amenity types from the Amenities table counted under each metric
+AMENITY_METRICS = {
+    'schools': ('Primary Schools', 'Secondary Schools', 'Vocationnal Schools',
+                'Primary To Vocationnal Schools', 'Fachoberschule'),
+    'parks': ('Park', 'HundePark'),
+    'pharmacies': ('Pharmacy',),
+    'museums': ('Museum',),
+    'galleries': ('Gallerie',),
+    'cinemas': ('Cinema',),
+    'libraries': ('Library',),
+    'clubs': ('Club',),
+    'bars': ('Bar',),
+    'theaters': ('Theater',),
+}
+
+CRIME_METRICS = {
+    'crimes': 'total_crimes',
+    'robberies': 'robbery',
+    'assaults': 'total_assaults',
+    'thefts': 'total_thefts',
+    'burglaries': 'total_residential_burglary',
+    'arson incidents': 'total_arson_incidents',
+    'vandalism incidents': 'total_vandalism',
+}
+
+# Metric keywords, most specific first: a message about "thefts" is not answered with total crimes
+METRIC_KEYWORDS = (
+    ('robberies', ('robbery', 'robberies')),
+    ('assaults', ('assault', 'assaults')),
+    ('thefts', ('theft', 'thefts', 'stolen')),
+    ('burglaries', ('burglary', 'burglaries', 'break ins', 'break-ins')),
+    ('arson incidents', ('arson',)),
+    ('vandalism incidents', ('vandalism',)),
+    ('crimes', ('crime', 'crimes', 'safe', 'safest', 'safety', 'dangerous', 'criminal')),
+    ('size', ('flat size', 'apartment size', 'size', 'square meters', 'sqm', 'm2')),
+    ('rent', ('rent', 'rents', 'price', 'prices', 'expensive', 'cheap', 'cheapest', 'affordable', 'cost')),
+    ('schools', ('school', 'schools')),
+    ('parks', ('park', 'parks')),
+    ('pharmacies', ('pharmacy', 'pharmacies')),
+    ('museums', ('museum', 'museums')),
+    ('galleries', ('gallery', 'galleries')),
+    ('cinemas', ('cinema', 'cinemas', 'movie theater', 'movie theaters')),
+    ('libraries', ('library', 'libraries')),
+    ('clubs', ('club', 'clubs', 'nightlife')),
+    ('bars', ('bar', 'bars')),
+    ('theaters', ('theater', 'theaters', 'theatre', 'theatres')),
+    ('stations', ('station', 'stations', 'stops', 'public transport')),
+    ('foreigners', ('foreigners', 'foreign', 'international', 'expats')),
+    ('population', ('population', 'people', 'residents', 'inhabitants')),
+)
+
+# A metric word alone is not a data question: figures for a place are only given for
+# quantity questions, and rankings need a superlative right before the metric word
+# ("the most parks", "highest rent"), so "the most famous museum" is left to the other stages
+QUANTITY_PHRASES = ('how many', 'how much', 'number of', 'average', 'how expensive', 'how cheap',
+                    'how affordable', 'how safe', 'how dangerous', 'how big', 'how large')
+LOW_WORDS = ('fewest', 'least', 'lowest', 'smallest')
+HIGH_WORDS = ('most', 'highest', 'largest', 'biggest', 'greatest')
+# Superlatives that name their metric themselves: (metric, lowest)
+SUPERLATIVES = {
+    'cheapest': ('rent', True),
+    'most affordable': ('rent', True),
+    'most expensive': ('rent', False),
+    'safest': ('crimes', True),
+    'least safe': ('crimes', False),
+    'most dangerous': ('crimes', False),
+}
+NEIGHBORHOOD_WORDS = ('neighborhood', 'neighborhoods', 'neighbourhood', 'neighbourhoods', 'kiez')
+
+# Only crime figures are kept per borough; everything else exists for both levels
+BOROUGH_ONLY_METRICS = frozenset(CRIME_METRICS)
+
+FUZZY_NAME_CUTOFF = 85
+
+
+def fold(text):
+    """Lowercase and strip accents so that "Neukolln" finds "Neukölln"."""
+    text = unicodedata.normalize('NFKD', (text or '').lower().replace('ß', 'ss'))
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", fold(text))
+
+
+def _number(value):
+    return f"{value:,.0f}"
+
+
+def describe(metric, facts):
+    """The figure for one metric, in words, or None when it is unknown."""
+    value = facts.get(metric)
+    if value is None:
+        return None
+    if metric == 'rent':
+        return (f"an average rent of €{_number(value)} per month "
+                f"(listings from €{_number(facts['rent_min'])} to €{_number(facts['rent_max'])})")
+    if metric == 'size':
+        return f"an average flat size of {_number(value)} m²"
+    if metric == 'population':
+        return f"a population of {_number(value)}"
+    if metric == 'foreigners':
+        share = value / facts['population'] * 100 if facts.get('population') else 0.0
+        return f"{_number(value)} foreign residents ({share:.1f}% of the population)"
+    if metric == 'stations':
+        return f"{_number(value)} public transport stations"
+    if metric in CRIME_METRICS:
+        return f"{_number(value)} recorded {metric}"
+    return f"{_number(value)} {metric}"
+
+
+# Folded metric word -> metric, for the word following a superlative
+_METRIC_BY_WORD = {}
+for _metric, _words in METRIC_KEYWORDS:
+    for _word in _words:
+        _METRIC_BY_WORD.setdefault(' '.join(tokenize(_word)), _metric)
+
+_RANKING_PATTERN = re.compile(
+    r"\b(?P<superlative>{}) (?:number of |amount of )?(?:average )?(?P<metric>{})\b".format(
+        '|'.join(LOW_WORDS + HIGH_WORDS),
+        '|'.join(re.escape(word) for word in sorted(_METRIC_BY_WORD, key=len, reverse=True)),
+    )
+)
+
+
+def ranking_metric(text):
+    """(metric, lowest) when tokenized ``text`` asks for a ranking, else None."""
+    padded = f" {text} "
+    for phrase, ranking in SUPERLATIVES.items():
+        if f" {phrase} " in padded:
+            return ranking
+    match = _RANKING_PATTERN.search(text)
+    if match is None:
+        return None
+    return _METRIC_BY_WORD[match.group('metric')], match.group('superlative') in LOW_WORDS
+
+
+class FactTable:
+    """
+    Borough and neighborhood figures for answering data questions in chat,
+    plus a name index for finding the place a message is about.
+    """
+
+    def __init__(self, entities):
+        # entities: dicts with kind ('borough' or 'neighborhood'), name, borough (name) and facts
+        self.entities = entities
+        self.boroughs = {entity['name']: entity for entity in entities if entity['kind'] == 'borough'}
+
+        # folded name -> entity; boroughs win over neighborhoods of the same name (e.g. Mitte),
+        # and the parts of double-barrelled boroughs ("Kreuzberg") only when no place has that name
+        index = {}
+        for entity in sorted(entities, key=lambda entity: entity['kind'] != 'borough'):
+            index.setdefault(' '.join(tokenize(entity['name'])), entity)
+        for entity in self.boroughs.values():
+            for part in entity['name'].split('-'):
+                index.setdefault(' '.join(tokenize(part)), entity)
+        self._index = index
+        self._names = list(index)
+
+    def find_entity(self, tokens):
+        # Exact names first, longest first, then a fuzzy pass over word n-grams for misspellings
+        ngrams = [' '.join(tokens[i:i + size]) for size in (3, 2, 1) for i in range(len(tokens) - size + 1)]
+        for ngram in ngrams:
+            if ngram in self._index:
+                return self._index[ngram]
+
+        candidates = [ngram for ngram in ngrams if len(ngram) >= 4]
+        if not candidates or not self._names:
+            return None
+        scores = process.cdist(candidates, self._names, scorer=fuzz.ratio, processor=None,
+                               score_cutoff=FUZZY_NAME_CUTOFF)
+        best = scores.argmax()
+        row, column = divmod(int(best), len(self._names))
+        return self._index[self._names[column]] if scores[row, column] else None
+
+    def answer(self, message):
+        """Answer a quantity or ranking question from the table, or return None if the message is neither."""
+        text = ' '.join(tokenize(message))
+        if not text:
+            return None
+        padded = f" {text} "
+
+        def mentions(words):
+            return any(f" {' '.join(tokenize(word))} " in padded for word in words)
+
+        ranking = ranking_metric(text)
+        if ranking is not None:
+            metric, lowest = ranking
+            kind = 'neighborhood' if mentions(NEIGHBORHOOD_WORDS) and metric not in BOROUGH_ONLY_METRICS else 'borough'
+            # "the cheapest neighborhood in Pankow" ranks Pankow's neighborhoods only
+            entity = self.find_entity(text.split()) if kind == 'neighborhood' else None
+            within = entity['name'] if entity is not None and entity['kind'] == 'borough' else None
+            return self._rank(metric, kind, lowest, within)
+
+        if not mentions(QUANTITY_PHRASES):
+            return None
+        metric = next((metric for metric, words in METRIC_KEYWORDS if mentions(words)), None)
+        if metric is None:
+            return None
+        entity = self.find_entity(text.split())
+        return self._describe_entity(entity, metric) if entity is not None else None
+
+    def _describe_entity(self, entity, metric):
+        if metric in BOROUGH_ONLY_METRICS and entity['kind'] == 'neighborhood':
+            borough = self.boroughs.get(entity['borough'])
+            figure = describe(metric, borough['facts']) if borough else None
+            if figure is None:
+                return None
+            return f"Crime figures are kept per borough: {borough['name']}, which includes {entity['name']}, has {figure}."
+
+        figure = describe(metric, entity['facts'])
+        if figure is None:
+            return f"Sorry, I don't have that figure for {entity['name']}."
+        return f"{entity['name']} has {figure}."
+
+    def _rank(self, metric, kind, lowest, within=None):
+        ranked = [
+            entity for entity in self.entities
+            if entity['kind'] == kind and entity['facts'].get(metric) is not None
+            and (within is None or entity['borough'] == within)
+        ]
+        if not ranked:
+            return None
+        entity = (min if lowest else max)(ranked, key=lambda entity: entity['facts'][metric])
+        position = 'lowest' if lowest else 'highest'
+        scope = f" in {within}" if within else ''
+        return (f"{entity['name']} has the {position} figure of all {len(ranked)} {kind}s{scope} "
+                f"with {describe(metric, entity['facts'])}.")
+
+
+def build_fact_table():
+    boroughs = {borough.id: {'kind': 'borough', 'name': borough.name, 'borough': borough.name, 'facts': {}}
+                for borough in Borough.objects.all()}
+    neighborhoods = {
+        neighborhood['id']: {'kind': 'neighborhood', 'name': neighborhood['name'],
+                             'borough': boroughs[neighborhood['borough_id']]['name'], 'facts': {}}
+        for neighborhood in Neighborhood.objects.values('id', 'name', 'borough_id')
+        if neighborhood['borough_id'] in boroughs
+    }
+    levels = (('borough', boroughs), ('neighborhood', neighborhoods))
+
+    # Rent: average listing price and size, with the range of listing prices
+    for field, entities in levels:
+        rows = RentData.objects.values(field).annotate(
+            rent=Avg('avg_price'), rent_min=Min('min_price'), rent_max=Max('max_price'), size=Avg('avg_size'))
+        for row in rows:
+            if row[field] in entities:
+                entities[row[field]]['facts'].update({key: row[key] for key in ('rent', 'rent_min', 'rent_max', 'size')})
+
+    rows = CrimeData.objects.values('borough').annotate(**{f'sum_{field}': Sum(field) for field in CRIME_METRICS.values()})
+    for row in rows:
+        if row['borough'] in boroughs:
+            boroughs[row['borough']]['facts'].update(
+                {metric: row[f'sum_{field}'] for metric, field in CRIME_METRICS.items()})
+
+    amenity_metric = {amenity_type: metric for metric, types in AMENITY_METRICS.items() for amenity_type in types}
+    counts = Amenities.objects.values('borough', 'neighborhood', 'amenity_type').annotate(count=Count('id'))
+    for row in counts:
+        metric = amenity_metric.get(row['amenity_type'])
+        if metric is None:
+            continue
+        for field, entities in levels:
+            if row[field] in entities:
+                facts = entities[row[field]]['facts']
+                facts[metric] = facts.get(metric, 0) + row['count']
+    for _, entities in levels:
+        for entity in entities.values():
+            for metric in AMENITY_METRICS:
+                entity['facts'].setdefault(metric, 0)
+
+    # A station appears once per line serving it, so stations are counted by distinct name
+    for field, entities in levels:
+        for row in Transports.objects.values(field).annotate(stations=Count('name', distinct=True)):
+            if row[field] in entities:
+                entities[row[field]]['facts']['stations'] = row['stations']
+
+    for field, entities in levels:
+        for row in Demographics.objects.values(field).annotate(population=Sum('total'), foreigners=Sum('foreigners')):
+            if row[field] in entities:
+                entities[row[field]]['facts'].update(population=row['population'], foreigners=row['foreigners'])
+
+    return FactTable(list(boroughs.values()) + list(neighborhoods.values()))
+
+
+# Cached until any of the source tables changes (see signals.invalidate_chat_facts), and at most
+# DATA_CACHE_TTL seconds, for changes made by other workers with a per-process cache
+def get_fact_table():
+    table = cache.get(CHAT_FACTS_CACHE_KEY)
+    if table is None:
+        table = build_fact_table()
+        cache.set(CHAT_FACTS_CACHE_KEY, table, settings.DATA_CACHE_TTL)
+    return table
+
+
+def answer_data_question(message):
+    return get_fact_table().answer(message)
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from .matching import DialogMatcher, ResponseMatcher
+
+logger = logging.getLogger(__name__)
+
+# Source name -> file in the data directory
+KNOWLEDGE_BASE_SOURCES = {
+    'website': 'website_responses.yaml',
+    'factual': 'factual_responses.yaml',
+    'dialog': 'dialog.yaml',
+}
+
+# Bump when the snapshot layout changes, so that old snapshots are ignored
+KNOWLEDGE_BASE_SNAPSHOT_VERSION = 2
+
+
+def validate_source(name, data):
+    """Return a list of problems with the parsed contents of one source file."""
+    if name == 'dialog':
+        if not isinstance(data, dict) or 'dialogs' not in data:
+            return ["Invalid structure: 'dialog.yaml' must contain a 'dialogs' key."]
+        if not isinstance(data['dialogs'], list):
+            return ["'dialogs' must be a list."]
+        errors = []
+        for position, dialog in enumerate(data['dialogs']):
+            if not isinstance(dialog, dict) or not isinstance(dialog.get('user'), str) \
+                    or not isinstance(dialog.get('bot'), str):
+                errors.append(f"dialogs[{position}] must be a mapping with 'user' and 'bot' strings.")
+        return errors
+
+    if data is None:
+        return []
+    if not isinstance(data, dict):
+        return [f"'{KNOWLEDGE_BASE_SOURCES[name]}' must map questions to answers."]
+    return [
+        f"Question {question!r} must map a string to a string answer."
+        for question, answer in data.items()
+        if not isinstance(question, str) or not isinstance(answer, str)
+    ]
+
+
+def read_sources(data_dir):
+    """
+    Read and parse every source file. Returns ``(data, hashes, errors)`` where
+    ``data`` maps source name to its parsed contents (empty when missing or
+    invalid), ``hashes`` to the SHA-1 of the file and ``errors`` lists problems.
+    """
+    # Imported here: workers normally start from the snapshot and never parse YAML
+    import yaml
+
+    data, hashes, errors = {}, {}, []
+    for name, filename in KNOWLEDGE_BASE_SOURCES.items():
+        path = os.path.join(data_dir, filename)
+        data[name] = {}
+        try:
+            with open(path, 'rb') as file:
+                content = file.read()
+        except FileNotFoundError:
+            hashes[name] = None
+            errors.append(f"{filename}: file not found at {path}.")
+            continue
+
+        hashes[name] = hashlib.sha1(content).hexdigest()
+        try:
+            parsed = yaml.safe_load(content)
+        except yaml.YAMLError as e:
+            errors.append(f"{filename}: {e}")
+            continue
+
+        problems = validate_source(name, parsed)
+        errors.extend(f"{filename}: {problem}" for problem in problems)
+        if not problems:
+            data[name] = parsed or {}
+    return data, hashes, errors
+
+
+def source_hashes(data_dir):
+    hashes = {}
+    for name, filename in KNOWLEDGE_BASE_SOURCES.items():
+        try:
+            with open(os.path.join(data_dir, filename), 'rb') as file:
+                hashes[name] = hashlib.sha1(file.read()).hexdigest()
+        except FileNotFoundError:
+            hashes[name] = None
+    return hashes
+
+
+class KnowledgeBase:
+    """One immutable version of the YAML knowledge base and the matching indexes built from it."""
+
+    def __init__(self, data, hashes):
+        self.hashes = hashes
+        self.website_responses = data['website']
+        self.factual_responses = data['factual']
+        self.dialog_responses = data['dialog']
+        self.dialog_matcher = DialogMatcher(self.dialog_responses.get('dialogs', []))
+        # Factual answers need a closer match (score above 80) than website answers (above 70)
+        self.response_matcher = ResponseMatcher([
+            ('factual', self.factual_responses, 80),
+            ('website', self.website_responses, 70),
+        ])
+
+
+def write_snapshot(knowledge_base, path):
+    """
+    Store the parsed sources of a knowledge base as JSON; written to a
+    temporary file first and renamed into place. Only data is stored, never
+    objects, so reading a snapshot cannot run code.
+    """
+    snapshot = {
+        'version': KNOWLEDGE_BASE_SNAPSHOT_VERSION,
+        'hashes': knowledge_base.hashes,
+        'data': {
+            'website': knowledge_base.website_responses,
+            'factual': knowledge_base.factual_responses,
+            'dialog': knowledge_base.dialog_responses,
+        },
+    }
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'w', encoding='utf-8') as file:
+        # default=str: YAML may hold dates in keys the matchers never read
+        json.dump(snapshot, file, ensure_ascii=False, default=str)
+    os.replace(temporary_path, path)
+
+
+def read_snapshot(path, hashes):
+    """
+    Load a snapshot written by ``write_snapshot`` if it was compiled from files
+    with the given hashes, else return None. The sources are validated again
+    and the matchers rebuilt, which skips only the YAML parsing.
+    """
+    try:
+        with open(path, encoding='utf-8') as file:
+            snapshot = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable knowledge base snapshot {path}: {e}")
+        return None
+
+    if not isinstance(snapshot, dict) or snapshot.get('version') != KNOWLEDGE_BASE_SNAPSHOT_VERSION:
+        return None
+    data = snapshot.get('data')
+    if snapshot.get('hashes') != hashes or not isinstance(data, dict) \
+            or set(data) != set(KNOWLEDGE_BASE_SOURCES):
+        return None
+    if any(validate_source(name, data[name]) for name in KNOWLEDGE_BASE_SOURCES):
+        logger.warning(f"Ignoring invalid knowledge base snapshot {path}")
+        return None
+    return KnowledgeBase(data, hashes)
+
+
+class KnowledgeBaseLoader:
+    """
+    Serves the current KnowledgeBase and reloads it when a source file changes.
+
+    At most every ``check_interval`` seconds ``current()`` compares the files'
+    mtime and size with the loaded version. On a change, one background thread
+    re-reads the files, skips the rebuild if the content hashes are unchanged,
+    and otherwise validates, rebuilds the indexes and swaps the new version in
+    with a single assignment. Requests keep using the previous version until
+    then; an invalid edit is logged and never swapped in.
+    """
+
+    def __init__(self, data_dir, snapshot_path=None, check_interval=2.0, clock=time.monotonic):
+        self.data_dir = data_dir
+        self.snapshot_path = snapshot_path
+        self.check_interval = check_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._knowledge_base = None
+        self._signature = None
+        self._last_check = None
+        self._reloading = False
+
+    def _file_signature(self):
+        signature = []
+        for filename in KNOWLEDGE_BASE_SOURCES.values():
+            try:
+                stat = os.stat(os.path.join(self.data_dir, filename))
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def current(self):
+        knowledge_base = self._knowledge_base
+        if knowledge_base is None:
+            with self._lock:
+                if self._knowledge_base is None:
+                    self._load_initial()
+            return self._knowledge_base
+
+        now = self._clock()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            if self._file_signature() != self._signature:
+                self.reload_in_background()
+        return knowledge_base
+
+    def _load_initial(self):
+        self._signature = self._file_signature()
+        self._last_check = self._clock()
+        if self.snapshot_path:
+            knowledge_base = read_snapshot(self.snapshot_path, source_hashes(self.data_dir))
+            if knowledge_base is not None:
+                self._knowledge_base = knowledge_base
+                return
+
+        data, hashes, errors = read_sources(self.data_dir)
+        for error in errors:
+            logger.error(f"Knowledge base: {error}")
+        self._knowledge_base = KnowledgeBase(data, hashes)
+
+    def reload_in_background(self):
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self.reload, daemon=True).start()
+
+    def reload(self):
+        """Re-read the sources and swap in a new version if they changed and are valid. Returns True on swap."""
+        try:
+            signature = self._file_signature()
+            data, hashes, errors = read_sources(self.data_dir)
+            current = self._knowledge_base
+            if current is not None and hashes == current.hashes:
+                self._signature = signature
+                return False
+            if errors:
+                for error in errors:
+                    logger.error(f"Knowledge base not reloaded: {error}")
+                self._signature = signature
+                return False
+
+            self._knowledge_base = KnowledgeBase(data, hashes)
+            self._signature = signature
+            logger.info("Knowledge base reloaded")
+            return True
+        finally:
+            with self._lock:
+                self._reloading = False
@@ -0,0 +1,145 @@
+from collections import deque
+
+import numpy as np
+from rapidfuzz import fuzz, process, utils
+
+
+def normalize_message(message):
+    return (message or '').strip().lower()
+
+
+class AhoCorasick:
+    """
+    Multi-pattern substring matcher. Finds every pattern occurring in a text in
+    one pass over the text, independent of the number of patterns.
+    """
+
+    def __init__(self, patterns):
+        # Trie as parallel lists: transitions, failure links, pattern ids ending at each node
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for pattern_id, pattern in enumerate(patterns):
+            if not pattern:
+                continue
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                node = next_node
+            self._output[node].append(pattern_id)
+
+        # Breadth-first pass to link every node to its longest proper suffix in the trie
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, next_node in self._goto[node].items():
+                queue.append(next_node)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_node] = self._goto[fail].get(char, 0)
+                self._output[next_node] = self._output[next_node] + self._output[self._fail[next_node]]
+
+    def iter_matches(self, text):
+        """Yield the id of every pattern occurrence in ``text``."""
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            yield from output[node]
+
+    def first_match(self, text):
+        """Lowest pattern id occurring in ``text``, or None."""
+        return min(self.iter_matches(text), default=None)
+
+
+class DialogMatcher:
+    """
+    Compiled form of the ``dialogs`` list from dialog.yaml.
+
+    An exact match on the normalized message wins; otherwise the first dialog
+    (in file order) whose ``user`` text occurs anywhere in the message is used,
+    as the original linear scans did.
+    """
+
+    def __init__(self, dialogs):
+        self.dialogs = [dialog for dialog in dialogs if isinstance(dialog, dict) and 'user' in dialog and 'bot' in dialog]
+        patterns = [normalize_message(str(dialog['user'])) for dialog in self.dialogs]
+
+        self._exact = {}
+        for index, pattern in enumerate(patterns):
+            self._exact.setdefault(pattern, index)
+        # An empty pattern is a substring of every message
+        self._empty_index = self._exact.get('')
+        self._automaton = AhoCorasick(patterns)
+
+    def __len__(self):
+        return len(self.dialogs)
+
+    def match(self, message):
+        """Return the matching dialog entry for a message, or None."""
+        message = normalize_message(message)
+        index = self._exact.get(message)
+        if index is None:
+            index = self._automaton.first_match(message)
+            if self._empty_index is not None and (index is None or self._empty_index < index):
+                index = self._empty_index
+        return self.dialogs[index] if index is not None else None
+
+
+def canonical_tokens(text):
+    """
+    Normalize text the way RapidFuzz's default processor does and reduce it to
+    its sorted set of tokens. token_set_ratio only looks at the token sets, so
+    scoring canonical strings gives the same result with less work per call.
+    """
+    return ' '.join(sorted(set(utils.default_process(str(text)).split())))
+
+
+class ResponseMatcher:
+    """
+    Fuzzy matcher over the keys of several question -> answer sources (the
+    factual and website YAML files). Keys are normalized once at build time and
+    every message is scored against all keys of all sources in one batched
+    RapidFuzz call. Sources are checked in order; the best key of the first
+    source scoring above its threshold wins.
+    """
+
+    def __init__(self, sources):
+        # sources: iterable of (name, {question: answer}, threshold)
+        self._keys = []
+        self._answers = []
+        self._sources = []
+        for name, responses, threshold in sources:
+            start = len(self._keys)
+            for question, answer in (responses or {}).items():
+                self._keys.append(canonical_tokens(question))
+                self._answers.append(answer)
+            self._sources.append((name, start, len(self._keys), threshold))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def match(self, message, sources=None):
+        """Return the answer for a message, or None. ``sources`` limits the search to those source names."""
+        query = canonical_tokens(message)
+        if not query or not self._keys:
+            return None
+
+        scores = process.cdist([query], self._keys, scorer=fuzz.token_set_ratio, processor=None)[0]
+        for name, start, end, threshold in self._sources:
+            if start == end or (sources is not None and name not in sources):
+                continue
+            best = start + int(np.argmax(scores[start:end]))
+            if scores[best] > threshold:
+                return self._answers[best]
+        return None
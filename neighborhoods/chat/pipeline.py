@@ -0,0 +1,71 @@
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+
+logger = logging.getLogger(__name__)
+
+
+def _answer(name, task):
+    # The provider's answer, or None when it failed, timed out or had nothing to say
+    if task.cancelled():
+        return None
+    error = task.exception()
+    if error is not None:
+        if isinstance(error, asyncio.TimeoutError):
+            logger.warning(f"Chat provider '{name}' timed out")
+        else:
+            logger.error(f"Chat provider '{name}' failed: {error}")
+        return None
+    return task.result()
+
+
+async def first_answer(providers, deadline):
+    """
+    Run blocking chat providers concurrently and return ``(name, answer)`` for
+    the highest-priority provider with an answer, or ``(None, None)``.
+
+    ``providers`` is a list of ``(name, callable, timeout)`` in priority order.
+    Each callable runs in its own worker thread and is abandoned after its
+    timeout. A lower-priority answer is used only once every provider above it
+    has finished without one, or when ``deadline`` seconds have passed.
+    """
+    loop = asyncio.get_running_loop()
+    end = loop.time() + deadline
+    tasks = [
+        (name, asyncio.ensure_future(asyncio.wait_for(sync_to_async(func, thread_sensitive=False)(), timeout)))
+        for name, func, timeout in providers
+    ]
+    try:
+        # Providers before ``position`` have finished without an answer
+        position = 0
+        while True:
+            while position < len(tasks) and tasks[position][1].done():
+                answer = _answer(*tasks[position])
+                if answer:
+                    return tasks[position][0], answer
+                position += 1
+            if position == len(tasks):
+                return None, None
+
+            remaining = end - loop.time()
+            if remaining <= 0:
+                break
+            await asyncio.wait([task for _, task in tasks[position:] if not task.done()],
+                               timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+
+        # Deadline reached: settle for the best answer that has arrived
+        logger.warning("Chat deadline reached before all providers finished")
+        for name, task in tasks[position + 1:]:
+            if task.done():
+                answer = _answer(name, task)
+                if answer:
+                    return name, answer
+        return None, None
+    finally:
+        for _, task in tasks:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                # Mark late failures as retrieved so asyncio does not log them again
+                task.exception()
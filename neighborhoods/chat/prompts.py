@@ -0,0 +1,113 @@
+import hashlib
+import re
+import threading
+import time
+
+from .cache import TTLCache
+
+# Only articles are dropped: prepositions, auxiliaries and question words change what is asked
+PROMPT_STOPWORDS = frozenset(('a', 'an', 'the'))
+
+
+def normalize_prompt(message):
+    """Lowercase words without punctuation, repeated whitespace or articles."""
+    words = re.findall(r"[\w']+", (message or '').lower())
+    return ' '.join(word for word in words if word not in PROMPT_STOPWORDS)
+
+
+def prompt_cache_key(user_message, history):
+    """Cache key for a Gemini answer: the normalized question plus a hash of the recent history."""
+    history_hash = hashlib.sha1("\n".join(history).encode('utf-8')).hexdigest()[:16]
+    return f"{normalize_prompt(user_message)}|{history_hash}"
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class PromptCache:
+    """
+    TTL + LRU cache of generated answers with request coalescing: while one
+    caller generates the answer for a key, other callers with the same key wait
+    for it instead of making their own upstream call. Failed generations
+    (``None``) are not cached.
+
+    Each entry remembers how long it took to generate, so ``stats`` can report
+    the upstream latency saved by hits and coalesced waits.
+    """
+
+    def __init__(self, ttl=3600, max_entries=2048, wait_timeout=30, clock=time.monotonic):
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self._clock = clock
+        self._cache = TTLCache(max_entries=max_entries, clock=clock)
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.saved_seconds = 0.0
+
+    def get(self, key):
+        entry = self._cache.get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += entry[1]
+        return entry[0]
+
+    def set(self, key, answer, latency):
+        if answer:
+            self._cache.set(key, (answer, latency), self.ttl)
+
+    def get_or_generate(self, key, generate):
+        answer = self.get(key)
+        if answer is not None:
+            return answer
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            start = self._clock()
+            flight.done.wait(self.wait_timeout)
+            with self._lock:
+                self.coalesced += 1
+                if flight.result is not None:
+                    # Waiting took less than a call of our own would have
+                    self.saved_seconds += max(flight.result[1] - (self._clock() - start), 0.0)
+            return flight.result[0] if flight.result else None
+
+        try:
+            start = self._clock()
+            answer = generate()
+            if answer:
+                flight.result = (answer, self._clock() - start)
+                self.set(key, *flight.result)
+            return answer
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'saved_seconds': round(self.saved_seconds, 3),
+            }
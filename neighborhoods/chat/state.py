@@ -0,0 +1,241 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.memcached import PyMemcacheCache
+from django.core.cache.backends.redis import RedisCache
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Messages kept per session ("User: ..." and "Bot: ..." lines)
+MAX_HISTORY_MESSAGES = 4
+
+
+class Conversation:
+    """Per-session chat record: dialog stage, the last few messages and the user's name."""
+
+    __slots__ = ('state', 'messages', 'name')
+
+    def __init__(self, state=None, messages=(), name=None):
+        self.state = state
+        self.messages = tuple(messages)
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, Conversation) and (self.state, self.messages, self.name) == (
+            other.state, other.messages, other.name)
+
+    def __repr__(self):
+        return f"Conversation(state={self.state!r}, messages={self.messages!r}, name={self.name!r})"
+
+
+class ConversationStore:
+    """
+    Base class for conversation stores. Backends implement ``get``, ``save``,
+    ``delete``, ``clear`` and ``stats``; the helpers below are built on them.
+    """
+
+    def get(self, session_id):
+        raise NotImplementedError
+
+    def save(self, session_id, conversation):
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+    def load(self, session_id):
+        return self.get(session_id) or Conversation()
+
+    def append_exchange(self, session_id, user_message, bot_message, max_messages=MAX_HISTORY_MESSAGES):
+        conversation = self.load(session_id)
+        messages = conversation.messages + (f"User: {user_message}", f"Bot: {bot_message}")
+        conversation.messages = messages[-max_messages:]
+        self.save(session_id, conversation)
+
+    def recent_messages(self, session_id, count=MAX_HISTORY_MESSAGES):
+        conversation = self.get(session_id)
+        return list(conversation.messages[-count:]) if conversation else []
+
+    def set_state(self, session_id, state):
+        conversation = self.load(session_id)
+        conversation.state = state
+        self.save(session_id, conversation)
+
+    def get_name(self, session_id):
+        conversation = self.get(session_id)
+        return conversation.name if conversation else None
+
+    def set_name(self, session_id, name):
+        conversation = self.load(session_id)
+        conversation.name = name
+        self.save(session_id, conversation)
+
+
+class LocMemConversationStore(ConversationStore):
+    """
+    Per-process store. Holds at most ``max_sessions`` conversations, evicting
+    the least recently used, and drops conversations idle for ``idle_ttl`` seconds.
+    """
+
+    def __init__(self, max_sessions=10000, idle_ttl=3600, clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # session id -> (last seen, conversation), least recently used first
+        self._sessions = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _expire(self, now):
+        # Entries are ordered by last use, so idle ones are always at the front
+        while self._sessions:
+            session_id, (last_seen, _) = next(iter(self._sessions.items()))
+            if now - last_seen < self.idle_ttl:
+                break
+            del self._sessions[session_id]
+            self.expirations += 1
+
+    def get(self, session_id):
+        now = self._clock()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions[session_id] = (now, entry[1])
+            self._sessions.move_to_end(session_id)
+            # Callers get a copy so that changes only land through save()
+            conversation = entry[1]
+            return Conversation(conversation.state, conversation.messages, conversation.name)
+
+    def save(self, session_id, conversation):
+        now = self._clock()
+        with self._lock:
+            self._expire(now)
+            self._sessions[session_id] = (now, Conversation(conversation.state, conversation.messages, conversation.name))
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self):
+        with self._lock:
+            self._expire(self._clock())
+            return {'sessions': len(self._sessions), 'evictions': self.evictions, 'expirations': self.expirations}
+
+
+class CacheConversationStore(ConversationStore):
+    """
+    Store backed by a Django cache alias. Conversations are shared by every
+    worker only when that cache is (Redis, Memcached or the database cache);
+    with the default LocMemCache each worker still has its own. Each save
+    renews the idle timeout; the size limit and evictions are left to the
+    cache backend, so ``stats`` cannot report live sessions. It counts this
+    process's reads, writes and deletes instead, and the evictions reported
+    by Redis or Memcached (for the whole server, not only conversations).
+
+    Keys include a generation token kept in the cache, so ``clear`` drops all
+    conversations at once by starting a new generation; the old entries are
+    left to expire.
+    """
+
+    def __init__(self, cache_alias='default', idle_ttl=3600, key_prefix='chat:conversation:'):
+        self.cache_alias = cache_alias
+        self.idle_ttl = idle_ttl
+        self.key_prefix = key_prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.deletes = 0
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def _generation_key(self):
+        return f"{self.key_prefix}generation"
+
+    def _key(self, session_id):
+        generation = self.cache.get(self._generation_key)
+        if generation is None:
+            # A random token, so a generation evicted from the cache is never reused
+            self.cache.add(self._generation_key, uuid.uuid4().hex, None)
+            generation = self.cache.get(self._generation_key)
+        return f"{self.key_prefix}{generation}:{session_id}"
+
+    def get(self, session_id):
+        record = self.cache.get(self._key(session_id))
+        if record is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        # Stored as a plain tuple to keep cache entries small and version independent
+        state, messages, name = record
+        return Conversation(state, messages, name)
+
+    def save(self, session_id, conversation):
+        record = (conversation.state, tuple(conversation.messages), conversation.name)
+        self.cache.set(self._key(session_id), record, self.idle_ttl)
+        self._count('writes')
+
+    def delete(self, session_id):
+        self.cache.delete(self._key(session_id))
+        self._count('deletes')
+
+    def clear(self):
+        self.cache.set(self._generation_key, uuid.uuid4().hex, None)
+
+    def _backend_evictions(self):
+        # Only Redis and Memcached report evictions; None for every other backend
+        cache = self.cache
+        try:
+            if isinstance(cache, RedisCache):
+                return cache._cache.get_client(write=False).info('stats')['evicted_keys']
+            if isinstance(cache, PyMemcacheCache):
+                return sum(int(server_stats[b'evictions']) for _, server_stats in cache._cache.get_stats())
+        except Exception as e:
+            logger.warning(f"Could not read evictions from the {self.cache_alias} cache: {e}")
+        return None
+
+    def stats(self):
+        with self._lock:
+            counters = {'hits': self.hits, 'misses': self.misses, 'writes': self.writes, 'deletes': self.deletes}
+        return {'sessions': None, 'evictions': self._backend_evictions(), 'expirations': None, **counters}
+
+
+def build_conversation_store():
+    config = settings.CHAT_CONVERSATION_STORE
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
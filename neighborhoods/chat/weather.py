@@ -0,0 +1,181 @@
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from ..metrics import chat_cache_events, chat_upstream_requests
+from .breaker import ProviderTimeout, ProviderUnavailable, provider_guard
+
+WEATHER_ERROR_MESSAGE = "Sorry, I couldn't fetch the weather data right now."
+WEATHER_PROBLEM_MESSAGE = "Sorry, there was a problem retrieving the weather data."
+
+
+class _Flight:
+    """One in-progress fetch that concurrent callers wait on instead of starting their own."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = (WEATHER_PROBLEM_MESSAGE, False)
+
+
+class WeatherProvider:
+    """
+    Current weather for one city from weatherapi.com.
+
+    Reports younger than ``ttl`` seconds are served from memory. Older reports,
+    up to ``stale_ttl``, are still served while a background refresh fetches a
+    new one. At most one fetch runs at a time; concurrent callers share it.
+    Requests go through a pooled session with strict connect/read timeouts.
+    With a ``guard`` (see breaker.ProviderGuard) each request is also bounded
+    as a whole, and while the API keeps failing no request is made and
+    ``current`` returns None unless a stale report is still available.
+    """
+
+    def __init__(self, api_key=None, url='https://api.weatherapi.com/v1/current.json', city='Berlin',
+                 ttl=300, stale_ttl=1800, timeout=(2, 3), session=None, clock=time.monotonic, guard=None):
+        self.api_key = api_key
+        self.url = url
+        self.city = city
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timeout = timeout
+        self._session = session
+        self.guard = guard
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (report, fetched_at) of the last successful fetch
+        self._report = None
+        self._flight = None
+
+    @property
+    def session(self):
+        # Built on first use, so that requests is only imported once weather is asked for
+        if self._session is None:
+            self._session = self._build_session()
+        return self._session
+
+    @staticmethod
+    def _build_session():
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        # No retries: a slow or failing API should fall through to the next chat provider quickly
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=10, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def current(self):
+        report = self._report
+        if report is not None:
+            age = self._clock() - report[1]
+            if age < self.ttl:
+                chat_cache_events.inc(cache='weather', result='hit')
+                return report[0]
+            if age < self.stale_ttl:
+                chat_cache_events.inc(cache='weather', result='stale')
+                self.refresh_in_background()
+                return report[0]
+
+        chat_cache_events.inc(cache='weather', result='miss')
+        flight, leader = self._begin()
+        if leader:
+            self._run(flight)
+        else:
+            flight.done.wait(sum(self.timeout))
+        return flight.result[0]
+
+    def refresh_in_background(self):
+        flight, leader = self._begin()
+        if leader:
+            threading.Thread(target=self._run, args=(flight,), daemon=True).start()
+
+    def join(self, timeout=None):
+        """Wait for a running fetch, if any, to finish."""
+        flight = self._flight
+        if flight is not None:
+            flight.done.wait(timeout)
+
+    def _begin(self):
+        with self._lock:
+            if self._flight is not None:
+                return self._flight, False
+            self._flight = _Flight()
+            return self._flight, True
+
+    def _run(self, flight):
+        try:
+            flight.result = self._fetch()
+            if flight.result[1]:
+                self._report = (flight.result[0], self._clock())
+        finally:
+            with self._lock:
+                self._flight = None
+            flight.done.set()
+
+    def _fetch(self):
+        # Returns (message, success); only successful reports are cached
+        message, ok, status = self._request()
+        chat_upstream_requests.inc(provider='weather', status=status)
+        return message, ok
+
+    def _request(self):
+        import requests
+
+        api_key = self.api_key or os.getenv('WEATHER_API_KEY')
+        if not api_key:
+            logging.error("Weather API key is missing in the .env_docker file.")
+            return "Weather API key is not configured.", False, 'unconfigured'
+
+        try:
+            params = {'key': api_key, 'q': self.city}
+            if self.guard is None:
+                response = self.session.get(self.url, params=params, timeout=self.timeout)
+            else:
+                # Server errors and rate limiting count towards opening the circuit
+                response = self.guard.call(self.session.get, self.url, params=params, timeout=self.timeout,
+                                           failed=lambda response: response.status_code >= 500 or response.status_code == 429)
+
+            # Log the response for debugging
+            logging.debug(f"Weather API Response: {response.status_code} {response.text}")
+
+            if response.status_code != 200:
+                logging.error(f"Weather API returned an error: {response.status_code} {response.text}")
+                return WEATHER_ERROR_MESSAGE, False, 'http_error'
+
+            data = response.json()
+            if 'current' not in data:
+                logging.error("Weather data is missing the 'current' key in the response.")
+                return WEATHER_ERROR_MESSAGE, False, 'error'
+
+            current = data['current']
+            return (
+                f"The current temperature in {self.city} is {current['temp_c']}°C with {current['condition']['text']}. "
+                f"Humidity is {current['humidity']}% and wind speed is {current['wind_kph']} km/h."
+            ), True, 'ok'
+
+        except ProviderUnavailable as e:
+            logging.warning(f"Skipping weather: {e}")
+            return None, False, 'timeout' if isinstance(e, ProviderTimeout) else 'unavailable'
+        except requests.exceptions.Timeout as e:
+            logging.error(f"RequestException occurred: {e}")
+            return WEATHER_PROBLEM_MESSAGE, False, 'timeout'
+        except requests.exceptions.RequestException as e:
+            logging.error(f"RequestException occurred: {e}")
+            return WEATHER_PROBLEM_MESSAGE, False, 'error'
+        except Exception as e:
+            logging.error(f"Unexpected error in get_weather_in_berlin: {e}")
+            return WEATHER_PROBLEM_MESSAGE, False, 'error'
+
+
+def build_weather_provider():
+    return WeatherProvider(
+        url=settings.WEATHER_API_URL,
+        ttl=settings.WEATHER_CACHE_TTL,
+        stale_ttl=settings.WEATHER_STALE_TTL,
+        timeout=(settings.WEATHER_CONNECT_TIMEOUT, settings.WEATHER_READ_TIMEOUT),
+        guard=provider_guard('weather', settings.CHAT_STAGE_TIMEOUTS['weather']),
+    )
@@ -0,0 +1,116 @@
+import atexit
+import logging
+import re
+
+from django.conf import settings
+
+from ..metrics import chat_cache_events, chat_upstream_requests
+from .breaker import ProviderTimeout, ProviderUnavailable, provider_guard
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def preprocess_query(query):
+    # Remove common prefixes
+    prefixes = ["what do you know about", "tell me about", "do you know about"]
+    for prefix in prefixes:
+        if query.startswith(prefix):
+            query = query[len(prefix):].strip()
+    return query
+
+
+def normalize_query(query):
+    return re.sub(r'\s+', ' ', preprocess_query((query or '').strip().lower())).strip()
+
+
+class WikipediaProvider:
+    """
+    Wikipedia summaries behind a TTL + LRU cache keyed by the normalized query.
+    Found pages are kept for ``ttl`` seconds; page misses and disambiguations
+    for the shorter ``negative_ttl``. Unexpected errors are never cached.
+
+    With a ``guard`` (see breaker.ProviderGuard) lookups are bounded by its
+    timeout, and while Wikipedia keeps failing ``summary`` returns None at
+    once so that chat moves on to its fallback.
+    """
+
+    def __init__(self, client=None, cache=None, ttl=86400, negative_ttl=600, sentences=2, guard=None):
+        self._client = client
+        self.guard = guard
+        self.cache = cache if cache is not None else TTLCache()
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.sentences = sentences
+
+    @property
+    def client(self):
+        # Imported on first use; the wikipedia package pulls in BeautifulSoup
+        if self._client is None:
+            import wikipedia
+            self._client = wikipedia
+        return self._client
+
+    def _lookup(self, query):
+        # Disambiguations and missing pages are answers, not upstream failures
+        try:
+            return 'ok', self.client.summary(query, sentences=self.sentences)
+        except self.client.exceptions.DisambiguationError as e:
+            return 'disambiguation', e.options
+        except self.client.exceptions.PageError:
+            return 'not_found', None
+
+    def summary(self, query):
+        query = normalize_query(query)
+        cached = self.cache.get(query)
+        if cached is not None:
+            chat_cache_events.inc(cache='wikipedia', result='hit')
+            return cached
+        chat_cache_events.inc(cache='wikipedia', result='miss')
+
+        try:
+            if self.guard is None:
+                status, result = self._lookup(query)
+            else:
+                status, result = self.guard.call(self._lookup, query)
+        except ProviderUnavailable as e:
+            logging.warning(f"Skipping Wikipedia: {e}")
+            status = 'timeout' if isinstance(e, ProviderTimeout) else 'unavailable'
+            chat_upstream_requests.inc(provider='wikipedia', status=status)
+            return None
+        except Exception as e:
+            logging.error(f"Unexpected error in get_wikipedia_summary: {e}")
+            chat_upstream_requests.inc(provider='wikipedia', status='error')
+            return "Sorry, there was a problem retrieving the information."
+
+        if status == 'ok':
+            summary_text = result
+            ttl = self.ttl
+        elif status == 'disambiguation':
+            # Provide options if there are multiple results
+            logging.warning(f"Disambiguation error for '{query}': {result}")
+            summary_text = f"Multiple results found for '{query}': {', '.join(result[:3])}. Please specify further."
+            ttl = self.negative_ttl
+        else:
+            # Handle missing pages
+            summary_text = f"Sorry, I couldn't find any relevant information about '{query}'."
+            ttl = self.negative_ttl
+
+        chat_upstream_requests.inc(provider='wikipedia', status=status)
+        self.cache.set(query, summary_text, ttl)
+        return summary_text
+
+
+def build_wikipedia_provider():
+    cache = TTLCache(
+        max_entries=settings.WIKIPEDIA_CACHE_MAX_ENTRIES,
+        path=settings.WIKIPEDIA_CACHE_PATH,
+    )
+    if cache.path:
+        atexit.register(cache.save)
+    return WikipediaProvider(
+        cache=cache,
+        ttl=settings.WIKIPEDIA_CACHE_TTL,
+        negative_ttl=settings.WIKIPEDIA_CACHE_NEGATIVE_TTL,
+        guard=provider_guard('wikipedia', settings.CHAT_STAGE_TIMEOUTS['wikipedia']),
+    )
@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+
+from django.conf import settings
+
+from .geometry import simplify_geometries
+
+NEIGHBORHOODS_GEOJSON_PATH = os.path.join(settings.BASE_DIR, 'static', 'geojson', 'berlin_neighborhoods.geojson')
+
+
+def normalize_name(name):
+    return (name or '').strip().lower()
+
+
+class _Snapshot:
+    """One parsed version of the GeoJSON file. Never mutated after it is built,
+    except for the simplified levels and byte caches, which only ever grow."""
+
+    def __init__(self, signature, features, positions):
+        self.signature = signature
+        # Named features in file order
+        self.features = features
+        # normalized name -> positions in self.features; a name can have several
+        # features (Buckow is split over two polygons)
+        self.positions = positions
+        # tolerance -> simplified features, in the same order as self.features
+        self.levels = {0.0: features}
+        # (borough slug, tolerance) -> (normalized names, serialized FeatureCollection)
+        self.collections = {}
+
+
+class GeoJSONIndex:
+    """
+    Per-process index over a GeoJSON FeatureCollection keyed by normalized
+    feature name. The file is parsed once and re-parsed only when its mtime or
+    size changes; per-borough FeatureCollections are kept as serialized bytes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def _signature(self):
+        # Raises FileNotFoundError when the file is missing
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _parse(self, signature):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        features = []
+        positions = {}
+        for feature in data.get('features', []):
+            name = normalize_name((feature.get('properties') or {}).get('name'))
+            if name:
+                positions.setdefault(name, []).append(len(features))
+                features.append(feature)
+        return _Snapshot(signature, features, positions)
+
+    def snapshot(self):
+        signature = self._signature()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.signature == signature:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.signature != signature:
+                snapshot = self._parse(signature)
+                self._snapshot = snapshot
+        return snapshot
+
+    def _level(self, snapshot, tolerance):
+        level = snapshot.levels.get(tolerance)
+        if level is not None:
+            return level
+
+        with self._lock:
+            level = snapshot.levels.get(tolerance)
+            if level is None:
+                geometries = simplify_geometries([feature['geometry'] for feature in snapshot.features], tolerance)
+                level = [
+                    {**feature, 'geometry': geometry}
+                    for feature, geometry in zip(snapshot.features, geometries)
+                ]
+                snapshot.levels[tolerance] = level
+        return level
+
+    @property
+    def version(self):
+        return self.snapshot().signature
+
+    def features(self, tolerance=0.0):
+        """All features in file order, simplified with the given tolerance."""
+        return list(self._level(self.snapshot(), tolerance))
+
+    def get_features(self, name):
+        """All features with this name, in file order."""
+        snapshot = self.snapshot()
+        return [snapshot.features[position] for position in snapshot.positions.get(normalize_name(name), ())]
+
+    def feature_collection(self, borough_slug, neighborhood_names, tolerance=0.0):
+        """
+        Return the serialized FeatureCollection for the given neighborhoods of a
+        borough, or None when none of them has a geometry in the file.
+        ``tolerance`` must be one of ``geometry.LOD_TOLERANCES``.
+        """
+        snapshot = self.snapshot()
+        names = tuple(sorted({normalize_name(name) for name in neighborhood_names}))
+
+        key = (borough_slug, tolerance)
+        cached = snapshot.collections.get(key)
+        if cached is not None and cached[0] == names:
+            return cached[1]
+
+        positions = sorted(position for name in names for position in snapshot.positions.get(name, ()))
+        if not positions:
+            return None
+
+        level = self._level(snapshot, tolerance)
+        payload = json.dumps({
+            "type": "FeatureCollection",
+            "features": [level[position] for position in positions],
+        }, separators=(',', ':')).encode('utf-8')
+        snapshot.collections[key] = (names, payload)
+        return payload
+
+
+neighborhood_geojson = GeoJSONIndex(NEIGHBORHOODS_GEOJSON_PATH)
@@ -0,0 +1,115 @@
+import logging
+
+import numpy as np
+import shapely
+from shapely.geometry import mapping, shape
+
+logger = logging.getLogger(__name__)
+
+# Level-of-detail table: (minimum Leaflet zoom, simplification tolerance in degrees).
+# A tolerance of 0 means the geometry is served at full resolution.
+LOD_LEVELS = (
+    (15, 0.0),
+    (13, 0.0001),
+    (12, 0.0005),
+    (11, 0.001),
+    (10, 0.002),
+    (0, 0.004),
+)
+LOD_TOLERANCES = tuple(sorted(tolerance for _, tolerance in LOD_LEVELS))
+
+# Simplified coordinates are rounded to ~0.1 m, well below what any level can show
+COORDINATE_DIGITS = 6
+
+
+def tolerance_for_zoom(zoom):
+    for min_zoom, tolerance in LOD_LEVELS:
+        if zoom >= min_zoom:
+            return tolerance
+    return LOD_LEVELS[-1][1]
+
+
+def snap_tolerance(tolerance):
+    # Only the precomputed levels are served; pick the largest one not above the request
+    return max(level for level in LOD_TOLERANCES if level <= max(tolerance, 0.0))
+
+
+def resolve_tolerance(params):
+    """
+    Map the ``tolerance`` or ``zoom`` query parameter onto one of the
+    precomputed levels. ``tolerance`` wins when both are given; invalid or
+    missing values fall back to full resolution.
+    """
+    tolerance = params.get('tolerance')
+    if tolerance not in (None, ''):
+        try:
+            return snap_tolerance(float(tolerance))
+        except ValueError:
+            logger.warning(f"Invalid value for tolerance: {tolerance}")
+
+    zoom = params.get('zoom')
+    if zoom not in (None, ''):
+        try:
+            return tolerance_for_zoom(float(zoom))
+        except ValueError:
+            logger.warning(f"Invalid value for zoom: {zoom}")
+
+    return 0.0
+
+
+def _round(coords):
+    return np.round(coords, COORDINATE_DIGITS)
+
+
+def simplify_geometries(geometries, tolerance):
+    """
+    Simplify a list of GeoJSON geometry dicts with one tolerance.
+
+    The polygons are treated as one coverage so that borders shared by two
+    neighbors stay shared (no gaps or overlaps appear between them). Inputs
+    that shapely cannot parse are returned unchanged.
+    """
+    if not tolerance:
+        return list(geometries)
+
+    parsed = []
+    for geometry in geometries:
+        try:
+            geom = shape(geometry)
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError, shapely.errors.ShapelyError):
+            geom = None
+        parsed.append(geom if geom is not None and not geom.is_empty and geom.is_valid else None)
+
+    indexes = [i for i, geom in enumerate(parsed) if geom is not None]
+    if not indexes:
+        return list(geometries)
+
+    valid = np.array([parsed[i] for i in indexes], dtype=object)
+    try:
+        simplified = shapely.coverage_simplify(valid, tolerance)
+    except (AttributeError, shapely.errors.ShapelyError):
+        # GEOS older than 3.12, or polygons that do not form a valid coverage
+        simplified = shapely.simplify(valid, tolerance, preserve_topology=True)
+    simplified = shapely.transform(simplified, _round)
+
+    result = list(geometries)
+    for i, geom in zip(indexes, simplified):
+        result[i] = mapping(geom)
+    return result
+
+
+def representative_points(geometries, method='auto'):
+    """
+    One (longitude, latitude) row per shapely geometry. ``centroid`` is the
+    center of mass, ``representative`` a point guaranteed to lie inside the
+    geometry, and ``auto`` the centroid unless it falls outside, as it does
+    for crescent-shaped or multi-part areas.
+    """
+    geometries = shapely.make_valid(np.asarray(geometries, dtype=object))
+    points = shapely.centroid(geometries)
+    if method == 'representative':
+        points = shapely.point_on_surface(geometries)
+    elif method == 'auto':
+        outside = ~shapely.contains(geometries, points)
+        points[outside] = shapely.point_on_surface(geometries[outside])
+    return _round(shapely.get_coordinates(points))
@@ -0,0 +1,285 @@
+import re
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from .models import Borough, CrimeData, Demographics, Neighborhood, RentData
+from .signals import invalidate_data_caches
+from .stats import DEMOGRAPHICS_FIELDS, RENT_FIELDS, rebuild_borough_stats, refresh_neighborhood_summaries
+
+CRIME_FIELDS = tuple(
+    field.name for field in CrimeData._meta.concrete_fields
+    if not field.primary_key and not field.is_relation
+)
+EXCEL_EXTENSIONS = ('.xls', '.xlsx', '.xlsm', '.ods')
+# Cells the statistical office exports use for missing or withheld figures
+PLACEHOLDERS = ('-', '–', '—', '.', '/', 'x', 'n/a', 'k.A.', 'k. A.')
+
+# Column headers of the Berlin statistical office exports, after normalize_column()
+COLUMN_ALIASES = {
+    'bezirk': 'borough', 'bezirksname': 'borough', 'bezeichnung_bezirk': 'borough',
+    'ortsteil': 'neighborhood', 'ortsteilname': 'neighborhood', 'bezeichnung_ortsteil': 'neighborhood',
+    'einwohner': 'total', 'einwohner_insgesamt': 'total', 'insgesamt': 'total',
+    'deutsche': 'germans', 'auslander': 'foreigners', 'auslaender': 'foreigners',
+    'unter_6': 'under_6', '6_bis_unter_15': 'six_to_15', '15_bis_unter_18': 'fifteen_to_18',
+    '18_bis_unter_27': 'eighteen_to_27', '27_bis_unter_45': 'twenty_seven_to_45',
+    '45_bis_unter_55': 'forty_five_to_55', '55_und_alter': 'fifty_five_and_more',
+    'straftaten_insgesamt': 'total_crimes', 'raub': 'robbery',
+    'korperverletzungen_insgesamt': 'total_assaults', 'diebstahl_insgesamt': 'total_thefts',
+    'wohnraumeinbruch': 'total_residential_burglary', 'brandstiftung': 'total_arson_incidents',
+    'sachbeschadigung_insgesamt': 'total_vandalism',
+}
+
+
+class Source:
+    """How one kind of statistics file maps onto a model: the row key and the figures."""
+
+    def __init__(self, model, key, fields, integer):
+        self.model = model
+        # 'neighborhood' or 'borough': one row per key
+        self.key = key
+        self.fields = fields
+        self.integer = integer
+
+
+SOURCES = {
+    'rent': Source(RentData, 'neighborhood', RENT_FIELDS, integer=False),
+    'crime': Source(CrimeData, 'borough', CRIME_FIELDS, integer=True),
+    'demographics': Source(Demographics, 'neighborhood', DEMOGRAPHICS_FIELDS, integer=True),
+}
+
+
+class ImportResult:
+    def __init__(self, fields):
+        self.fields = fields
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        # (row number in the file, reason)
+        self.rejected = []
+        # Names of the created rows, and (name, field, old value, new value) for updated ones
+        self.added = []
+        self.changes = []
+        self.touched_ids = set()
+
+
+def normalize_column(column):
+    """'Ausländer ' -> 'auslander', '6 bis unter 15' -> '6_bis_unter_15'; aliases map onto model fields."""
+    name = normalize_names(pd.Series([str(column)])).iloc[0]
+    name = re.sub(r'[^a-z0-9]+', '_', name).strip('_')
+    return COLUMN_ALIASES.get(name, name)
+
+
+def normalize_names(names):
+    """Vectorized chat.facts.fold(): lowercase, ß -> ss, accents and repeated spaces or dashes removed."""
+    return (
+        names.astype(str).str.strip().str.lower().str.replace('ß', 'ss', regex=False)
+        .str.normalize('NFKD').str.replace(r'[\u0300-\u036f]', '', regex=True)
+        .str.replace(r'[\s\-]+', ' ', regex=True)
+    )
+
+
+def read_chunks(path, chunk_size, sheet=None, **csv_options):
+    """
+    DataFrames of at most ``chunk_size`` rows. CSV files are streamed; Excel
+    files are read whole. Placeholder cells are read as missing values.
+    """
+    if path.lower().endswith(EXCEL_EXTENSIONS):
+        frame = pd.read_excel(path, sheet_name=sheet or 0, na_values=list(PLACEHOLDERS))
+        for start in range(0, len(frame), chunk_size):
+            yield frame.iloc[start:start + chunk_size]
+    else:
+        csv_options.setdefault('na_values', list(PLACEHOLDERS))
+        yield from pd.read_csv(path, chunksize=chunk_size, **csv_options)
+
+
+def to_numbers(column, decimal='.', thousands=None):
+    """
+    pd.to_numeric() for a column that may hold text: '1.500,5' -> 1500.5 with
+    a ',' decimal mark and '.' thousands separator. Text that is still not a
+    number becomes NaN.
+    """
+    is_text = column.map(lambda value: isinstance(value, str))
+    if is_text.any():
+        text = column[is_text].str.strip()
+        if thousands:
+            text = text.str.replace(thousands, '', regex=False)
+        if decimal != '.':
+            text = text.str.replace(decimal, '.', regex=False)
+        column = column.astype(object).mask(is_text, text)
+    return pd.to_numeric(column, errors='coerce')
+
+
+class NameMap:
+    """Normalized borough and neighborhood names -> ids, built with two queries."""
+
+    def __init__(self):
+        boroughs = pd.DataFrame(list(Borough.objects.values('id', 'name')), columns=['id', 'name'])
+        neighborhoods = pd.DataFrame(
+            list(Neighborhood.objects.values('id', 'name', 'borough_id')), columns=['id', 'name', 'borough_id'])
+        self.borough_ids = pd.Series(boroughs['id'].to_numpy(), index=normalize_names(boroughs['name']))
+        self.borough_names = pd.Series(boroughs['name'].to_numpy(), index=boroughs['id'])
+
+        neighborhoods['key'] = normalize_names(neighborhoods['name'])
+        self.neighborhood_ids = pd.Series(
+            neighborhoods['id'].to_numpy(),
+            index=neighborhoods['borough_id'].astype(str) + '|' + neighborhoods['key'],
+        )
+        # Names shared by neighborhoods of different boroughs only resolve together with their borough
+        unique = neighborhoods.drop_duplicates('key', keep=False)
+        self.unique_neighborhood_ids = pd.Series(unique['id'].to_numpy(), index=unique['key'])
+        self.neighborhood_boroughs = pd.Series(neighborhoods['borough_id'].to_numpy(), index=neighborhoods['id'])
+        self.neighborhood_names = pd.Series(neighborhoods['name'].to_numpy(), index=neighborhoods['id'])
+
+    def boroughs(self, names):
+        return normalize_names(names).map(self.borough_ids)
+
+    def neighborhoods(self, names, borough_ids=None):
+        keys = normalize_names(names)
+        ids = keys.map(self.unique_neighborhood_ids)
+        if borough_ids is not None:
+            qualified = (borough_ids.astype('Int64').astype(str) + '|' + keys).map(self.neighborhood_ids)
+            ids = qualified.fillna(ids)
+        return ids
+
+    def name(self, key, key_id):
+        return (self.borough_names if key == 'borough' else self.neighborhood_names).get(key_id, key_id)
+
+
+def _existing_rows(source):
+    """Current figures keyed by neighborhood or borough id; the oldest row wins, as on the detail page."""
+    key = f'{source.key}_id'
+    columns = ['id', key, 'borough_id', *source.fields]
+    rows = pd.DataFrame(list(source.model.objects.order_by('id').values(*dict.fromkeys(columns))),
+                        columns=list(dict.fromkeys(columns)))
+    return rows.drop_duplicates(key, keep='first').set_index(key)
+
+
+def _validate(frame, source, fields, names, decimal, thousands):
+    """Return (figures, key ids, reasons) for a chunk; a non-empty reason rejects the row."""
+    reasons = pd.Series('', index=frame.index)
+
+    def reject(mask, reason):
+        reasons[mask & (reasons == '')] = reason
+
+    # Columns left as text (unparsed number formats in Excel files, unknown placeholders) are parsed here
+    figures = frame[fields].apply(to_numbers, decimal=decimal, thousands=thousands)
+    reject(figures.isna().any(axis=1), 'missing or non-numeric value')
+    reject((figures < 0).any(axis=1), 'negative value')
+    if source.integer:
+        reject((figures % 1 != 0).any(axis=1), 'count is not a whole number')
+    for low, middle, high in (('min_price', 'avg_price', 'max_price'), ('min_size', 'avg_size', 'max_size')):
+        if {low, middle, high} <= set(fields):
+            reject((figures[low] > figures[middle]) | (figures[middle] > figures[high]), f'{middle} outside {low}..{high}')
+
+    borough_ids = names.boroughs(frame['borough']) if 'borough' in frame else None
+    if source.key == 'borough':
+        key_ids = borough_ids
+        reject(key_ids.isna(), 'unknown borough')
+    else:
+        if borough_ids is not None:
+            reject(frame['borough'].notna() & borough_ids.isna(), 'unknown borough')
+        key_ids = names.neighborhoods(frame['neighborhood'], borough_ids)
+        reject(key_ids.isna(), 'unknown or ambiguous neighborhood')
+    return figures, key_ids, reasons
+
+
+def import_statistics(source_name, chunks, dry_run=False, decimal='.', thousands=None):
+    """
+    Import rent, crime or demographics figures from DataFrame ``chunks``.
+
+    Names are resolved through one precomputed name -> id map; each chunk is
+    validated with vectorized checks and diffed against the current rows,
+    which are updated or created with one bulk query each. Rows that fail
+    validation are rejected, not imported. Columns missing from the file keep
+    their current values. Figures given as text are parsed with the
+    ``decimal`` mark and ``thousands`` separator. Everything runs in one
+    transaction; with ``dry_run`` nothing is written and the result only
+    reports what would change.
+    """
+    source = SOURCES[source_name]
+    model = source.model
+    key = f'{source.key}_id'
+    names = NameMap()
+    existing = _existing_rows(source)
+    result = None
+
+    with transaction.atomic():
+        for chunk in chunks:
+            frame = chunk.rename(columns=normalize_column)
+            frame = frame.loc[:, ~frame.columns.duplicated()]
+            if result is None:
+                if source.key not in frame:
+                    raise ValueError(f"The file has no '{source.key}' column")
+                fields = [field for field in source.fields if field in frame]
+                if not fields:
+                    raise ValueError(f"The file has none of the {source_name} columns: {', '.join(source.fields)}")
+                result = ImportResult(fields)
+
+            figures, key_ids, reasons = _validate(frame, source, fields, names, decimal, thousands)
+            # A file row is a header line away from its DataFrame index
+            result.rejected.extend((index + 2, reason) for index, reason in reasons[reasons != ''].items())
+
+            valid = figures[reasons == ''].assign(**{key: key_ids[reasons == ''].astype('int64')})
+            valid = valid.drop_duplicates(key, keep='last').set_index(key)
+            if valid.empty:
+                continue
+            if source.integer:
+                valid = valid.astype('int64')
+            old = existing.reindex(valid.index)
+            is_new = old['id'].isna().to_numpy()
+
+            missing = [field for field in source.fields if field not in fields]
+            if missing and is_new.any():
+                for key_id in valid.index[is_new]:
+                    result.rejected.append((None, f"{names.name(source.key, key_id)}: no row to update "
+                                                  f"and the file lacks {', '.join(missing)}"))
+                valid, old, is_new = valid[~is_new], old[~is_new], is_new[~is_new]
+
+            differs = ~np.isclose(old[fields].to_numpy(dtype=float), valid[fields].to_numpy(dtype=float),
+                                  rtol=0, atol=1e-9)
+            changed = differs.any(axis=1) & ~is_new
+            result.created += int(is_new.sum())
+            result.updated += int(changed.sum())
+            result.unchanged += int((~changed & ~is_new).sum())
+
+            cast = int if source.integer else float
+            result.added.extend(names.name(source.key, key_id) for key_id in valid.index[is_new])
+            for position, column in zip(*np.nonzero(differs & changed[:, None])):
+                field = fields[column]
+                result.changes.append((names.name(source.key, valid.index[position]), field,
+                                       cast(old[field].iloc[position]), cast(valid[field].iloc[position])))
+
+            written = valid[changed | is_new].copy()
+            if source.key == 'neighborhood':
+                written['borough_id'] = names.neighborhood_boroughs.reindex(written.index).to_numpy()
+            written['id'] = old['id'][changed | is_new]
+            if dry_run:
+                # Placeholder so that later chunks treat the row as existing
+                written['id'] = written['id'].fillna(0)
+            elif not written.empty:
+                rows = written.reset_index().to_dict('records')
+                updates = [model(**{**row, 'id': int(row['id'])}) for row in rows if not pd.isna(row['id'])]
+                creates = [model(**{**row, 'id': None}) for row in rows if pd.isna(row['id'])]
+                model.objects.bulk_update(updates, fields, batch_size=1000)
+                if creates:
+                    model.objects.bulk_create(creates, batch_size=1000)
+                    written.loc[written['id'].isna(), 'id'] = [obj.pk for obj in creates]
+            # Later chunks diff against the figures written here
+            existing = written.combine_first(existing)
+            if source.key == 'neighborhood':
+                result.touched_ids.update(written.index.tolist())
+
+        if result is None:
+            raise ValueError('The file has no rows')
+        if dry_run:
+            return result
+
+        if source.key == 'borough':
+            transaction.on_commit(rebuild_borough_stats)
+        elif result.touched_ids:
+            touched_ids = sorted(result.touched_ids)
+            transaction.on_commit(lambda: refresh_neighborhood_summaries(touched_ids))
+        transaction.on_commit(invalidate_data_caches)
+    return result
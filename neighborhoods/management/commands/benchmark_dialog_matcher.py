@@ -0,0 +1,68 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from neighborhoods.chat.matching import DialogMatcher
+
+WORDS = (
+    'berlin rent borough kreuzberg mitte pankow weather park school crime cheap flat room tram '
+    'station museum river night club family quiet green price average cost help search filter '
+    'map history food market lake forest bike train airport student job visa office'
+).split()
+
+
+def linear_match(dialogs, message):
+    # The matching loops get_dialog_response used before dialogs were compiled
+    message = message.strip().lower()
+    for dialog in dialogs:
+        if message == dialog['user'].strip().lower():
+            return dialog
+    for dialog in dialogs:
+        if dialog['user'].strip().lower() in message:
+            return dialog
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Compare the compiled dialog matcher with the linear scans it replaced'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, nargs='+', default=[100, 1000, 10000],
+                            help='Dialog list sizes to benchmark')
+        parser.add_argument('--messages', type=int, default=500, help='Messages matched per size')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        messages = [' '.join(rng.choices(WORDS, k=rng.randint(3, 12))) for _ in range(options['messages'])]
+
+        self.stdout.write(f"{'entries':>8} {'compile ms':>11} {'linear us/msg':>14} {'compiled us/msg':>16} {'speedup':>8}")
+        for size in options['entries']:
+            dialogs = [
+                {'user': ' '.join(rng.choices(WORDS, k=rng.randint(3, 4))) + f' #{i}', 'bot': f'answer {i}'}
+                for i in range(size)
+            ]
+            # A few reachable patterns so that both paths do real work
+            dialogs[size // 2] = {'user': 'berlin rent', 'bot': 'rent'}
+            dialogs[-1] = {'user': 'weather', 'bot': 'weather'}
+
+            start = time.perf_counter()
+            matcher = DialogMatcher(dialogs)
+            compile_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            expected = [linear_match(dialogs, message) for message in messages]
+            linear_us = (time.perf_counter() - start) * 1e6 / len(messages)
+
+            start = time.perf_counter()
+            actual = [matcher.match(message) for message in messages]
+            compiled_us = (time.perf_counter() - start) * 1e6 / len(messages)
+
+            if actual != expected:
+                self.stderr.write(self.style.ERROR(f'Compiled matcher disagrees with the linear scan at {size} entries'))
+            self.stdout.write(
+                f"{size:>8} {compile_ms:>11.1f} {linear_us:>14.1f} {compiled_us:>16.1f} {linear_us / compiled_us:>7.1f}x"
+            )
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completed'))
@@ -0,0 +1,46 @@
+import gzip
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from neighborhoods.geojson_index import GeoJSONIndex, NEIGHBORHOODS_GEOJSON_PATH
+from neighborhoods.geometry import LOD_LEVELS
+
+
+class Command(BaseCommand):
+    help = 'Report payload size and simplification/serialization time for each GeoJSON level of detail'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=NEIGHBORHOODS_GEOJSON_PATH, help='GeoJSON file to benchmark')
+        parser.add_argument('--repeat', type=int, default=20, help='Serialization runs averaged per level')
+
+    def handle(self, *args, **options):
+        # A fresh index so the simplification timings are cold
+        index = GeoJSONIndex(options['path'])
+        repeat = max(options['repeat'], 1)
+        full_size = None
+
+        self.stdout.write(
+            f"{'zoom':>5} {'tolerance':>10} {'bytes':>10} {'gzip':>9} {'ratio':>7} {'simplify ms':>12} {'serialize ms':>13}"
+        )
+        for min_zoom, tolerance in sorted(LOD_LEVELS, key=lambda level: level[1]):
+            start = time.perf_counter()
+            features = index.features(tolerance)
+            simplify_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                payload = json.dumps(
+                    {"type": "FeatureCollection", "features": features}, separators=(',', ':')
+                ).encode('utf-8')
+            serialize_ms = (time.perf_counter() - start) * 1000 / repeat
+
+            if full_size is None:
+                full_size = len(payload)
+            self.stdout.write(
+                f"{min_zoom:>5} {tolerance:>10} {len(payload):>10} {len(gzip.compress(payload)):>9} "
+                f"{full_size / len(payload):>6.1f}x {simplify_ms:>12.1f} {serialize_ms:>13.2f}"
+            )
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completed'))
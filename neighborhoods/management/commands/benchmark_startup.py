@@ -0,0 +1,70 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Imported by the chat stages on first use; importing them at startup is a regression
+LAZY_MODULES = ('google.generativeai', 'wikipedia', 'fuzzywuzzy')
+
+# What a worker does before serving its first request: set up Django and resolve the URLconf
+STARTUP_CODE = (
+    "import django; django.setup(); "
+    "from django.urls import get_resolver; get_resolver().url_patterns"
+)
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def measure_startup():
+    """Run the startup in a fresh interpreter under -X importtime; returns {module: (self_us, cumulative_us, depth)}."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_CODE],
+        cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise CommandError(f"Startup failed:\n{result.stderr[-2000:]}")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return modules
+
+
+class Command(BaseCommand):
+    help = 'Measure the import cost of starting a worker and fail if it exceeds the budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=float, default=settings.STARTUP_IMPORT_BUDGET_MS,
+                            help='Maximum total import time in milliseconds')
+        parser.add_argument('--repeat', type=int, default=3, help='Fresh interpreters started; the fastest run counts')
+        parser.add_argument('--top', type=int, default=15, help='Number of most expensive modules listed')
+
+    def handle(self, *args, **options):
+        runs = [measure_startup() for _ in range(max(options['repeat'], 1))]
+        # Top-level imports only, so nested modules are not counted twice
+        totals = [sum(cumulative for _, cumulative, depth in run.values() if depth == 0) for run in runs]
+        modules = runs[totals.index(min(totals))]
+        total_ms = min(totals) / 1000
+
+        self.stdout.write(f"{'cumulative ms':>14} {'self ms':>8}  module")
+        expensive = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (self_us, cumulative_us, depth) in expensive[:options['top']]:
+            self.stdout.write(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {name}")
+        self.stdout.write(f"{len(modules)} modules imported in {total_ms:.1f} ms (budget {options['budget']:.0f} ms)")
+
+        problems = [f"{name} is imported at startup; it should only be imported on first use"
+                    for name in LAZY_MODULES if name in modules]
+        if total_ms > options['budget']:
+            problems.append(f"Startup imports took {total_ms:.1f} ms, over the {options['budget']:.0f} ms budget")
+        if problems:
+            for problem in problems:
+                self.stderr.write(self.style.ERROR(problem))
+            raise CommandError('Startup import benchmark failed')
+
+        self.stdout.write(self.style.SUCCESS('Startup import benchmark passed'))
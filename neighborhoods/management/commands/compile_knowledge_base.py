@@ -0,0 +1,44 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from neighborhoods.chat.knowledge import KnowledgeBase, read_snapshot, read_sources, source_hashes, write_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Validate the chatbot YAML knowledge base and store the parsed files as a JSON snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data-dir', default=os.path.join(settings.BASE_DIR, 'data'),
+                            help='Directory holding the YAML files')
+        parser.add_argument('--output', default=settings.KNOWLEDGE_BASE_SNAPSHOT_PATH, help='Snapshot file to write')
+        parser.add_argument('--check', action='store_true', help='Only validate the YAML files')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        data, hashes, errors = read_sources(options['data_dir'])
+        if errors:
+            for error in errors:
+                self.stderr.write(self.style.ERROR(error))
+            raise CommandError(f'Knowledge base has {len(errors)} problem(s)')
+        knowledge_base = KnowledgeBase(data, hashes)
+        compile_ms = (time.perf_counter() - start) * 1000
+
+        self.stdout.write(
+            f"{len(knowledge_base.dialog_matcher)} dialogs, {len(knowledge_base.factual_responses)} factual and "
+            f"{len(knowledge_base.website_responses)} website responses are valid"
+        )
+        if options['check']:
+            return
+
+        write_snapshot(knowledge_base, options['output'])
+        start = time.perf_counter()
+        if read_snapshot(options['output'], source_hashes(options['data_dir'])) is None:
+            raise CommandError(f"Snapshot {options['output']} could not be read back")
+        load_ms = (time.perf_counter() - start) * 1000
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['output']} (YAML parse and compile {compile_ms:.1f} ms, snapshot load {load_ms:.1f} ms)"
+        ))
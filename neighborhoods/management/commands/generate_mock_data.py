@@ -1,45 +1,55 @@
-from django.core.management.base import BaseCommand
-from neighborhoods.models import CrimeData, Demographics, RentData, Amenity, Neighborhood
-import random
-import datetime
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from neighborhoods.mock_data import delete_mock_data, generate_mock_data
+from neighborhoods.models import Borough
+
 
 class Command(BaseCommand):
-    help = 'Generate mock data for neighborhoods'
+    help = 'Generate synthetic boroughs, neighborhoods and their data for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--boroughs', type=int, default=12, help='Number of boroughs')
+        parser.add_argument('--neighborhoods', type=int, default=100, help='Number of neighborhoods')
+        parser.add_argument('--amenities', type=int, default=5000, help='Number of Amenities rows')
+        parser.add_argument('--transports', type=int, default=1500, help='Number of Transports rows')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed generates the same data')
+        parser.add_argument('--prefix', default='Mock', help='Prefix of the generated borough and neighborhood names')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Rows per bulk insert')
+        parser.add_argument('--geojson', help='Also write the neighborhood polygons to this GeoJSON file')
+        parser.add_argument('--replace', action='store_true', help='Delete data generated earlier with the same prefix first')
+        parser.add_argument('--delete', action='store_true', help='Only delete data generated with the prefix')
 
     def handle(self, *args, **options):
-        # Your mock data generation logic here
-        neighborhoods = Neighborhood.objects.all()
-
-        # Example mock data generation
-        for neighborhood in neighborhoods:
-            RentData.objects.create(
-                neighborhood=neighborhood,
-                average_rent=random.uniform(500, 1500),
-                median_rent=random.uniform(400, 1400),
-                min_rent=random.uniform(300, 1300),
-                max_rent=random.uniform(600, 1600),
-                date_collected=datetime.date.today()
-            )
-            CrimeData.objects.create(
-                neighborhood=neighborhood,
-                crime_rate=random.uniform(0, 100),
-                crime_type="Theft",
-                date_collected=datetime.date.today()
-            )
-            Demographics.objects.create(
-                neighborhood=neighborhood,
-                family_friendly_percentage=random.uniform(10, 50),
-                foreign_residents_percentage=random.uniform(5, 40),
-                median_income=random.uniform(20000, 50000),
-                age_distribution={"0-18": 20, "19-35": 30, "36-60": 25, "60+": 25}
-            )
-            Amenity.objects.create(
-                neighborhood=neighborhood,
-                amenity_type="School",
-                count=random.randint(1, 10),
-                name="Sample School",
-                latitude=random.uniform(-90, 90),
-                longitude=random.uniform(-180, 180)
-            )
-
-        self.stdout.write(self.style.SUCCESS('Successfully generated mock data'))
+        prefix = options['prefix']
+        existing = Borough.objects.filter(name__startswith=f'{prefix} Borough ').exists()
+        if options['delete'] or (existing and options['replace']):
+            deleted = delete_mock_data(prefix)
+            self.stdout.write(f"Deleted {deleted} generated boroughs and their data")
+            if options['delete']:
+                return
+        elif existing:
+            raise CommandError(f"Data generated with prefix '{prefix}' exists; use --replace or another --prefix")
+
+        if options['boroughs'] < 1 or options['neighborhoods'] < options['boroughs']:
+            raise CommandError('Need at least one borough and at least one neighborhood per borough')
+
+        start = time.perf_counter()
+        features, counts = generate_mock_data(
+            options['boroughs'], options['neighborhoods'], options['amenities'], options['transports'],
+            seed=options['seed'], prefix=prefix, chunk_size=options['chunk_size'],
+        )
+        elapsed = time.perf_counter() - start
+
+        if options['geojson']:
+            with open(options['geojson'], 'w', encoding='utf-8') as file:
+                json.dump({'type': 'FeatureCollection', 'features': features}, file)
+            self.stdout.write(f"Wrote {len(features)} neighborhood polygons to {options['geojson']}")
+
+        rows = sum(counts.values())
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {summary} in {elapsed:.1f} s ({rows / elapsed:,.0f} rows/s)"
+        ))
@@ -1,34 +1,37 @@
 import json
-from django.core.management.base import BaseCommand
-from neighborhoods.models import Neighborhood
+
+from django.core.management.base import BaseCommand, CommandError
+
+from neighborhoods.geojson_index import NEIGHBORHOODS_GEOJSON_PATH
+from neighborhoods.spatial import update_neighborhood_locations
+
 
 class Command(BaseCommand):
-    help = 'Import neighborhood data from GeoJSON'
-
-    def handle(self, *args, **kwargs):
-        with open('static/geojson/berlin_neighborhoods.geojson', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        for feature in data['features']:
-            neighborhood_name = feature['properties']['name']  # No encoding/decoding necessary
-
-            try:
-                # Find neighborhood in the database
-                neighborhood = Neighborhood.objects.get(name=neighborhood_name)
-                
-                # Extract the first point from the Polygon or MultiPolygon coordinates
-                if feature['geometry']['type'] == 'Polygon':
-                    first_coordinate = feature['geometry']['coordinates'][0][0]  # First point of the polygon
-                elif feature['geometry']['type'] == 'MultiPolygon':
-                    first_coordinate = feature['geometry']['coordinates'][0][0][0]  # First point of the first polygon
-                
-                # Update latitude and longitude with the extracted point
-                neighborhood.latitude = first_coordinate[1]  # Latitude (2nd element)
-                neighborhood.longitude = first_coordinate[0]  # Longitude (1st element)
-                
-                neighborhood.save()
-                self.stdout.write(self.style.SUCCESS(f'Updated neighborhood: {neighborhood_name}'))
-            except Neighborhood.DoesNotExist:
-                self.stdout.write(self.style.ERROR(f'Neighborhood not found in DB: {neighborhood_name}'))
-
-        self.stdout.write(self.style.SUCCESS('Import completed successfully'))
+    help = 'Set neighborhood latitudes and longitudes from the polygons of a GeoJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=NEIGHBORHOODS_GEOJSON_PATH,
+                            help='GeoJSON FeatureCollection (default: the neighborhoods file served by the site)')
+        parser.add_argument('--point', choices=['auto', 'centroid', 'representative'], default='auto',
+                            help='centroid, a point inside the polygon, or the centroid when it lies inside (default)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'r', encoding='utf-8') as f:
+                features = json.load(f)['features']
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise CommandError(f"Could not read {options['path']}: {e}")
+
+        changes, unchanged, unmatched = update_neighborhood_locations(
+            features, method=options['point'], dry_run=options['dry_run'])
+
+        for neighborhood, old, new in changes:
+            self.stdout.write(f'{neighborhood.name}: ({old[0]}, {old[1]}) -> ({new[0]}, {new[1]})')
+        for name in unmatched:
+            self.stdout.write(self.style.ERROR(f'Neighborhood not found in DB or without geometry: {name}'))
+
+        verb = 'Would update' if options['dry_run'] else 'Updated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {len(changes)} neighborhoods, {unchanged} unchanged, {len(unmatched)} features skipped'
+        ))
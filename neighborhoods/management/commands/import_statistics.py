@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from neighborhoods.importers import SOURCES, import_statistics, read_chunks
+
+
+class Command(BaseCommand):
+    help = 'Import rent, crime or demographics figures from a CSV or Excel file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', choices=sorted(SOURCES), help='Kind of figures in the file')
+        parser.add_argument('path', help='CSV or Excel file; one row per neighborhood (crime: per borough)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows read and written at a time')
+        parser.add_argument('--sheet', help='Excel sheet name (default: the first sheet)')
+        parser.add_argument('--sep', default=',', help="CSV field separator, ';' for the statistical office exports")
+        parser.add_argument('--decimal', default='.', help="Decimal mark, ',' for German number formats")
+        parser.add_argument('--thousands', help="Thousands separator, '.' for German number formats")
+        parser.add_argument('--encoding', default='utf-8', help='CSV file encoding')
+        parser.add_argument('--show', type=int, default=20, help='Changes and rejected rows to list')
+
+    def handle(self, *args, **options):
+        chunks = read_chunks(
+            options['path'], options['chunk_size'], sheet=options['sheet'], sep=options['sep'],
+            decimal=options['decimal'], thousands=options['thousands'], encoding=options['encoding'],
+        )
+        start = time.perf_counter()
+        try:
+            result = import_statistics(options['source'], chunks, dry_run=options['dry_run'],
+                                       decimal=options['decimal'], thousands=options['thousands'])
+        except (ImportError, OSError, ValueError) as e:
+            raise CommandError(f"Could not import {options['path']}: {e}")
+        elapsed = time.perf_counter() - start
+
+        show = options['show']
+        for name in result.added[:show]:
+            self.stdout.write(f"+ {name}")
+        for name, field, old, new in result.changes[:show]:
+            self.stdout.write(f"~ {name}: {field} {old} -> {new}")
+        for row, reason in result.rejected[:show]:
+            self.stdout.write(self.style.WARNING(f"! row {row}: {reason}" if row else f"! {reason}"))
+        hidden = max(len(result.added) - show, 0) + max(len(result.changes) - show, 0) + max(len(result.rejected) - show, 0)
+        if hidden:
+            self.stdout.write(f"... and {hidden} more lines (use --show)")
+
+        verb = 'Would import' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {options['source']} from {options['path']}: {result.created} created, {result.updated} updated, "
+            f"{result.unchanged} unchanged, {len(result.rejected)} rejected in {elapsed:.2f} s"
+        ))
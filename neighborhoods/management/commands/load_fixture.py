@@ -0,0 +1,33 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from neighborhoods.bulk_load import load_fixture
+
+
+class Command(BaseCommand):
+    help = 'Bulk-load a JSON fixture in one transaction; skipped when the same version was already loaded'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixture', nargs='?', default=os.path.join(settings.BASE_DIR, 'data.json'),
+                            help='JSON fixture to load (default: data.json)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT statement')
+        parser.add_argument('--force', action='store_true', help='Load even if this version was already loaded')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        sha256, timings = load_fixture(options['fixture'], batch_size=options['batch_size'], force=options['force'])
+        if timings is None:
+            self.stdout.write(f"{options['fixture']} is unchanged (sha256 {sha256[:12]}), nothing to load")
+            return
+
+        for label, rows, seconds in timings:
+            self.stdout.write(f"{label:<30} {rows:>7} rows {seconds * 1000:>8.1f} ms")
+        total_rows = sum(rows for _, rows, _ in timings)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {total_rows} rows from {options['fixture']} in {elapsed:.2f} s "
+            f"({total_rows / elapsed:,.0f} rows/s)"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from neighborhoods.stats import rebuild_borough_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed borough crime and amenity statistics'
+
+    def handle(self, *args, **options):
+        count = rebuild_borough_stats()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt statistics for {count} boroughs'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from neighborhoods.stats import refresh_neighborhood_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed neighborhood detail summaries'
+
+    def handle(self, *args, **options):
+        count = refresh_neighborhood_summaries()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt summaries for {count} neighborhoods'))
@@ -0,0 +1,210 @@
+import bisect
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; spans in-memory lookups (sub-millisecond) to slow Gemini calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with labels, kept in process memory."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(f'{self.name}_total', _format_labels(self.labelnames, key), value) for key, value in values]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    """Histogram with fixed buckets and labels, kept in process memory."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def count(self, **labels):
+        entry = self._values.get(tuple(str(labels[name]) for name in self.labelnames))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(entry[0]), entry[1])) for key, entry in self._values.items())
+        samples = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                samples.append((f'{self.name}_bucket', labels, cumulative))
+            samples.append((f'{self.name}_sum', _format_labels(self.labelnames, key), total))
+            samples.append((f'{self.name}_count', _format_labels(self.labelnames, key), cumulative))
+        return samples
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Registry:
+    """Metrics and gauge callbacks rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._gauges = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_gauges(self, callback):
+        # callback() returns an iterable of (name, documentation, labels dict, value)
+        self._gauges.append(callback)
+        return callback
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in metric.samples())
+
+        gauges = {}
+        for callback in self._gauges:
+            try:
+                for name, documentation, labels, value in callback():
+                    gauges.setdefault(name, (documentation, []))[1].append((labels, value))
+            except Exception as e:
+                logger.error(f"Metrics gauge callback failed: {e}")
+        for name, (documentation, samples) in gauges.items():
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+chat_request_seconds = REGISTRY.register(Histogram(
+    'chat_request_seconds', 'Time to answer a chat message.', ['view']))
+chat_stage_seconds = REGISTRY.register(Histogram(
+    'chat_stage_seconds', 'Time spent in each chat pipeline stage.', ['stage']))
+chat_answers = REGISTRY.register(Counter(
+    'chat_answers', 'Chat messages by the stage that answered them.', ['view', 'stage']))
+chat_cache_events = REGISTRY.register(Counter(
+    'chat_cache_events', 'Chat provider cache lookups by result.', ['cache', 'result']))
+chat_upstream_requests = REGISTRY.register(Counter(
+    'chat_upstream_requests', 'Calls to external chat providers by outcome.', ['provider', 'status']))
+
+
+class ChatTrace:
+    """
+    Timing for one chat message. Stage durations go to ``chat_stage_seconds``
+    as they finish; ``finish`` records the total and the answering stage and,
+    for a sampled share of messages (CHAT_TRACE_SAMPLE_RATE), logs the trace.
+    """
+
+    def __init__(self, view, clock=time.perf_counter):
+        self.view = view
+        self._clock = clock
+        self.start = clock()
+        self.stages = []
+        self.answered_by = None
+
+    def record(self, stage, seconds):
+        chat_stage_seconds.observe(seconds, stage=stage)
+        self.stages.append((stage, seconds))
+
+    def run(self, stage, func, *args):
+        """Call one stage and return its answer, remembering the first stage that had one."""
+        start = self._clock()
+        try:
+            answer = func(*args)
+        finally:
+            self.record(stage, self._clock() - start)
+        if answer and self.answered_by is None:
+            self.answered_by = stage
+        return answer
+
+    def timed(self, stage, func):
+        """Wrap a provider so that its run time is recorded (used for concurrent stages)."""
+        def wrapper(*args):
+            start = self._clock()
+            try:
+                return func(*args)
+            finally:
+                self.record(stage, self._clock() - start)
+        return wrapper
+
+    def finish(self, answered_by=None):
+        total = self._clock() - self.start
+        self.answered_by = answered_by or self.answered_by or 'none'
+        chat_request_seconds.observe(total, view=self.view)
+        chat_answers.inc(view=self.view, stage=self.answered_by)
+
+        if random.random() < settings.CHAT_TRACE_SAMPLE_RATE:
+            stages = ' '.join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in self.stages)
+            logger.info(f"Chat trace view={self.view} answered_by={self.answered_by} "
+                        f"total={total * 1000:.1f}ms {stages}")
+        return total
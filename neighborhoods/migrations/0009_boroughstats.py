@@ -0,0 +1,33 @@
+# Generated by Django 5.2.11 on 2026-10-18 12:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('neighborhoods', '0008_alter_amenities_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoroughStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_crimes', models.IntegerField(default=0)),
+                ('total_robbery', models.IntegerField(default=0)),
+                ('total_assaults', models.IntegerField(default=0)),
+                ('total_thefts', models.IntegerField(default=0)),
+                ('total_residential_burglary', models.IntegerField(default=0)),
+                ('total_arson_incidents', models.IntegerField(default=0)),
+                ('total_vandalism', models.IntegerField(default=0)),
+                ('crime_percentages', models.JSONField(default=dict)),
+                ('amenity_counts', models.JSONField(default=dict)),
+                ('amenity_percentages', models.JSONField(default=dict)),
+                ('berlin_total_crimes', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField()),
+                ('borough', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='neighborhoods.borough')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.11 on 2026-10-18 12:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('neighborhoods', '0009_boroughstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NeighborhoodSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rent', models.JSONField(blank=True, null=True)),
+                ('demographics', models.JSONField(blank=True, null=True)),
+                ('ethnic_distribution', models.JSONField(default=dict)),
+                ('age_distribution', models.JSONField(default=dict)),
+                ('amenity_counts', models.JSONField(default=dict)),
+                ('transport_stations', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField()),
+                ('neighborhood', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='neighborhoods.neighborhood')),
+            ],
+        ),
+    ]
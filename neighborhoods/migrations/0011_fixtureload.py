@@ -0,0 +1,23 @@
+# Generated by Django 5.2.11 on 2026-10-18 12:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('neighborhoods', '0010_neighborhoodsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FixtureLoad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fixture', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(max_length=64)),
+                ('rows', models.IntegerField(default=0)),
+                ('loaded_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,251 @@
+import numpy as np
+from django.db import transaction
+from django.utils.text import slugify
+
+from .models import Amenities, Borough, CrimeData, Demographics, Lifestyle, Neighborhood, RentData, Transports
+from .signals import derived_data_receivers_disconnected, invalidate_data_caches
+from .stats import AGE_DISTRIBUTION_FIELDS, rebuild_borough_stats, refresh_neighborhood_summaries
+
+# Longitude/latitude box the generated boroughs are laid out in (roughly Berlin)
+MOCK_BOUNDS = (13.08, 52.34, 13.76, 52.68)
+POLYGON_VERTICES = 24
+
+# Relative frequency of each amenity type in data.json
+AMENITY_TYPE_WEIGHTS = {
+    'Park': 2538, 'Pharmacy': 733, 'Primary Schools': 499, 'Gallerie': 367, 'Secondary Schools': 238,
+    'Museum': 216, 'Vocationnal Schools': 120, 'Cinema': 71, 'Primary To Vocationnal Schools': 67,
+    'Library': 65, 'Club': 38, 'Theater': 21, 'HundePark': 19, 'Bar': 12, 'Fachoberschule': 1,
+}
+TRANSPORT_LINES = (
+    [f'U{number}' for number in range(1, 10)]
+    + [f'S{number}' for number in (1, 2, 25, 26, 3, 41, 42, 45, 46, 5, 7, 75, 8, 85, 9)]
+    + [f'TRAM M{number}' for number in (1, 2, 4, 5, 6, 8, 10, 13, 17)]
+    + [f'BUS {number}' for number in ('M19', 'M27', 'M29', 'M46', 'M85', 'X33', 'N1', 'N2', 'N5', 'N7', 'N9', '106', '147')]
+)
+CRIME_SHARES = {
+    'robbery': 0.01, 'total_assaults': 0.1, 'total_thefts': 0.42,
+    'total_residential_burglary': 0.02, 'total_arson_incidents': 0.006, 'total_vandalism': 0.09,
+}
+NATIONALITY_FIELDS = tuple(
+    field.name for field in Demographics._meta.concrete_fields
+    if not field.primary_key and not field.is_relation
+    and field.name not in ('total', 'germans', 'foreigners') + AGE_DISTRIBUTION_FIELDS
+)
+
+
+def star_polygons(rng, centers, radii, vertices=POLYGON_VERTICES):
+    """
+    One closed ring per center: vertices at jittered, increasing angles and
+    randomly varying distance. Star-shaped around their center, so the rings
+    never intersect themselves. Returns an array of shape (n, vertices + 1, 2).
+    """
+    count = len(centers)
+    angles = (np.arange(vertices) + rng.uniform(-0.3, 0.3, (count, vertices))) * (2 * np.pi / vertices)
+    distances = radii[:, None] * rng.uniform(0.65, 1.0, (count, vertices))
+    # Degrees of longitude are shorter than degrees of latitude at Berlin's latitude
+    points = np.stack([distances * np.cos(angles) * 1.6, distances * np.sin(angles)], axis=-1)
+    rings = centers[:, None, :] + points
+    return np.concatenate([rings, rings[:, :1]], axis=1).round(6)
+
+
+def _grid(count, bounds):
+    """Centers and half-size of a regular grid of ``count`` cells inside ``bounds``."""
+    columns = int(np.ceil(np.sqrt(count)))
+    rows = int(np.ceil(count / columns))
+    west, south, east, north = bounds
+    width, height = (east - west) / columns, (north - south) / rows
+    index = np.arange(count)
+    centers = np.stack([west + (index % columns + 0.5) * width, south + (index // columns + 0.5) * height], axis=1)
+    return centers, min(width / 1.6, height) / 2
+
+
+def _in_chunks(model, total, chunk_size, build):
+    # build(start, stop) returns the instances for rows start..stop; each chunk is one bulk_create
+    for start in range(0, total, chunk_size):
+        model.objects.bulk_create(build(start, min(start + chunk_size, total)), batch_size=chunk_size)
+
+
+def generate_mock_data(boroughs, neighborhoods, amenities, transports, seed=0, prefix='Mock', chunk_size=10000):
+    """
+    Create ``boroughs`` boroughs and ``neighborhoods`` neighborhoods with rent,
+    crime and demographic figures, plus ``amenities`` and ``transports`` rows
+    spread over the neighborhoods. The same seed produces the same data.
+    Returns the neighborhood GeoJSON features and the number of rows per model.
+    """
+    rng = np.random.default_rng(seed)
+    counts = {}
+
+    with transaction.atomic():
+        # Boroughs on a grid, each with a polygon filling most of its cell
+        borough_centers, borough_radius = _grid(boroughs, MOCK_BOUNDS)
+        borough_rings = star_polygons(rng, borough_centers, np.full(boroughs, borough_radius * 0.95))
+        minimum_rents = rng.normal(850, 120, boroughs).clip(450).round()
+        borough_objects = Borough.objects.bulk_create([
+            Borough(
+                name=f'{prefix} Borough {number + 1}',
+                slug=slugify(f'{prefix} Borough {number + 1}'),
+                minimum_rent=float(minimum_rents[number]),
+                longitude=round(float(borough_centers[number, 0]), 6),
+                latitude=round(float(borough_centers[number, 1]), 6),
+                geometry_coordinates=[borough_rings[number].tolist()],
+                description=f'Synthetic borough {number + 1} for load testing.',
+            )
+            for number in range(boroughs)
+        ], batch_size=chunk_size)
+        borough_ids = np.array([borough.id for borough in borough_objects])
+        counts['boroughs'] = boroughs
+
+        lifestyle_ids = list(Lifestyle.objects.values_list('id', flat=True))
+        if lifestyle_ids:
+            chosen = rng.random((boroughs, len(lifestyle_ids))) < 0.4
+            Borough.lifestyles.through.objects.bulk_create([
+                Borough.lifestyles.through(borough_id=int(borough_ids[row]), lifestyle_id=lifestyle_ids[column])
+                for row, column in zip(*np.nonzero(chosen))
+            ], batch_size=chunk_size)
+
+        # Neighborhoods spread evenly over the boroughs, on a grid inside their borough's cell
+        neighborhood_borough = np.sort(rng.permutation(np.arange(neighborhoods) % boroughs))
+        per_borough = np.bincount(neighborhood_borough, minlength=boroughs)
+        position = np.arange(neighborhoods) - np.repeat(np.cumsum(per_borough) - per_borough, per_borough)
+        columns = np.ceil(np.sqrt(per_borough)).astype(int)[neighborhood_borough]
+        half = borough_radius * 0.6
+        cell = 2 * half / columns
+        neighborhood_centers = np.stack([
+            borough_centers[neighborhood_borough, 0] + ((position % columns + 0.5) * cell - half) * 1.6,
+            borough_centers[neighborhood_borough, 1] + (position // columns + 0.5) * cell - half,
+        ], axis=1)
+        neighborhood_rings = star_polygons(rng, neighborhood_centers, cell * 0.45)
+
+        neighborhood_objects = Neighborhood.objects.bulk_create([
+            Neighborhood(
+                name=f'{prefix} Neighborhood {number + 1}',
+                slug=slugify(f'{prefix} Neighborhood {number + 1}'),
+                borough_id=int(borough_ids[neighborhood_borough[number]]),
+                longitude=round(float(neighborhood_centers[number, 0]), 6),
+                latitude=round(float(neighborhood_centers[number, 1]), 6),
+            )
+            for number in range(neighborhoods)
+        ], batch_size=chunk_size)
+        neighborhood_ids = np.array([neighborhood.id for neighborhood in neighborhood_objects])
+        neighborhood_borough_ids = borough_ids[neighborhood_borough]
+        counts['neighborhoods'] = neighborhoods
+
+        # Rent: listing prices scale with the flat size
+        avg_size = rng.normal(65, 12, neighborhoods).clip(30)
+        avg_price = avg_size * rng.normal(17, 3.5, neighborhoods).clip(9)
+        RentData.objects.bulk_create([
+            RentData(
+                neighborhood_id=int(neighborhood_ids[number]),
+                borough_id=int(neighborhood_borough_ids[number]),
+                avg_price=float(round(avg_price[number])),
+                min_price=float(round(avg_price[number] * low)),
+                max_price=float(round(avg_price[number] * high)),
+                avg_size=float(round(avg_size[number])),
+                min_size=10.0,
+                max_size=float(round(avg_size[number] * 2.5)),
+            )
+            for number, low, high in zip(range(neighborhoods), rng.uniform(0.35, 0.6, neighborhoods),
+                                                 rng.uniform(2, 3.5, neighborhoods))
+        ], batch_size=chunk_size)
+        counts['rent'] = neighborhoods
+
+        total_crimes = rng.normal(40000, 12000, boroughs).clip(5000)
+        crime_columns = {field: (total_crimes * share * rng.uniform(0.7, 1.3, boroughs)).round().astype(int)
+                         for field, share in CRIME_SHARES.items()}
+        CrimeData.objects.bulk_create([
+            CrimeData(borough_id=int(borough_ids[number]), total_crimes=int(total_crimes[number]),
+                      **{field: int(values[number]) for field, values in crime_columns.items()})
+            for number in range(boroughs)
+        ], batch_size=chunk_size)
+        counts['crime'] = boroughs
+
+        # Demographics: the age groups and the nationalities each add up to their total
+        population = rng.normal(30000, 9000, neighborhoods).clip(2000).astype(int)
+        foreigners = (population * rng.uniform(0.1, 0.45, neighborhoods)).astype(int)
+        ages = rng.multinomial(population, [0.06, 0.09, 0.03, 0.11, 0.3, 0.13, 0.28])
+        nationalities = (rng.dirichlet(np.ones(len(NATIONALITY_FIELDS)), neighborhoods) * foreigners[:, None]).astype(int)
+        Demographics.objects.bulk_create([
+            Demographics(
+                neighborhood_id=int(neighborhood_ids[number]),
+                borough_id=int(neighborhood_borough_ids[number]),
+                total=int(population[number]),
+                germans=int(population[number] - foreigners[number]),
+                foreigners=int(foreigners[number]),
+                **dict(zip(AGE_DISTRIBUTION_FIELDS, ages[number].tolist())),
+                **dict(zip(NATIONALITY_FIELDS, nationalities[number].tolist())),
+            )
+            for number in range(neighborhoods)
+        ], batch_size=chunk_size)
+        counts['demographics'] = neighborhoods
+
+        # Amenities: types drawn with their real-world frequency, spread over all neighborhoods
+        amenity_types = np.array(list(AMENITY_TYPE_WEIGHTS))
+        weights = np.array(list(AMENITY_TYPE_WEIGHTS.values()), dtype=float)
+        amenity_neighborhood = rng.integers(0, neighborhoods, amenities)
+        amenity_type = rng.choice(len(amenity_types), amenities, p=weights / weights.sum())
+
+        def build_amenities(start, stop):
+            return [
+                Amenities(neighborhood_id=neighborhood_id, borough_id=borough_id,
+                          amenity_type=kind, name=f'{kind} {number}')
+                for number, neighborhood_id, borough_id, kind in zip(
+                    range(start + 1, stop + 1),
+                    neighborhood_ids[amenity_neighborhood[start:stop]].tolist(),
+                    neighborhood_borough_ids[amenity_neighborhood[start:stop]].tolist(),
+                    amenity_types[amenity_type[start:stop]].tolist(),
+                )
+            ]
+        _in_chunks(Amenities, amenities, chunk_size, build_amenities)
+        counts['amenities'] = amenities
+
+        # Transports: one row per line serving a station, about two lines per station
+        station_count = max(transports // 2, 1)
+        station_neighborhood = rng.integers(0, neighborhoods, station_count)
+        transport_station = np.sort(rng.integers(0, station_count, transports))
+        transport_line = rng.integers(0, len(TRANSPORT_LINES), transports)
+        lines = np.array(TRANSPORT_LINES)
+
+        def build_transports(start, stop):
+            stations = transport_station[start:stop]
+            return [
+                Transports(neighborhood_id=neighborhood_id, borough_id=borough_id, type=line, name=f'Station {station + 1}')
+                for station, neighborhood_id, borough_id, line in zip(
+                    stations.tolist(),
+                    neighborhood_ids[station_neighborhood[stations]].tolist(),
+                    neighborhood_borough_ids[station_neighborhood[stations]].tolist(),
+                    lines[transport_line[start:stop]].tolist(),
+                )
+            ]
+        _in_chunks(Transports, transports, chunk_size, build_transports)
+        counts['transports'] = transports
+
+    # Bulk inserts send no signals: rebuild the derived tables and caches once
+    rebuild_borough_stats()
+    refresh_neighborhood_summaries()
+    invalidate_data_caches()
+
+    features = [
+        {'type': 'Feature', 'properties': {'name': neighborhood.name, 'borough': borough.name},
+         'geometry': {'type': 'MultiPolygon', 'coordinates': [[ring.tolist()]]}}
+        for neighborhood, borough, ring in zip(
+            neighborhood_objects, (borough_objects[index] for index in neighborhood_borough), neighborhood_rings)
+    ]
+    return features, counts
+
+
+def delete_mock_data(prefix='Mock'):
+    """Delete the boroughs created with ``prefix`` and everything attached to them. Returns the number of boroughs."""
+    boroughs = Borough.objects.filter(name__startswith=f'{prefix} Borough ')
+    count = boroughs.count()
+    data_models = (Amenities, Transports, Demographics, RentData, CrimeData)
+    with transaction.atomic():
+        # One DELETE per table instead of loading every row for its signals; the
+        # boroughs' own delete then cascades to the few neighborhood rows
+        with derived_data_receivers_disconnected(data_models):
+            for model in data_models:
+                model.objects.filter(borough__in=boroughs).delete()
+            boroughs.delete()
+    rebuild_borough_stats()
+    refresh_neighborhood_summaries()
+    invalidate_data_caches()
+    return count
@@ -173,4 +173,72 @@ class Transports(models.Model):
     name = models.CharField(max_length=100)
     
     def __str__(self):
-        return f'Transport in {self.neighborhood.name}: {self.name}'
\ No newline at end of file
+        return f'Transport in {self.neighborhood.name}: {self.name}'
+
+class BoroughStats(models.Model):
+    """
+    Denormalized crime and amenity statistics for one borough, rebuilt from
+    CrimeData and Amenities by stats.rebuild_borough_stats().
+    """
+    borough = models.OneToOneField(Borough, on_delete=models.CASCADE, related_name='stats')
+    total_crimes = models.IntegerField(default=0)
+    total_robbery = models.IntegerField(default=0)
+    total_assaults = models.IntegerField(default=0)
+    total_thefts = models.IntegerField(default=0)
+    total_residential_burglary = models.IntegerField(default=0)
+    total_arson_incidents = models.IntegerField(default=0)
+    total_vandalism = models.IntegerField(default=0)
+    crime_percentages = models.JSONField(default=dict)
+    amenity_counts = models.JSONField(default=dict)
+    amenity_percentages = models.JSONField(default=dict)
+    berlin_total_crimes = models.IntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'Statistics for {self.borough.name}'
+
+    @property
+    def crime_data(self):
+        # Same keys as the per-borough CrimeData aggregate used by the templates
+        return {
+            'total_crimes': self.total_crimes,
+            'total_robbery': self.total_robbery,
+            'total_assaults': self.total_assaults,
+            'total_thefts': self.total_thefts,
+            'total_residential_burglary': self.total_residential_burglary,
+            'total_arson_incidents': self.total_arson_incidents,
+            'total_vandalism': self.total_vandalism,
+        }
+
+
+class NeighborhoodSummary(models.Model):
+    """
+    Ready-to-render detail page data for one neighborhood, refreshed from
+    RentData, Demographics, Transports and Amenities by
+    stats.refresh_neighborhood_summaries().
+    """
+    neighborhood = models.OneToOneField(Neighborhood, on_delete=models.CASCADE, related_name='summary')
+    rent = models.JSONField(null=True, blank=True)  # RentData figures, or null when there is none
+    demographics = models.JSONField(null=True, blank=True)  # Demographics counts, or null when there is none
+    ethnic_distribution = models.JSONField(default=dict)
+    age_distribution = models.JSONField(default=dict)
+    amenity_counts = models.JSONField(default=dict)
+    transport_stations = models.JSONField(default=dict)  # Station name -> list of lines
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'Summary for {self.neighborhood.name}'
+
+
+class FixtureLoad(models.Model):
+    """
+    Content hash of the last version of a fixture applied by the load_fixture
+    command, so that starting a container with an unchanged fixture skips the load.
+    """
+    fixture = models.CharField(max_length=255, unique=True)  # File name of the fixture
+    sha256 = models.CharField(max_length=64)
+    rows = models.IntegerField(default=0)
+    loaded_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.fixture} ({self.sha256[:12]})'
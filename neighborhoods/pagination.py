@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Cursor pagination over the primary key. Pages stay stable while rows are
+    added and each page is a single indexed range query, however deep it is.
+    """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
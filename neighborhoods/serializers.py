@@ -1,13 +1,105 @@
-from rest_framework import serializers
-from .models import Neighborhood , Borough
+from rest_framework import permissions, serializers
+from .models import Neighborhood , Borough, RentData, CrimeData, Demographics, Amenities, Transports
 
-class NeighborhoodSerializer(serializers.ModelSerializer):
+
+def parse_field_list(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+def sparse_field_names(request, action, names, list_omit=()):
+    """
+    Apply the ``?fields=`` and ``?omit=`` query parameters of a read request to
+    a list of field names. Fields in ``list_omit`` are left out of list
+    responses unless they are asked for in ``?fields=``.
+    """
+    if request is None or request.method not in permissions.SAFE_METHODS:
+        return list(names)
+
+    fields = parse_field_list(request.query_params.get('fields'))
+    omit = parse_field_list(request.query_params.get('omit'))
+    if action == 'list':
+        omit |= set(list_omit) - fields
+    return [name for name in names if (not fields or name in fields) and name not in omit]
+
+
+class SparseFieldsetsMixin:
+    """ModelSerializer mixin serializing only the fields chosen with sparse_field_names()."""
+
+    def get_field_names(self, declared_fields, info):
+        names = super().get_field_names(declared_fields, info)
+        view = self.context.get('view')
+        return sparse_field_names(
+            self.context.get('request'),
+            getattr(view, 'action', None),
+            names,
+            getattr(self.Meta, 'list_omit', ()),
+        )
+
+
+class RentDataSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RentData
+        exclude = ('neighborhood', 'borough')
+
+
+class DemographicsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Demographics
+        exclude = ('neighborhood', 'borough')
+
+
+class AmenitiesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Amenities
+        fields = ('id', 'amenity_type', 'name')
+
+
+class TransportsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Transports
+        fields = ('id', 'type', 'name')
+
+
+class CrimeDataSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CrimeData
+        exclude = ('borough',)
+
+
+# ?expand= name -> (prefetch lookup, serializer). Crime statistics exist per borough.
+NEIGHBORHOOD_EXPANSIONS = {
+    'rent': ('rentdata_set', RentDataSerializer),
+    'demographics': ('demographics_set', DemographicsSerializer),
+    'amenities': ('amenities_set', AmenitiesSerializer),
+    'transports': ('transports_set', TransportsSerializer),
+    'crime': ('borough__crimedata_set', CrimeDataSerializer),
+}
+
+
+def requested_expansions(request, expansions):
+    """Names from the ``?expand=`` parameter of a read request that are known expansions."""
+    if request is None or request.method not in permissions.SAFE_METHODS:
+        return []
+    requested = parse_field_list(request.query_params.get('expand'))
+    return [name for name in expansions if name in requested]
+
+
+class NeighborhoodSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = Neighborhood
         fields = '__all__'  # You can specify fields explicitly like ['id', 'name', 'borough'] if needed
 
+    def get_fields(self):
+        fields = super().get_fields()
+        # Related rows are read from the viewset's prefetch cache; see NeighborhoodViewSet
+        for name in requested_expansions(self.context.get('request'), NEIGHBORHOOD_EXPANSIONS):
+            lookup, serializer_class = NEIGHBORHOOD_EXPANSIONS[name]
+            fields[name] = serializer_class(source=lookup.replace('__', '.'), many=True, read_only=True)
+        return fields
+
 
-class BoroughSerializer(serializers.ModelSerializer):
+class BoroughSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = Borough
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        list_omit = ('geometry_coordinates',)  # Polygons are only sent on list calls when requested
@@ -0,0 +1,143 @@
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Amenities, Borough, CrimeData, Demographics, Lifestyle, Neighborhood, RentData, Transports
+from .chat.facts import CHAT_FACTS_CACHE_KEY
+from .spatial import NEIGHBORHOOD_LOOKUP_CACHE_KEY
+from .stats import (
+    neighborhood_detail_cache_key,
+    schedule_borough_stats_rebuild,
+    schedule_neighborhood_summary_refresh,
+)
+
+
+BOROUGH_GEOJSON_VERSION_CACHE_KEY = 'borough_geojson_version'
+
+
+def borough_geojson_version():
+    """
+    Token identifying the current borough and lifestyle data; used in cache keys and ETags.
+    It lives for DATA_CACHE_TTL seconds, so a change made in another process (which bumps
+    the token only in its own cache unless CACHES is shared) is picked up within that time.
+    """
+    version = cache.get(BOROUGH_GEOJSON_VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(BOROUGH_GEOJSON_VERSION_CACHE_KEY, uuid.uuid4().hex, settings.DATA_CACHE_TTL)
+        version = cache.get(BOROUGH_GEOJSON_VERSION_CACHE_KEY)
+    return version
+
+
+def borough_geojson_cache_key(version, tolerance):
+    return f'borough_geojson:{version}:{tolerance}'
+
+
+def invalidate_data_caches():
+    """
+    Drop every cache derived from borough and neighborhood data. Bulk writes
+    (bulk_create, bulk_update, queryset updates) send no model signals, so
+    commands that use them call this once they are done.
+    """
+    cache.set(BOROUGH_GEOJSON_VERSION_CACHE_KEY, uuid.uuid4().hex, settings.DATA_CACHE_TTL)
+    neighborhood_ids = Neighborhood.objects.values_list('id', flat=True)
+    cache.delete_many(
+        [NEIGHBORHOOD_LOOKUP_CACHE_KEY, CHAT_FACTS_CACHE_KEY]
+        + [neighborhood_detail_cache_key(neighborhood_id) for neighborhood_id in neighborhood_ids]
+    )
+
+
+# The serialized borough FeatureCollection embeds borough fields and lifestyle names
+@receiver([post_save, post_delete], sender=Borough)
+@receiver([post_save, post_delete], sender=Lifestyle)
+@receiver(m2m_changed, sender=Borough.lifestyles.through)
+def bump_borough_geojson_version(sender, **kwargs):
+    if kwargs.get('action', 'post_').startswith('pre_'):
+        return
+    cache.set(BOROUGH_GEOJSON_VERSION_CACHE_KEY, uuid.uuid4().hex, settings.DATA_CACHE_TTL)
+
+
+# The point lookup caches neighborhood and borough names by normalized name
+@receiver([post_save, post_delete], sender=Borough)
+@receiver([post_save, post_delete], sender=Neighborhood)
+def invalidate_neighborhood_lookup(sender, **kwargs):
+    cache.delete(NEIGHBORHOOD_LOOKUP_CACHE_KEY)
+
+
+# The chat fact table holds names and figures from all of these tables
+@receiver([post_save, post_delete], sender=Borough)
+@receiver([post_save, post_delete], sender=Neighborhood)
+@receiver([post_save, post_delete], sender=RentData)
+@receiver([post_save, post_delete], sender=CrimeData)
+@receiver([post_save, post_delete], sender=Amenities)
+@receiver([post_save, post_delete], sender=Demographics)
+@receiver([post_save, post_delete], sender=Transports)
+def invalidate_chat_facts(sender, **kwargs):
+    cache.delete(CHAT_FACTS_CACHE_KEY)
+
+
+# BoroughStats are derived from crime and amenity rows. Fixture loads (raw saves)
+# are skipped; run the rebuild_borough_stats command after loaddata instead.
+@receiver([post_save, post_delete], sender=CrimeData)
+@receiver([post_save, post_delete], sender=Amenities)
+def rebuild_borough_stats_on_change(sender, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_borough_stats_rebuild()
+
+
+# NeighborhoodSummary rows are refreshed for the neighborhood whose data changed
+@receiver([post_save, post_delete], sender=RentData)
+@receiver([post_save, post_delete], sender=Demographics)
+@receiver([post_save, post_delete], sender=Transports)
+@receiver([post_save, post_delete], sender=Amenities)
+def refresh_neighborhood_summary_on_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    schedule_neighborhood_summary_refresh(instance.neighborhood_id)
+
+
+# post_delete receivers of the data tables that only refresh derived tables and caches
+DERIVED_DATA_RECEIVERS = {
+    RentData: (invalidate_chat_facts, refresh_neighborhood_summary_on_change),
+    Demographics: (invalidate_chat_facts, refresh_neighborhood_summary_on_change),
+    Transports: (invalidate_chat_facts, refresh_neighborhood_summary_on_change),
+    Amenities: (invalidate_chat_facts, rebuild_borough_stats_on_change, refresh_neighborhood_summary_on_change),
+    CrimeData: (invalidate_chat_facts, rebuild_borough_stats_on_change),
+}
+
+
+@contextmanager
+def derived_data_receivers_disconnected(models):
+    """
+    Disconnect the receivers in DERIVED_DATA_RECEIVERS for ``models``. With no
+    delete receivers left, QuerySet.delete() removes the rows with one DELETE
+    instead of loading them. For management commands only: the receivers are
+    disconnected for every thread. The caller refreshes the derived data after.
+    """
+    disconnected = [
+        (receiver, model) for model in models for receiver in DERIVED_DATA_RECEIVERS[model]
+        if post_delete.disconnect(receiver, sender=model)
+    ]
+    try:
+        yield
+    finally:
+        for receiver, model in disconnected:
+            post_delete.connect(receiver, sender=model)
+
+
+# The cached detail page context holds the neighborhood and borough themselves.
+# Fixture loads (raw saves) invalidate too: the cached instances would be stale.
+@receiver([post_save, post_delete], sender=Neighborhood)
+def invalidate_neighborhood_detail(sender, instance, **kwargs):
+    cache.delete(neighborhood_detail_cache_key(instance.pk))
+
+
+# pre_delete: the borough's neighborhoods are still there to be looked up
+@receiver([post_save, pre_delete], sender=Borough)
+def invalidate_borough_neighborhood_details(sender, instance, **kwargs):
+    neighborhood_ids = Neighborhood.objects.filter(borough=instance).values_list('id', flat=True)
+    cache.delete_many([neighborhood_detail_cache_key(neighborhood_id) for neighborhood_id in neighborhood_ids])
@@ -0,0 +1,165 @@
+import threading
+
+import numpy as np
+import shapely
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from shapely.geometry import shape
+
+from .geojson_index import neighborhood_geojson, normalize_name
+from .geometry import representative_points
+from .models import Neighborhood
+
+# Upper bound for one batch lookup request
+LOCATE_MAX_POINTS = 5000
+
+NEIGHBORHOOD_LOOKUP_CACHE_KEY = 'neighborhood_lookup'
+
+
+class NeighborhoodLocator:
+    """
+    Maps coordinates to the neighborhood polygons of a GeoJSONIndex using a
+    shapely STRtree over prepared geometries. The tree is built once per
+    version of the GeoJSON file.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _tree(self):
+        version = self.index.version
+        state = self._state
+        if state is not None and state[0] == version:
+            return state
+
+        with self._lock:
+            state = self._state
+            if state is None or state[0] != version:
+                names = []
+                geometries = []
+                for feature in self.index.features():
+                    try:
+                        geometry = shape(feature['geometry'])
+                    except (AttributeError, IndexError, KeyError, TypeError, ValueError, shapely.errors.ShapelyError):
+                        continue
+                    if geometry.is_empty:
+                        continue
+                    names.append(normalize_name(feature['properties'].get('name')))
+                    geometries.append(geometry)
+
+                geometries = np.array(geometries, dtype=object)
+                shapely.prepare(geometries)
+                state = (version, shapely.STRtree(geometries), np.array(names, dtype=object))
+                self._state = state
+        return state
+
+    def locate(self, lats, lons):
+        """
+        Return the normalized neighborhood name containing each point, or None.
+        ``lats`` and ``lons`` are equal-length sequences of floats.
+        """
+        _, tree, names = self._tree()
+        points = shapely.points(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+        point_indexes, tree_indexes = tree.query(points, predicate='intersects')
+
+        # Points on a shared border match several polygons; keep the lowest tree index
+        missing = len(names)
+        matches = np.full(len(points), missing, dtype=np.int64)
+        np.minimum.at(matches, point_indexes, tree_indexes)
+
+        return [names[match] if match != missing else None for match in matches]
+
+
+# Normalized neighborhood name -> serialized neighborhood and borough, cached until either
+# changes or for DATA_CACHE_TTL seconds, whichever comes first
+def get_neighborhood_lookup():
+    lookup = cache.get(NEIGHBORHOOD_LOOKUP_CACHE_KEY)
+    if lookup is None:
+        lookup = {}
+        for neighborhood in Neighborhood.objects.select_related('borough').order_by('id'):
+            lookup.setdefault(normalize_name(neighborhood.name), {
+                'neighborhood': {'id': neighborhood.id, 'name': neighborhood.name, 'slug': neighborhood.slug},
+                'borough': {
+                    'id': neighborhood.borough.id,
+                    'name': neighborhood.borough.name,
+                    'slug': neighborhood.borough.slug,
+                },
+            })
+        cache.set(NEIGHBORHOOD_LOOKUP_CACHE_KEY, lookup, settings.DATA_CACHE_TTL)
+    return lookup
+
+
+def locate_points(lats, lons, locator=None):
+    """Resolve a batch of points to neighborhood and borough records in one pass."""
+    names = (locator or neighborhood_locator).locate(lats, lons)
+    lookup = get_neighborhood_lookup()
+    empty = {'neighborhood': None, 'borough': None}
+    return [
+        {'lat': lat, 'lon': lon, **lookup.get(name, empty)}
+        for lat, lon, name in zip(lats, lons, names)
+    ]
+
+
+neighborhood_locator = NeighborhoodLocator(neighborhood_geojson)
+
+
+def update_neighborhood_locations(features, method='auto', dry_run=False):
+    """
+    Set each neighborhood's latitude and longitude to a point computed from
+    its GeoJSON polygon (see geometry.representative_points), matching
+    features to neighborhoods by normalized name. All neighborhoods are read
+    in one query and only changed rows are written, with bulk_update inside
+    one transaction.
+
+    Returns ``(changes, unchanged, unmatched)``: (neighborhood, old point, new
+    point) triples, the number of neighborhoods already in place, and the
+    names of features that could not be used.
+    """
+    parts = {}
+    unmatched = []
+    for feature in features:
+        name = (feature.get('properties') or {}).get('name')
+        try:
+            geometry = shape(feature['geometry'])
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError, shapely.errors.ShapelyError):
+            geometry = None
+        if geometry is None or geometry.is_empty:
+            unmatched.append(name)
+            continue
+        parts.setdefault(normalize_name(name), []).append(geometry)
+
+    # Some neighborhoods (Buckow) are split over several features
+    names = list(parts)
+    geometries = [part[0] if len(part) == 1 else shapely.union_all(part) for part in parts.values()]
+
+    neighborhoods = {}
+    for neighborhood in Neighborhood.objects.only('id', 'name', 'latitude', 'longitude'):
+        neighborhoods.setdefault(normalize_name(neighborhood.name), []).append(neighborhood)
+
+    changes = []
+    unchanged = 0
+    points = representative_points(geometries, method) if geometries else []
+    for name, (longitude, latitude) in zip(names, points):
+        if name not in neighborhoods:
+            unmatched.append(name)
+            continue
+        for neighborhood in neighborhoods[name]:
+            old = (neighborhood.latitude, neighborhood.longitude)
+            if np.allclose(old, (latitude, longitude), rtol=0, atol=1e-6):
+                unchanged += 1
+                continue
+            neighborhood.latitude, neighborhood.longitude = float(latitude), float(longitude)
+            changes.append((neighborhood, old, (neighborhood.latitude, neighborhood.longitude)))
+
+    if changes and not dry_run:
+        # Imported here: signals imports this module
+        from .signals import invalidate_data_caches
+
+        with transaction.atomic():
+            Neighborhood.objects.bulk_update([neighborhood for neighborhood, _, _ in changes],
+                                             ['latitude', 'longitude'])
+            transaction.on_commit(invalidate_data_caches)
+    return changes, unchanged, unmatched
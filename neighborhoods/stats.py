@@ -0,0 +1,236 @@
+import threading
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import (
+    Amenities,
+    Borough,
+    BoroughStats,
+    CrimeData,
+    Demographics,
+    Neighborhood,
+    NeighborhoodSummary,
+    RentData,
+    Transports,
+)
+
+# Crime percentage key -> summed CrimeData column
+CRIME_PERCENTAGE_FIELDS = {
+    'robbery': 'total_robbery',
+    'assaults': 'total_assaults',
+    'thefts': 'total_thefts',
+    'burglary': 'total_residential_burglary',
+    'arson': 'total_arson_incidents',
+    'vandalism': 'total_vandalism',
+}
+
+
+def percentage(count, total):
+    if total > 0:
+        return round((count / total) * 100, 1)
+    return 0.0
+
+
+def rebuild_borough_stats():
+    """
+    Recompute BoroughStats for every borough. Runs a fixed number of queries
+    regardless of the amount of crime and amenity data.
+    """
+    crime_totals = {
+        row.pop('borough'): row
+        for row in CrimeData.objects.values('borough').annotate(
+            total_crimes=Sum('total_crimes'),
+            total_robbery=Sum('robbery'),
+            total_assaults=Sum('total_assaults'),
+            total_thefts=Sum('total_thefts'),
+            total_residential_burglary=Sum('total_residential_burglary'),
+            total_arson_incidents=Sum('total_arson_incidents'),
+            total_vandalism=Sum('total_vandalism'),
+        ).order_by()
+    }
+    berlin_total_crimes = sum(row['total_crimes'] or 0 for row in crime_totals.values())
+
+    amenity_counts = defaultdict(dict)
+    for row in Amenities.objects.values('borough', 'amenity_type').annotate(count=Count('amenity_type')).order_by():
+        amenity_counts[row['borough']][row['amenity_type']] = row['count']
+
+    now = timezone.now()
+    stats = []
+    for borough_id in Borough.objects.values_list('id', flat=True):
+        crimes = {key: value or 0 for key, value in crime_totals.get(borough_id, {}).items()}
+        total_crimes = crimes.get('total_crimes', 0)
+        counts = amenity_counts.get(borough_id, {})
+        total_amenities = sum(counts.values())
+
+        stats.append(BoroughStats(
+            borough_id=borough_id,
+            total_crimes=total_crimes,
+            total_robbery=crimes.get('total_robbery', 0),
+            total_assaults=crimes.get('total_assaults', 0),
+            total_thefts=crimes.get('total_thefts', 0),
+            total_residential_burglary=crimes.get('total_residential_burglary', 0),
+            total_arson_incidents=crimes.get('total_arson_incidents', 0),
+            total_vandalism=crimes.get('total_vandalism', 0),
+            crime_percentages={
+                key: percentage(crimes.get(field, 0), total_crimes)
+                for key, field in CRIME_PERCENTAGE_FIELDS.items()
+            },
+            amenity_counts=counts,
+            amenity_percentages={
+                amenity_type: percentage(count, total_amenities) for amenity_type, count in counts.items()
+            },
+            berlin_total_crimes=berlin_total_crimes,
+            updated_at=now,
+        ))
+
+    update_fields = [
+        field.name for field in BoroughStats._meta.concrete_fields
+        if not field.primary_key and field.name != 'borough'
+    ]
+    with transaction.atomic():
+        BoroughStats.objects.bulk_create(
+            stats, update_conflicts=True, unique_fields=['borough'], update_fields=update_fields
+        )
+    return len(stats)
+
+
+def schedule_borough_stats_rebuild():
+    """
+    Rebuild the statistics once the current transaction commits. Changes made
+    inside one transaction (a cascade delete, an import) share one rebuild.
+    """
+    connection = transaction.get_connection()
+    if any(callback[1] is rebuild_borough_stats for callback in connection.run_on_commit):
+        return
+    transaction.on_commit(rebuild_borough_stats)
+
+
+def get_borough_stats(borough_slug):
+    """
+    Return the BoroughStats row (with its borough) for a borough slug in one
+    query, building the table first if the row is missing. Raises
+    Borough.DoesNotExist for unknown slugs.
+    """
+    stats = BoroughStats.objects.select_related('borough').filter(borough__slug=borough_slug).first()
+    if stats is None:
+        borough = Borough.objects.get(slug=borough_slug)
+        rebuild_borough_stats()
+        stats = BoroughStats.objects.select_related('borough').get(borough=borough)
+    return stats
+
+
+RENT_FIELDS = ('avg_price', 'min_price', 'max_price', 'avg_size', 'min_size', 'max_size')
+DEMOGRAPHICS_FIELDS = tuple(
+    field.name for field in Demographics._meta.concrete_fields
+    if not field.primary_key and not field.is_relation
+)
+ETHNIC_DISTRIBUTION_FIELDS = ('germans', 'turkey', 'poland', 'other_percentage')
+AGE_DISTRIBUTION_FIELDS = (
+    'under_6', 'six_to_15', 'fifteen_to_18', 'eighteen_to_27',
+    'twenty_seven_to_45', 'forty_five_to_55', 'fifty_five_and_more',
+)
+
+# Neighborhood ids waiting for a summary refresh at the end of the current transaction
+_pending_summaries = threading.local()
+
+
+def neighborhood_detail_cache_key(neighborhood_id):
+    return f'neighborhood_detail:{neighborhood_id}'
+
+
+def refresh_neighborhood_summaries(neighborhood_ids=None):
+    """
+    Rebuild NeighborhoodSummary rows for the given neighborhoods (all of them
+    when None) with a fixed number of queries.
+    """
+    neighborhoods = Neighborhood.objects.all()
+    if neighborhood_ids is not None:
+        neighborhoods = neighborhoods.filter(id__in=neighborhood_ids)
+    ids = list(neighborhoods.values_list('id', flat=True))
+    if not ids:
+        return 0
+
+    # The detail page has always shown the first row per neighborhood
+    rents = {}
+    for row in RentData.objects.filter(neighborhood_id__in=ids).order_by('-id').values('neighborhood_id', *RENT_FIELDS):
+        rents[row.pop('neighborhood_id')] = row
+
+    demographics = {}
+    for row in Demographics.objects.filter(neighborhood_id__in=ids).order_by('-id').values('neighborhood_id', *DEMOGRAPHICS_FIELDS):
+        demographics[row.pop('neighborhood_id')] = row
+
+    transport_stations = defaultdict(lambda: defaultdict(list))
+    for neighborhood_id, name, transport_type in Transports.objects.filter(
+        neighborhood_id__in=ids
+    ).order_by('id').values_list('neighborhood_id', 'name', 'type'):
+        transport_stations[neighborhood_id][name].append(transport_type)
+
+    amenity_counts = defaultdict(dict)
+    for row in Amenities.objects.filter(neighborhood_id__in=ids).values(
+        'neighborhood_id', 'amenity_type'
+    ).annotate(count=Count('amenity_type')).order_by():
+        amenity_counts[row['neighborhood_id']][row['amenity_type']] = row['count']
+
+    now = timezone.now()
+    summaries = []
+    for neighborhood_id in ids:
+        people = demographics.get(neighborhood_id)
+        summaries.append(NeighborhoodSummary(
+            neighborhood_id=neighborhood_id,
+            rent=rents.get(neighborhood_id),
+            demographics=people,
+            ethnic_distribution={field: people.get(field, 0) for field in ETHNIC_DISTRIBUTION_FIELDS} if people else {},
+            age_distribution={field: people[field] for field in AGE_DISTRIBUTION_FIELDS} if people else {},
+            amenity_counts=amenity_counts.get(neighborhood_id, {}),
+            transport_stations=dict(transport_stations.get(neighborhood_id, {})),
+            updated_at=now,
+        ))
+
+    update_fields = [
+        field.name for field in NeighborhoodSummary._meta.concrete_fields
+        if not field.primary_key and field.name != 'neighborhood'
+    ]
+    with transaction.atomic():
+        NeighborhoodSummary.objects.bulk_create(
+            summaries, update_conflicts=True, unique_fields=['neighborhood'], update_fields=update_fields
+        )
+    cache.delete_many([neighborhood_detail_cache_key(neighborhood_id) for neighborhood_id in ids])
+    return len(summaries)
+
+
+def _refresh_pending_summaries():
+    neighborhood_ids, _pending_summaries.ids = _pending_summaries.ids, set()
+    if neighborhood_ids:
+        refresh_neighborhood_summaries(neighborhood_ids)
+
+
+def schedule_neighborhood_summary_refresh(neighborhood_id):
+    """
+    Refresh one neighborhood's summary once the current transaction commits.
+    All neighborhoods touched inside one transaction are refreshed together.
+    """
+    connection = transaction.get_connection()
+    if any(callback[1] is _refresh_pending_summaries for callback in connection.run_on_commit):
+        _pending_summaries.ids.add(neighborhood_id)
+        return
+    _pending_summaries.ids = {neighborhood_id}
+    transaction.on_commit(_refresh_pending_summaries)
+
+
+def get_neighborhood_summary(neighborhood_id):
+    """
+    Return the NeighborhoodSummary (with neighborhood and borough) in one
+    query, building it first if it is missing. Raises
+    Neighborhood.DoesNotExist for unknown ids.
+    """
+    queryset = NeighborhoodSummary.objects.select_related('neighborhood__borough')
+    summary = queryset.filter(neighborhood_id=neighborhood_id).first()
+    if summary is None:
+        if not refresh_neighborhood_summaries([neighborhood_id]):
+            raise Neighborhood.DoesNotExist(f"Neighborhood {neighborhood_id} does not exist.")
+        summary = queryset.get(neighborhood_id=neighborhood_id)
+    return summary
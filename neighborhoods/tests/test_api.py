@@ -4,9 +4,25 @@ from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 import json
+import math
 import os
-from neighborhoods.models import Borough, Neighborhood, Lifestyle
+import tempfile
+import time
+from unittest.mock import patch
+from neighborhoods.models import (
+    Amenities,
+    Borough,
+    CrimeData,
+    Lifestyle,
+    Neighborhood,
+    RentData,
+    Transports,
+)
+from neighborhoods.geojson_index import GeoJSONIndex
+from neighborhoods.spatial import LOCATE_MAX_POINTS, NeighborhoodLocator
 
 UserModel = get_user_model()
 
@@ -36,14 +52,49 @@ class BoroughAPITestCase(APITestCase):
         self.client.force_authenticate(user=self.user)
         response = self.client.get(reverse('borough-list'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], 'Test Borough')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['name'], 'Test Borough')
+
+    def test_borough_list_api_omits_geometry_by_default(self):
+        self.client.force_authenticate(user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('borough-list'))
+        self.assertNotIn('geometry_coordinates', response.data['results'][0])
+        self.assertNotIn('geometry_coordinates', queries.captured_queries[0]['sql'])
+
+        response = self.client.get(reverse('borough-list'), {'fields': 'name,geometry_coordinates'})
+        self.assertEqual(set(response.data['results'][0]), {'name', 'geometry_coordinates'})
+
+    def test_borough_list_api_sparse_fieldsets(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('borough-list'), {'fields': 'id,name,slug'})
+        self.assertEqual(response.data['results'][0], {'id': self.borough.id, 'name': 'Test Borough', 'slug': 'test-borough'})
+
+        response = self.client.get(reverse('borough-list'), {'omit': 'description,lifestyles'})
+        self.assertNotIn('description', response.data['results'][0])
+        self.assertNotIn('lifestyles', response.data['results'][0])
+        self.assertIn('minimum_rent', response.data['results'][0])
+
+    def test_borough_list_api_cursor_pagination(self):
+        self.client.force_authenticate(user=self.user)
+        for i in range(4):
+            Borough.objects.create(
+                name=f'Borough {i}', minimum_rent=1000, latitude=52.52, longitude=13.40, geometry_coordinates=[]
+            )
+        response = self.client.get(reverse('borough-list'), {'page_size': 2, 'fields': 'id'})
+        ids = [item['id'] for item in response.data['results']]
+        self.assertIsNone(response.data['previous'])
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids += [item['id'] for item in response.data['results']]
+        self.assertEqual(ids, sorted(Borough.objects.values_list('id', flat=True)))
 
     def test_borough_detail_api_authenticated(self):
         self.client.force_authenticate(user=self.user)
         response = self.client.get(reverse('borough-detail', args=[self.borough.id]))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['name'], 'Test Borough')
+        self.assertIn('geometry_coordinates', response.data)
 
     def test_create_borough_api_authenticated(self):
         self.client.force_authenticate(user=self.user)
@@ -109,8 +160,13 @@ class NeighborhoodAPITestCase(APITestCase):
         self.client.force_authenticate(user=self.user)
         response = self.client.get(reverse('neighborhood-list'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], 'Test Neighborhood')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['name'], 'Test Neighborhood')
+
+    def test_neighborhood_list_api_sparse_fieldsets(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('neighborhood-list'), {'fields': 'name,borough'})
+        self.assertEqual(response.data['results'][0], {'name': 'Test Neighborhood', 'borough': self.borough.id})
 
     def test_neighborhood_detail_api_authenticated(self):
         self.client.force_authenticate(user=self.user)
@@ -168,6 +224,76 @@ class BoroughDataAPITestCase(TestCase):
         self.assertEqual(feature['properties']['name'], 'Test Borough')
         self.assertEqual(feature['properties']['slug'], 'test-borough')
 
+    def test_borough_data_api_etag(self):
+        response = self.client.get(reverse('borough_data_api'))
+        etag = response['ETag']
+        self.assertTrue(etag)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('borough_data_api'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Each level of detail has its own ETag
+        response = self.client.get(reverse('borough_data_api'), {'zoom': 10}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_borough_data_api_lifestyle_change_invalidates_cache(self):
+        self.client.get(reverse('borough_data_api'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('borough_data_api'))
+        etag = response['ETag']
+        self.assertEqual(response.json()['features'][0]['properties']['lifestyles'], [])
+
+        self.borough.lifestyles.add(Lifestyle.objects.create(name='Nightlife'))
+        response = self.client.get(reverse('borough_data_api'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['features'][0]['properties']['lifestyles'], ['Nightlife'])
+
+    def test_borough_data_api_change_elsewhere_shows_after_data_cache_ttl(self):
+        etag = self.client.get(reverse('borough_data_api'))['ETag']
+        # A queryset update sends no signals, like a change made by another worker
+        Borough.objects.filter(pk=self.borough.pk).update(minimum_rent=1200)
+        response = self.client.get(reverse('borough_data_api'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        later = time.time() + settings.DATA_CACHE_TTL + 1
+        with patch('time.time', return_value=later):
+            response = self.client.get(reverse('borough_data_api'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['features'][0]['properties']['minimum_rent'], 1200)
+
+    def test_borough_data_api_prefetches_lifestyles(self):
+        for i in range(3):
+            borough = Borough.objects.create(
+                name=f'Borough {i}',
+                minimum_rent=1000,
+                latitude=52.52,
+                longitude=13.40,
+                geometry_coordinates=[[[13.0, 52.0], [13.1, 52.0], [13.1, 52.1], [13.0, 52.0]]],
+            )
+            borough.lifestyles.add(Lifestyle.objects.get_or_create(name='Quiet')[0])
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('borough_data_api'))
+        self.assertEqual(len(response.json()['features']), 4)
+
+    def test_borough_data_api_tolerance(self):
+        ring = [[13.0 + 0.001 * i, 52.0] for i in range(100)]
+        ring += [[13.1, 52.1], [13.0, 52.1], [13.0, 52.0]]
+        self.borough.geometry_coordinates = [ring]
+        self.borough.save()
+
+        full = self.client.get(reverse('borough_data_api')).json()
+        simplified = self.client.get(reverse('borough_data_api'), {'tolerance': 0.001}).json()
+        self.assertEqual(full['features'][0]['geometry']['coordinates'], [ring])
+        self.assertEqual(len(simplified['features'][0]['geometry']['coordinates'][0]), 5)
+
+        # Saving the borough drops the cached simplified geometry
+        self.borough.geometry_coordinates = [[[13.0, 52.0], [13.2, 52.0], [13.2, 52.2], [13.0, 52.0]]]
+        self.borough.save()
+        simplified = self.client.get(reverse('borough_data_api'), {'tolerance': 0.001}).json()
+        self.assertEqual(len(simplified['features'][0]['geometry']['coordinates'][0]), 4)
+
 
 class NeighborhoodDataAPITestCase(TestCase):
     def setUp(self):
@@ -199,19 +325,21 @@ class NeighborhoodDataAPITestCase(TestCase):
                 }
             ],
         }
-        geojson_file_path = os.path.join(
-            settings.BASE_DIR, 'static', 'geojson', 'berlin_neighborhoods.geojson'
-        )
-        os.makedirs(os.path.dirname(geojson_file_path), exist_ok=True)
-        with open(geojson_file_path, 'w', encoding='utf-8') as f:
-            json.dump(self.geojson_data, f)
+        # A temporary file stands in for static/geojson/berlin_neighborhoods.geojson
+        handle, self.geojson_path = tempfile.mkstemp(suffix='.geojson')
+        os.close(handle)
+        self.write_geojson()
+        patcher = patch('neighborhoods.views.neighborhood_geojson', GeoJSONIndex(self.geojson_path))
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def tearDown(self):
-        geojson_file_path = os.path.join(
-            settings.BASE_DIR, 'static', 'geojson', 'berlin_neighborhoods.geojson'
-        )
-        if os.path.exists(geojson_file_path):
-            os.remove(geojson_file_path)
+        if os.path.exists(self.geojson_path):
+            os.remove(self.geojson_path)
+
+    def write_geojson(self):
+        with open(self.geojson_path, 'w', encoding='utf-8') as f:
+            json.dump(self.geojson_data, f)
 
     def test_neighborhood_data_api(self):
         response = self.client.get(reverse('neighborhood_data_api', args=[self.borough.slug]))
@@ -222,11 +350,298 @@ class NeighborhoodDataAPITestCase(TestCase):
         feature = data['features'][0]
         self.assertEqual(feature['properties']['name'], 'Test Neighborhood')
 
+    def test_neighborhood_data_api_serves_every_part_of_a_split_neighborhood(self):
+        second_part = {
+            "type": "Feature",
+            "properties": {"name": "Test Neighborhood"},
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [[[13.3, 52.0], [13.4, 52.0], [13.4, 52.1], [13.3, 52.1], [13.3, 52.0]]],
+            },
+        }
+        self.geojson_data['features'].append(second_part)
+        self.write_geojson()
+
+        url = reverse('neighborhood_data_api', args=[self.borough.slug])
+        for params in ({}, {'zoom': 9}):
+            features = self.client.get(url, params).json()['features']
+            self.assertEqual([feature['properties']['name'] for feature in features], ['Test Neighborhood'] * 2)
+            self.assertEqual(features[1]['geometry']['coordinates'][0][0], [13.3, 52.0])
+
+        locator = NeighborhoodLocator(GeoJSONIndex(self.geojson_path))
+        self.assertEqual(locator.locate([52.05, 52.05], [13.05, 13.35]), ['test neighborhood'] * 2)
+
     def test_neighborhood_data_api_no_geojson(self):
-        geojson_file_path = os.path.join(
-            settings.BASE_DIR, 'static', 'geojson', 'berlin_neighborhoods.geojson'
-        )
-        os.remove(geojson_file_path)
+        os.remove(self.geojson_path)
         response = self.client.get(reverse('neighborhood_data_api', args=[self.borough.slug]))
         self.assertEqual(response.status_code, 404)
         self.assertEqual(response.json()['error'], 'GeoJSON file not found.')
+
+    def test_neighborhood_data_api_reloads_when_file_changes(self):
+        response = self.client.get(reverse('neighborhood_data_api', args=[self.borough.slug]))
+        self.assertEqual(response.json()['features'][0]['properties']['name'], 'Test Neighborhood')
+
+        self.neighborhood.name = 'Renamed Neighborhood'
+        self.neighborhood.save()
+        self.geojson_data['features'][0]['properties']['name'] = '  renamed neighborhood '
+        self.write_geojson()
+
+        response = self.client.get(reverse('neighborhood_data_api', args=[self.borough.slug]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['features'][0]['properties']['name'], '  renamed neighborhood ')
+
+    def test_neighborhood_data_api_no_matching_features(self):
+        Neighborhood.objects.create(
+            name='Other Neighborhood',
+            borough=Borough.objects.create(
+                name='Other Borough',
+                slug='other-borough',
+                minimum_rent=900,
+                latitude=52.5,
+                longitude=13.4,
+                geometry_coordinates=[[[]]],
+            ),
+            latitude=52.5,
+            longitude=13.4,
+        )
+        response = self.client.get(reverse('neighborhood_data_api', args=['other-borough']))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['error'], 'No neighborhoods found for this borough.')
+
+    def test_neighborhood_data_api_simplifies_for_low_zoom(self):
+        # A circle-like polygon with many vertices that collapse at coarse levels
+        ring = [
+            [13.0 + 0.05 * math.cos(2 * math.pi * i / 400), 52.0 + 0.05 * math.sin(2 * math.pi * i / 400)]
+            for i in range(400)
+        ]
+        ring.append(ring[0])
+        self.geojson_data['features'][0]['geometry'] = {"type": "Polygon", "coordinates": [ring]}
+        self.write_geojson()
+
+        url = reverse('neighborhood_data_api', args=[self.borough.slug])
+        full = self.client.get(url).json()['features'][0]['geometry']['coordinates'][0]
+        coarse = self.client.get(url, {'zoom': 9}).json()['features'][0]['geometry']['coordinates'][0]
+        detailed = self.client.get(url, {'zoom': 17}).json()['features'][0]['geometry']['coordinates'][0]
+        self.assertEqual(len(full), 401)
+        self.assertEqual(len(detailed), 401)
+        self.assertLess(len(coarse), len(full) // 5)
+
+    def test_neighborhood_data_api_invalid_zoom_serves_full_resolution(self):
+        response = self.client.get(
+            reverse('neighborhood_data_api', args=[self.borough.slug]), {'zoom': 'far'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['features'][0]['geometry'],
+            self.geojson_data['features'][0]['geometry'],
+        )
+
+
+class LocateAPITestCase(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = UserModel.objects.create_user(username='apiuser', password='ComplexPass123')
+        self.borough = Borough.objects.create(
+            name='Test Borough',
+            slug='test-borough',
+            minimum_rent=1000,
+            latitude=52.5200,
+            longitude=13.4050,
+            geometry_coordinates=[[[]]],
+        )
+        self.west = Neighborhood.objects.create(
+            name='West', borough=self.borough, latitude=52.05, longitude=13.05, slug='west'
+        )
+        self.east = Neighborhood.objects.create(
+            name='East', borough=self.borough, latitude=52.05, longitude=13.15, slug='east'
+        )
+        geojson_data = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {"name": "West"},
+                    "geometry": {
+                        "type": "Polygon",
+                        "coordinates": [[[13.0, 52.0], [13.1, 52.0], [13.1, 52.1], [13.0, 52.1], [13.0, 52.0]]],
+                    },
+                },
+                {
+                    "type": "Feature",
+                    "properties": {"name": " east "},
+                    "geometry": {
+                        "type": "MultiPolygon",
+                        "coordinates": [[[[13.1, 52.0], [13.2, 52.0], [13.2, 52.1], [13.1, 52.1], [13.1, 52.0]]]],
+                    },
+                },
+            ],
+        }
+        handle, self.geojson_path = tempfile.mkstemp(suffix='.geojson')
+        with os.fdopen(handle, 'w', encoding='utf-8') as f:
+            json.dump(geojson_data, f)
+        locator = NeighborhoodLocator(GeoJSONIndex(self.geojson_path))
+        patcher = patch('neighborhoods.spatial.neighborhood_locator', locator)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        os.remove(self.geojson_path)
+
+    def test_locate_single_point(self):
+        response = self.client.get(reverse('locate_api'), {'lat': 52.05, 'lon': 13.15})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['neighborhood']['id'], self.east.id)
+        self.assertEqual(response.data['borough']['slug'], 'test-borough')
+
+    def test_locate_point_outside(self):
+        response = self.client.get(reverse('locate_api'), {'lat': 48.1, 'lon': 11.5})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['neighborhood'])
+        self.assertIsNone(response.data['borough'])
+
+    def test_locate_invalid_point(self):
+        response = self.client.get(reverse('locate_api'), {'lat': 'north', 'lon': 13.15})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_locate_batch(self):
+        points = [[52.05, 13.05], [52.05, 13.15], [52.05, 13.1], [10.0, 10.0]]
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('locate_api'), {'points': points}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [
+            result['neighborhood']['name'] if result['neighborhood'] else None
+            for result in response.data['results']
+        ]
+        # A point on the shared border resolves to the first polygon in the file
+        self.assertEqual(names, ['West', 'East', 'West', None])
+
+    def test_locate_batch_rejects_invalid_points(self):
+        response = self.client.post(
+            reverse('locate_api'), {'points': [[52.05, 13.05], [200, 13.0], 'x']}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['invalid_indexes'], [1, 2])
+
+    def test_locate_batch_too_large(self):
+        points = [[52.05, 13.05]] * (LOCATE_MAX_POINTS + 1)
+        response = self.client.post(reverse('locate_api'), {'points': points}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_locate_lookup_refreshes_after_rename(self):
+        self.client.get(reverse('locate_api'), {'lat': 52.05, 'lon': 13.05})
+        self.west.slug = 'west-side'
+        self.west.save()
+        response = self.client.get(reverse('locate_api'), {'lat': 52.05, 'lon': 13.05})
+        self.assertEqual(response.data['neighborhood']['slug'], 'west-side')
+
+    def test_locate_lookup_expires_after_data_cache_ttl(self):
+        self.client.get(reverse('locate_api'), {'lat': 52.05, 'lon': 13.05})
+        # A queryset update sends no signals, like a change made by another worker
+        Neighborhood.objects.filter(pk=self.west.pk).update(slug='west-side')
+        response = self.client.get(reverse('locate_api'), {'lat': 52.05, 'lon': 13.05})
+        self.assertEqual(response.data['neighborhood']['slug'], 'west')
+
+        later = time.time() + settings.DATA_CACHE_TTL + 1
+        with patch('time.time', return_value=later):
+            response = self.client.get(reverse('locate_api'), {'lat': 52.05, 'lon': 13.05})
+        self.assertEqual(response.data['neighborhood']['slug'], 'west-side')
+
+    def test_locate_unauthenticated(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.get(reverse('locate_api'), {'lat': 52.05, 'lon': 13.05})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class NeighborhoodExpandAPITestCase(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = UserModel.objects.create_user(username='apiuser', password='ComplexPass123')
+        self.client.force_authenticate(user=self.user)
+        self.boroughs = [
+            Borough.objects.create(
+                name=f'Borough {i}', minimum_rent=1000, latitude=52.52, longitude=13.40, geometry_coordinates=[]
+            )
+            for i in range(2)
+        ]
+        for borough in self.boroughs:
+            CrimeData.objects.create(
+                borough=borough,
+                total_crimes=100,
+                robbery=10,
+                total_assaults=20,
+                total_thefts=30,
+                total_residential_burglary=15,
+                total_arson_incidents=5,
+                total_vandalism=20,
+            )
+        self.add_neighborhoods(2)
+
+    def add_neighborhoods(self, count):
+        for _ in range(count):
+            borough = self.boroughs[Neighborhood.objects.count() % 2]
+            neighborhood = Neighborhood.objects.create(
+                name=f'Neighborhood {Neighborhood.objects.count()}',
+                borough=borough,
+                latitude=52.52,
+                longitude=13.40,
+            )
+            RentData.objects.create(
+                neighborhood=neighborhood,
+                borough=borough,
+                avg_price=1000,
+                min_price=500,
+                max_price=2000,
+                avg_size=50,
+                min_size=20,
+                max_size=120,
+            )
+            for amenity_type in ('Park', 'School'):
+                Amenities.objects.create(
+                    borough=borough, neighborhood=neighborhood, amenity_type=amenity_type, name='Amenity'
+                )
+            Transports.objects.create(borough=borough, neighborhood=neighborhood, type='U8', name='Station')
+
+    def test_expand_related_data(self):
+        response = self.client.get(
+            reverse('neighborhood-detail', args=[Neighborhood.objects.first().id]),
+            {'expand': 'rent,amenities,transports,crime,demographics'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['rent'][0]['avg_price'], 1000)
+        self.assertEqual([item['amenity_type'] for item in response.data['amenities']], ['Park', 'School'])
+        self.assertEqual(response.data['transports'][0]['type'], 'U8')
+        self.assertEqual(response.data['crime'][0]['total_crimes'], 100)
+        self.assertEqual(response.data['demographics'], [])
+
+    def test_unknown_expansions_are_ignored(self):
+        response = self.client.get(reverse('neighborhood-list'), {'expand': 'weather'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('weather', response.data['results'][0])
+        self.assertNotIn('rent', response.data['results'][0])
+
+    def test_expand_query_count_is_constant(self):
+        params = {'expand': 'rent,demographics,amenities,transports,crime', 'page_size': 500}
+        # Neighborhoods, one query per related table, and the boroughs for crime
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('neighborhood-list'), params)
+        self.assertEqual(len(response.data['results']), 2)
+
+        self.add_neighborhoods(20)
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('neighborhood-list'), params)
+        self.assertEqual(len(response.data['results']), 22)
+
+    def test_expand_crime_does_not_read_borough_polygons(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('neighborhood-list'), {'expand': 'crime'})
+        self.assertEqual(response.data['results'][0]['crime'][0]['total_crimes'], 100)
+        borough_queries = [query['sql'] for query in queries
+                           if 'FROM "neighborhoods_borough"' in query['sql']]
+        self.assertEqual(len(borough_queries), 1)
+        self.assertNotIn('geometry_coordinates', borough_queries[0])
+
+    def test_expand_with_sparse_fieldset(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('neighborhood-list'), {'fields': 'name', 'expand': 'crime'})
+        self.assertEqual(set(response.data['results'][0]), {'name', 'crime'})
@@ -0,0 +1,915 @@
+import asyncio
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from unittest.mock import PropertyMock, patch
+
+from django.core.cache import cache
+from django.core.cache.backends.redis import RedisCache
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+
+from neighborhoods.chat.breaker import (
+    CircuitBreaker,
+    PROVIDER_GUARDS,
+    ProviderGuard,
+    ProviderTimeout,
+    ProviderUnavailable,
+    provider_guard,
+)
+from neighborhoods.chat.cache import TTLCache
+from neighborhoods.chat.facts import CHAT_FACTS_CACHE_KEY, answer_data_question, fold
+from neighborhoods.chat.knowledge import KnowledgeBaseLoader, validate_source
+from neighborhoods.chat.matching import AhoCorasick, DialogMatcher, ResponseMatcher
+from neighborhoods.chat.pipeline import first_answer
+from neighborhoods.chat.prompts import PromptCache, normalize_prompt, prompt_cache_key
+from neighborhoods.chat.state import CacheConversationStore, Conversation, LocMemConversationStore
+from neighborhoods.chat.weather import WEATHER_ERROR_MESSAGE, WEATHER_PROBLEM_MESSAGE, WeatherProvider
+from neighborhoods.chat.wiki import WikipediaProvider, normalize_query
+from neighborhoods.metrics import REGISTRY, chat_cache_events, chat_upstream_requests
+from neighborhoods.models import Amenities, Borough, CrimeData, Demographics, Neighborhood, RentData, Transports
+from neighborhoods.stats import DEMOGRAPHICS_FIELDS
+from neighborhoods.management.commands.benchmark_dialog_matcher import WORDS, linear_match
+
+
+class AhoCorasickTest(SimpleTestCase):
+    def test_finds_overlapping_patterns(self):
+        automaton = AhoCorasick(['he', 'she', 'his', 'hers'])
+        self.assertEqual(sorted(automaton.iter_matches('ushers')), [0, 1, 3])
+        self.assertEqual(automaton.first_match('ushers'), 0)
+        self.assertEqual(automaton.first_match('this'), 2)
+        self.assertIsNone(automaton.first_match('xyz'))
+
+
+class DialogMatcherTest(SimpleTestCase):
+    def setUp(self):
+        self.dialogs = [
+            {'user': 'hi', 'bot': 'Hi there!'},
+            {'user': 'weather', 'bot': 'Which city?'},
+            {'user': ' Tell me a fun fact ', 'bot': 'Honey never spoils.'},
+            {'user': 'fun fact', 'bot': 'Octopuses have three hearts.'},
+            {'bot': 'Missing user text is skipped'},
+        ]
+        self.matcher = DialogMatcher(self.dialogs)
+
+    def test_exact_match_wins(self):
+        self.assertEqual(self.matcher.match('TELL ME A FUN FACT')['bot'], 'Honey never spoils.')
+        self.assertEqual(self.matcher.match('fun fact')['bot'], 'Octopuses have three hearts.')
+
+    def test_first_partial_match_in_file_order(self):
+        # 'hi' occurs inside 'this', and comes before 'fun fact' in the file
+        self.assertEqual(self.matcher.match('this weather fun fact')['bot'], 'Hi there!')
+        self.assertEqual(self.matcher.match('a fun fact about the weather')['bot'], 'Which city?')
+        self.assertIsNone(self.matcher.match('good morning'))
+        self.assertEqual(len(self.matcher), 4)
+
+    def test_empty_pattern_matches_everything(self):
+        matcher = DialogMatcher([{'user': 'weather', 'bot': 'a'}, {'user': '', 'bot': 'b'}])
+        self.assertEqual(matcher.match('weather today')['bot'], 'a')
+        self.assertEqual(matcher.match('anything')['bot'], 'b')
+
+    def test_agrees_with_linear_scan(self):
+        rng = random.Random(7)
+        dialogs = [{'user': ' '.join(rng.choices(WORDS, k=rng.randint(1, 2))), 'bot': str(i)} for i in range(300)]
+        matcher = DialogMatcher(dialogs)
+        for _ in range(300):
+            message = ' '.join(rng.choices(WORDS, k=rng.randint(1, 8)))
+            self.assertIs(matcher.match(message), linear_match(dialogs, message))
+
+
+class ResponseMatcherTest(SimpleTestCase):
+    def setUp(self):
+        self.matcher = ResponseMatcher([
+            ('factual', {'What is the population of Berlin?': 'About 3.7 million.'}, 80),
+            ('website', {'How do I search for neighborhoods?': 'Use the search bar.'}, 70),
+        ])
+
+    def test_factual_match(self):
+        self.assertEqual(self.matcher.match('what is the population of berlin'), 'About 3.7 million.')
+
+    def test_website_match_and_source_filter(self):
+        self.assertEqual(self.matcher.match('How can I search neighborhoods?'), 'Use the search bar.')
+        self.assertIsNone(self.matcher.match('population of berlin', sources=('website',)))
+
+    def test_factual_threshold_checked_before_website(self):
+        matcher = ResponseMatcher([
+            ('factual', {'rent prices in berlin': 'factual'}, 80),
+            ('website', {'rent prices in berlin': 'website'}, 70),
+        ])
+        self.assertEqual(matcher.match('Rent prices in Berlin?'), 'factual')
+
+    def test_no_match(self):
+        self.assertIsNone(self.matcher.match('completely unrelated gibberish words'))
+        self.assertIsNone(self.matcher.match(''))
+        self.assertIsNone(ResponseMatcher([('factual', None, 80)]).match('anything'))
+
+    def test_agrees_with_fuzzywuzzy(self):
+        from fuzzywuzzy import fuzz, process
+        rng = random.Random(7)
+        responses = {' '.join(rng.choices(WORDS, k=4)) + f' {i}': i for i in range(200)}
+        matcher = ResponseMatcher([('factual', responses, 0)])
+        for _ in range(100):
+            message = ' '.join(rng.choices(WORDS, k=rng.randint(2, 6)))
+            _, expected = process.extractOne(message, responses.keys(), scorer=fuzz.token_set_ratio)
+            best = [key for key, value in responses.items() if value == matcher.match(message)][0]
+            # fuzzywuzzy rounds its scores, so ties may resolve to different keys
+            self.assertEqual(fuzz.token_set_ratio(message, best), expected)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TTLCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_entries_expire(self):
+        cache = TTLCache(clock=self.clock)
+        cache.set('a', 1, ttl=10)
+        self.assertEqual(cache.get('a'), 1)
+        self.clock.now += 10
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TTLCache(max_entries=2, clock=self.clock)
+        cache.set('a', 1, ttl=10)
+        cache.set('b', 2, ttl=10)
+        cache.get('a')
+        cache.set('c', 3, ttl=10)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_persists_to_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.json')
+            cache = TTLCache(path=path, clock=self.clock)
+            cache.set('fresh', 'kept', ttl=100)
+            cache.set('stale', 'dropped', ttl=5)
+            cache.save()
+
+            self.clock.now += 10
+            restored = TTLCache(path=path, clock=self.clock)
+            self.assertEqual(restored.get('fresh'), 'kept')
+            self.assertIsNone(restored.get('stale'))
+
+    def test_unreadable_file_is_ignored(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.json')
+            with open(path, 'w') as f:
+                f.write('not json')
+            with self.assertLogs('neighborhoods.chat.cache', 'WARNING'):
+                cache = TTLCache(path=path)
+            self.assertEqual(len(cache), 0)
+
+
+class DisambiguationError(Exception):
+    def __init__(self, options):
+        super().__init__(options)
+        self.options = options
+
+
+class PageError(Exception):
+    pass
+
+
+class StubWikipedia:
+    """Stands in for the wikipedia package and records every lookup."""
+
+    exceptions = types.SimpleNamespace(DisambiguationError=DisambiguationError, PageError=PageError)
+
+    def __init__(self):
+        self.calls = []
+
+    def summary(self, query, sentences=2):
+        self.calls.append(query)
+        if query == 'mercury':
+            raise DisambiguationError(['Mercury (planet)', 'Mercury (element)', 'Freddie Mercury', 'Mercury Records'])
+        if query == 'nowhere':
+            raise PageError(query)
+        if query == 'offline':
+            raise ConnectionError('network down')
+        if query == 'hanging':
+            time.sleep(1)
+        return f'{query} summary'
+
+
+class WikipediaProviderTest(SimpleTestCase):
+    def setUp(self):
+        self.client = StubWikipedia()
+        self.clock = FakeClock()
+        self.provider = WikipediaProvider(
+            client=self.client, cache=TTLCache(clock=self.clock), ttl=100, negative_ttl=10,
+        )
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query('  Tell me about   Berlin  '), 'berlin')
+
+    def test_summaries_are_cached_by_normalized_query(self):
+        self.assertEqual(self.provider.summary('tell me about Berlin'), 'berlin summary')
+        self.assertEqual(self.provider.summary('berlin'), 'berlin summary')
+        self.assertEqual(self.client.calls, ['berlin'])
+
+        self.clock.now += 100
+        self.provider.summary('berlin')
+        self.assertEqual(self.client.calls, ['berlin', 'berlin'])
+
+    def test_misses_and_disambiguations_use_negative_ttl(self):
+        with self.assertLogs(level='WARNING'):
+            self.assertIn('Mercury (planet)', self.provider.summary('mercury'))
+        self.assertIn("couldn't find", self.provider.summary('nowhere'))
+        self.provider.summary('mercury')
+        self.provider.summary('nowhere')
+        self.assertEqual(self.client.calls, ['mercury', 'nowhere'])
+
+        self.clock.now += 10
+        with self.assertLogs(level='WARNING'):
+            self.provider.summary('mercury')
+        self.assertEqual(self.client.calls, ['mercury', 'nowhere', 'mercury'])
+
+    def test_unexpected_errors_are_not_cached(self):
+        with self.assertLogs(level='ERROR'):
+            self.assertIn('problem retrieving', self.provider.summary('offline'))
+        with self.assertLogs(level='ERROR'):
+            self.provider.summary('offline')
+        self.assertEqual(self.client.calls, ['offline', 'offline'])
+
+    def test_guard_skips_failing_wikipedia(self):
+        guard = ProviderGuard('wikipedia', timeout=0.2, breaker=CircuitBreaker('wikipedia', min_calls=2))
+        provider = WikipediaProvider(client=self.client, cache=TTLCache(clock=self.clock), guard=guard)
+        with self.assertLogs(level='WARNING'):
+            self.assertIsNone(provider.summary('hanging'))
+            self.assertIn('problem retrieving', provider.summary('offline'))
+            self.assertIsNone(provider.summary('berlin'))
+        self.assertEqual(self.client.calls, ['hanging', 'offline'])
+
+    def test_cache_and_upstream_metrics(self):
+        chat_cache_events.clear()
+        chat_upstream_requests.clear()
+        self.provider.summary('berlin')
+        self.provider.summary('berlin')
+        self.provider.summary('nowhere')
+        with self.assertLogs(level='ERROR'):
+            self.provider.summary('offline')
+
+        self.assertEqual(chat_cache_events.value(cache='wikipedia', result='hit'), 1)
+        self.assertEqual(chat_cache_events.value(cache='wikipedia', result='miss'), 3)
+        self.assertEqual(chat_upstream_requests.value(provider='wikipedia', status='ok'), 1)
+        self.assertEqual(chat_upstream_requests.value(provider='wikipedia', status='not_found'), 1)
+        self.assertEqual(chat_upstream_requests.value(provider='wikipedia', status='error'), 1)
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker('test', failure_rate=0.5, min_calls=4, window=60, open_seconds=30,
+                                      clock=self.clock)
+
+    def test_opens_on_failure_rate(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        # Too few calls to judge yet
+        self.assertEqual(self.breaker.state, 'closed')
+
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, 'closed')
+        with self.assertLogs('neighborhoods.chat.breaker', 'WARNING'):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertFalse(self.breaker.allow())
+
+    def test_old_outcomes_leave_the_window(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.clock.now += 61
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def open(self):
+        with self.assertLogs('neighborhoods.chat.breaker', 'WARNING'):
+            for _ in range(4):
+                self.breaker.record_failure()
+            self.clock.now += 30
+            self.assertEqual(self.breaker.state, 'half_open')
+
+    def test_half_open_success_closes(self):
+        self.open()
+        self.assertTrue(self.breaker.allow())
+        # Only one trial call at a time
+        self.assertFalse(self.breaker.allow())
+        with self.assertLogs('neighborhoods.chat.breaker', 'INFO'):
+            self.breaker.record_success()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.assertTrue(self.breaker.allow())
+
+    def test_half_open_failure_reopens(self):
+        self.open()
+        self.assertTrue(self.breaker.allow())
+        with self.assertLogs('neighborhoods.chat.breaker', 'WARNING'):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        self.clock.now += 29
+        self.assertFalse(self.breaker.allow())
+
+    def test_lost_trial_is_retried(self):
+        self.open()
+        self.assertTrue(self.breaker.allow())
+        self.clock.now += 30
+        self.assertTrue(self.breaker.allow())
+
+    def test_state_is_exported(self):
+        guard = provider_guard('test-provider', 1)
+        self.addCleanup(PROVIDER_GUARDS.pop, 'test-provider')
+        self.assertIn('chat_circuit_state{provider="test-provider"} 0', REGISTRY.render())
+        with self.assertLogs('neighborhoods.chat.breaker', 'WARNING'):
+            for _ in range(guard.breaker.min_calls):
+                guard.breaker.record_failure()
+        self.assertIn('chat_circuit_state{provider="test-provider"} 2', REGISTRY.render())
+
+
+class ProviderGuardTest(SimpleTestCase):
+    def test_timeout(self):
+        guard = ProviderGuard('test', timeout=0.1)
+        start = time.monotonic()
+        with self.assertRaises(ProviderTimeout):
+            guard.call(time.sleep, 0.5)
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(guard.call(lambda value: value * 2, 21), 42)
+
+    def test_stuck_calls_fail_fast(self):
+        guard = ProviderGuard('test', timeout=0.05, max_concurrency=1)
+        with self.assertRaises(ProviderTimeout):
+            guard.call(time.sleep, 0.5)
+        # The abandoned call still holds the only slot
+        with self.assertRaisesMessage(ProviderUnavailable, 'still running'):
+            guard.call(lambda: 'unused')
+
+    def test_failures_open_the_circuit(self):
+        guard = ProviderGuard('test', timeout=1, breaker=CircuitBreaker('test', min_calls=2))
+        with self.assertRaises(ConnectionError):
+            guard.call(slow(None, error=ConnectionError('down')))
+        with self.assertLogs('neighborhoods.chat.breaker', 'WARNING'):
+            guard.call(lambda: 503, failed=lambda status: status >= 500)
+        with self.assertRaisesMessage(ProviderUnavailable, 'open'):
+            guard.call(lambda: 'unused')
+
+
+class WeatherAPIStandIn(BaseHTTPRequestHandler):
+    """Local replacement for weatherapi.com; the server object carries the scripted behaviour."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            temp = server.temperatures[min(server.requests, len(server.temperatures)) - 1]
+        time.sleep(server.delay)
+        body = json.dumps({'current': {
+            'temp_c': temp, 'condition': {'text': 'Sunny'}, 'humidity': 40, 'wind_kph': 10,
+        }}).encode()
+        self.send_response(server.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WeatherProviderTest(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), WeatherAPIStandIn)
+        self.server.lock = threading.Lock()
+        self.server.requests = 0
+        self.server.temperatures = [20, 21, 22]
+        self.server.delay = 0
+        self.server.status = 200
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.clock = FakeClock()
+        self.provider = WeatherProvider(
+            api_key='test', url=f'http://127.0.0.1:{self.server.server_port}/v1/current.json',
+            ttl=60, stale_ttl=600, timeout=(1, 0.5), clock=self.clock,
+        )
+
+    def test_fresh_report_is_served_from_cache(self):
+        self.assertIn('20°C with Sunny', self.provider.current())
+        self.assertIn('20°C', self.provider.current())
+        self.assertEqual(self.server.requests, 1)
+
+    def test_stale_report_is_served_while_revalidating(self):
+        self.provider.current()
+        self.clock.now += 60
+        self.assertIn('20°C', self.provider.current())
+        self.assertIn('20°C', self.provider.current())
+        self.provider.join(5)
+        self.assertEqual(self.server.requests, 2)
+        self.assertIn('21°C', self.provider.current())
+
+    def test_expired_report_is_fetched_synchronously(self):
+        self.provider.current()
+        self.clock.now += 600
+        self.assertIn('21°C', self.provider.current())
+
+    def test_concurrent_callers_share_one_fetch(self):
+        self.server.delay = 0.2
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.provider.current())) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(len(set(results)), 1)
+
+    def test_read_timeout(self):
+        self.server.delay = 1
+        start = time.monotonic()
+        with self.assertLogs(level='ERROR'):
+            self.assertEqual(self.provider.current(), WEATHER_PROBLEM_MESSAGE)
+        self.assertLess(time.monotonic() - start, 0.9)
+
+    def test_errors_are_not_cached(self):
+        self.server.status = 503
+        with self.assertLogs(level='ERROR'):
+            self.assertEqual(self.provider.current(), WEATHER_ERROR_MESSAGE)
+        self.server.status = 200
+        self.assertIn('21°C', self.provider.current())
+
+    def test_missing_api_key(self):
+        provider = WeatherProvider(url=self.provider.url)
+        with patch.dict(os.environ, {'WEATHER_API_KEY': ''}), self.assertLogs(level='ERROR'):
+            self.assertEqual(provider.current(), 'Weather API key is not configured.')
+        self.assertEqual(self.server.requests, 0)
+
+    def guarded_provider(self, timeout=5):
+        breaker = CircuitBreaker('weather', min_calls=2, open_seconds=30, clock=self.clock)
+        return WeatherProvider(api_key='test', url=self.provider.url, timeout=(1, 2), clock=self.clock,
+                               guard=ProviderGuard('weather', timeout, breaker))
+
+    def test_server_errors_open_the_circuit(self):
+        provider = self.guarded_provider()
+        self.server.status = 503
+        with self.assertLogs(level='ERROR'):
+            provider.current()
+            provider.current()
+        self.assertEqual(provider.guard.breaker.state, 'open')
+
+        # Open: no request is made and chat moves on to the next provider
+        with self.assertLogs(level='WARNING'):
+            self.assertIsNone(provider.current())
+        self.assertEqual(self.server.requests, 2)
+
+        # Half-open after open_seconds: one trial request, which closes the circuit again
+        self.server.status = 200
+        self.clock.now += 30
+        self.assertIn('°C', provider.current())
+        self.assertEqual(provider.guard.breaker.state, 'closed')
+
+    def test_guard_timeout_bounds_slow_responses(self):
+        # The read timeout applies per socket read; the guard bounds the request as a whole
+        provider = self.guarded_provider(timeout=0.2)
+        self.server.delay = 0.6
+        start = time.monotonic()
+        with self.assertLogs(level='WARNING'):
+            self.assertIsNone(provider.current())
+        self.assertLess(time.monotonic() - start, 0.5)
+
+
+class LocMemConversationStoreTest(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = LocMemConversationStore(max_sessions=2, idle_ttl=60, clock=self.clock)
+
+    def test_history_is_capped(self):
+        for i in range(3):
+            self.store.append_exchange('a', f'question {i}', f'answer {i}')
+        self.assertEqual(self.store.recent_messages('a'), [
+            'User: question 1', 'Bot: answer 1', 'User: question 2', 'Bot: answer 2',
+        ])
+        self.assertEqual(self.store.recent_messages('missing'), [])
+
+    def test_state_and_name(self):
+        self.store.set_state('a', 'ask_budget')
+        self.store.set_name('a', 'Alex')
+        self.assertEqual(self.store.get('a'), Conversation('ask_budget', (), 'Alex'))
+        self.assertEqual(self.store.get_name('a'), 'Alex')
+        self.assertIsNone(self.store.get_name('b'))
+
+    def test_changes_only_land_through_save(self):
+        self.store.set_name('a', 'Alex')
+        self.store.get('a').name = 'Sam'
+        self.assertEqual(self.store.get_name('a'), 'Alex')
+
+    def test_least_recently_used_session_is_evicted(self):
+        self.store.set_name('a', 'A')
+        self.store.set_name('b', 'B')
+        self.store.get('a')
+        self.store.set_name('c', 'C')
+        self.assertNotIn('b', self.store)
+        self.assertIn('a', self.store)
+        self.assertEqual(self.store.stats(), {'sessions': 2, 'evictions': 1, 'expirations': 0})
+
+    def test_idle_sessions_expire(self):
+        self.store.set_name('a', 'A')
+        self.clock.now += 30
+        self.store.set_name('b', 'B')
+        self.clock.now += 30
+        self.assertNotIn('a', self.store)
+        self.assertIn('b', self.store)
+        self.assertEqual(self.store.stats(), {'sessions': 1, 'evictions': 0, 'expirations': 1})
+
+
+class CacheConversationStoreTest(SimpleTestCase):
+    def setUp(self):
+        self.store = CacheConversationStore(key_prefix='test:conversation:')
+        self.addCleanup(self.store.cache.clear)
+
+    def test_shared_through_cache(self):
+        self.store.append_exchange('a', 'hello', 'hi')
+        self.store.set_name('a', 'Alex')
+        other_worker = CacheConversationStore(key_prefix='test:conversation:')
+        self.assertEqual(other_worker.get('a'), Conversation(None, ('User: hello', 'Bot: hi'), 'Alex'))
+
+        other_worker.delete('a')
+        self.assertNotIn('a', self.store)
+
+    def test_clear_drops_every_conversation(self):
+        self.store.set_name('a', 'Alex')
+        self.store.set_name('b', 'Sam')
+        unrelated = CacheConversationStore(key_prefix='test:other:')
+        unrelated.set_name('a', 'Kim')
+
+        CacheConversationStore(key_prefix='test:conversation:').clear()
+        self.assertNotIn('a', self.store)
+        self.assertNotIn('b', self.store)
+        self.assertEqual(unrelated.get_name('a'), 'Kim')
+
+        self.store.set_name('a', 'Alex')
+        self.assertEqual(self.store.get_name('a'), 'Alex')
+
+    def test_stats_count_this_process_traffic(self):
+        self.store.append_exchange('a', 'hello', 'hi')
+        self.store.get('a')
+        self.store.delete('a')
+        self.assertEqual(self.store.stats(), {
+            'sessions': None, 'evictions': None, 'expirations': None,
+            'hits': 1, 'misses': 1, 'writes': 1, 'deletes': 1,
+        })
+
+    def test_stats_report_redis_evictions(self):
+        client = types.SimpleNamespace(info=lambda section: {'evicted_keys': 7})
+        redis = RedisCache('redis://localhost:6379', {})
+        redis._cache = types.SimpleNamespace(get_client=lambda write: client)
+        with patch.object(CacheConversationStore, 'cache', new_callable=PropertyMock, return_value=redis):
+            self.assertEqual(self.store.stats()['evictions'], 7)
+
+
+def slow(answer, delay=0.0, error=None):
+    """A blocking provider stub that sleeps before answering or failing."""
+    def provider():
+        time.sleep(delay)
+        if error:
+            raise error
+        return answer
+    return provider
+
+
+class FirstAnswerTest(SimpleTestCase):
+    def run_providers(self, providers, deadline=2):
+        async def timed():
+            # Timed inside the loop: asyncio.run also waits for abandoned provider threads on exit
+            start = time.monotonic()
+            result = await first_answer(providers, deadline)
+            return result, time.monotonic() - start
+        return asyncio.run(timed())
+
+    def test_higher_priority_answer_wins(self):
+        result, elapsed = self.run_providers([
+            ('ai', slow('ai answer', 0.2), 1),
+            ('wikipedia', slow('wiki answer'), 1),
+        ])
+        self.assertEqual(result, ('ai', 'ai answer'))
+
+    def test_providers_run_concurrently(self):
+        result, elapsed = self.run_providers([
+            ('ai', slow(None, 0.3), 1),
+            ('wikipedia', slow('wiki answer', 0.3), 1),
+        ])
+        self.assertEqual(result, ('wikipedia', 'wiki answer'))
+        self.assertLess(elapsed, 0.55)
+
+    def test_failed_and_timed_out_providers_are_skipped(self):
+        with self.assertLogs('neighborhoods.chat.pipeline') as logs:
+            result, elapsed = self.run_providers([
+                ('weather', slow('weather', error=ValueError('boom')), 1),
+                ('ai', slow('ai answer', 1), 0.1),
+                ('wikipedia', slow('wiki answer', 0.05), 1),
+            ])
+        self.assertEqual(result, ('wikipedia', 'wiki answer'))
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(len(logs.records), 2)
+
+    def test_deadline_returns_best_answer_so_far(self):
+        with self.assertLogs('neighborhoods.chat.pipeline', 'WARNING'):
+            result, elapsed = self.run_providers([
+                ('ai', slow('ai answer', 1), 5),
+                ('wikipedia', slow('wiki answer'), 5),
+            ], deadline=0.2)
+        self.assertEqual(result, ('wikipedia', 'wiki answer'))
+        self.assertLess(elapsed, 0.5)
+
+    def test_no_answer(self):
+        result, _ = self.run_providers([('ai', slow(None), 1), ('wikipedia', slow(''), 1)])
+        self.assertEqual(result, (None, None))
+
+
+class PromptCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = PromptCache(ttl=60, clock=self.clock)
+        self.calls = 0
+
+    def generate(self, answer='answer', latency=2.0):
+        def generate():
+            self.calls += 1
+            self.clock.now += latency
+            return answer
+        return generate
+
+    def test_near_identical_questions_share_a_key(self):
+        self.assertEqual(normalize_prompt("What is the cheapest borough?"), "what is cheapest borough")
+        self.assertEqual(prompt_cache_key("What is the  cheapest borough?", []),
+                         prompt_cache_key("what is a cheapest borough", []))
+        self.assertNotEqual(prompt_cache_key("cheapest borough", []), prompt_cache_key("cheapest borough", ["User: hi"]))
+
+    def test_different_questions_do_not_share_a_key(self):
+        for first, second in (("Rent in Mitte", "Rent to Mitte"), ("Can I rent in Mitte?", "Do I rent in Mitte?")):
+            self.assertNotEqual(prompt_cache_key(first, []), prompt_cache_key(second, []), (first, second))
+
+    def test_hits_and_saved_latency(self):
+        self.assertEqual(self.cache.get_or_generate('k', self.generate()), 'answer')
+        self.assertEqual(self.cache.get_or_generate('k', self.generate()), 'answer')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.cache.stats(), {
+            'entries': 1, 'hits': 1, 'misses': 1, 'coalesced': 0, 'hit_rate': 0.5, 'saved_seconds': 2.0,
+        })
+
+        self.clock.now += 60
+        self.cache.get_or_generate('k', self.generate())
+        self.assertEqual(self.calls, 2)
+
+    def test_failures_are_not_cached(self):
+        self.assertIsNone(self.cache.get_or_generate('k', self.generate(None)))
+        self.assertEqual(self.cache.get_or_generate('k', self.generate()), 'answer')
+        self.assertEqual(self.calls, 2)
+
+    def test_concurrent_identical_prompts_are_coalesced(self):
+        cache = PromptCache()
+        started = threading.Event()
+
+        def generate():
+            self.calls += 1
+            started.set()
+            time.sleep(0.2)
+            return 'shared'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(cache.get_or_generate('k', generate)))
+        leader.start()
+        started.wait(1)
+        time.sleep(0.1)
+        followers = [threading.Thread(target=lambda: results.append(cache.get_or_generate('k', generate)))
+                     for _ in range(4)]
+        for thread in followers:
+            thread.start()
+        for thread in [leader] + followers:
+            thread.join()
+
+        self.assertEqual(results, ['shared'] * 5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(cache.stats()['coalesced'], 4)
+        # Followers joined halfway through the 0.2s call, saving roughly the other half
+        self.assertGreater(cache.stats()['saved_seconds'], 0.05 * 4)
+
+
+class DataAnswerTest(TestCase):
+    def setUp(self):
+        cache.delete(CHAT_FACTS_CACHE_KEY)
+        self.addCleanup(cache.delete, CHAT_FACTS_CACHE_KEY)
+        xberg = self.borough('Friedrichshain-Kreuzberg', crimes=100000)
+        pankow = self.borough('Pankow', crimes=60000)
+        self.neighborhood('Kreuzberg', xberg, rent=1400, schools=2, population=150000, foreigners=45000)
+        self.neighborhood('Friedrichshain', xberg, rent=1300, schools=1, population=130000, foreigners=26000)
+        self.neighborhood('Prenzlauer Berg', pankow, rent=1200, schools=3, population=160000, foreigners=16000)
+        self.neighborhood('Pankow', pankow, rent=950, schools=4, population=60000, foreigners=6000)
+
+    def borough(self, name, crimes):
+        borough = Borough.objects.create(name=name, minimum_rent=500, latitude=52.5, longitude=13.4,
+                                         geometry_coordinates=[])
+        CrimeData.objects.create(borough=borough, total_crimes=crimes, robbery=crimes // 100, total_assaults=0,
+                                 total_thefts=crimes // 2, total_residential_burglary=0, total_arson_incidents=0,
+                                 total_vandalism=0)
+        return borough
+
+    def neighborhood(self, name, borough, rent, schools, population, foreigners):
+        neighborhood = Neighborhood.objects.create(name=name, borough=borough, latitude=52.5, longitude=13.4)
+        RentData.objects.create(neighborhood=neighborhood, borough=borough, avg_price=rent, min_price=rent - 500,
+                                max_price=rent + 1000, avg_size=60, min_size=20, max_size=120)
+        for i in range(schools):
+            Amenities.objects.create(neighborhood=neighborhood, borough=borough, amenity_type='Primary Schools',
+                                     name=f'School {i}')
+        Amenities.objects.create(neighborhood=neighborhood, borough=borough, amenity_type='Park', name='Park')
+        Transports.objects.create(neighborhood=neighborhood, borough=borough, type='U8', name=f'{name} Station')
+        Transports.objects.create(neighborhood=neighborhood, borough=borough, type='TRAM M10', name=f'{name} Station')
+        demographics = dict.fromkeys(DEMOGRAPHICS_FIELDS, 0)
+        demographics.update(total=population, foreigners=foreigners)
+        Demographics.objects.create(neighborhood=neighborhood, borough=borough, **demographics)
+
+    def test_fold(self):
+        self.assertEqual(fold('Neukölln Weißensee'), 'neukolln weissensee')
+
+    def test_neighborhood_rent(self):
+        self.assertEqual(
+            answer_data_question('average rent in kreuzberg'),
+            "Kreuzberg has an average rent of €1,400 per month (listings from €900 to €2,400).",
+        )
+
+    def test_borough_wins_over_neighborhood_of_the_same_name(self):
+        self.assertEqual(answer_data_question('how many schools in pankow'), "Pankow has 7 schools.")
+
+    def test_misspelled_names_are_matched(self):
+        self.assertEqual(answer_data_question('how many schools in prenzlaur berg'), "Prenzlauer Berg has 3 schools.")
+
+    def test_crime_for_a_neighborhood_uses_its_borough(self):
+        self.assertEqual(
+            answer_data_question('how many thefts in friedrichshain'),
+            "Crime figures are kept per borough: Friedrichshain-Kreuzberg, which includes Friedrichshain, "
+            "has 50,000 recorded thefts.",
+        )
+
+    def test_rankings(self):
+        self.assertEqual(
+            answer_data_question('which borough has the fewest crimes'),
+            "Pankow has the lowest figure of all 2 boroughs with 60,000 recorded crimes.",
+        )
+        self.assertIn("Pankow has the lowest figure of all 4 neighborhoods",
+                      answer_data_question('what is the cheapest neighborhood'))
+        self.assertIn("Friedrichshain-Kreuzberg has the highest figure",
+                      answer_data_question('which borough is the most expensive'))
+
+    def test_stations_and_population(self):
+        self.assertEqual(answer_data_question('how many public transport stations are in kreuzberg'),
+                         "Kreuzberg has 1 public transport stations.")
+        self.assertEqual(answer_data_question('how many foreigners live in kreuzberg'),
+                         "Kreuzberg has 45,000 foreign residents (30.0% of the population).")
+
+    def test_other_questions_fall_through(self):
+        for message in ('hi', 'tell me about kreuzberg', 'i want a cheap flat', 'what is the weather like'):
+            self.assertIsNone(answer_data_question(message), message)
+
+    def test_metric_words_alone_fall_through(self):
+        for message in ('what is the most famous museum in berlin', 'how do i get to mitte by public transport',
+                        'which borough is most popular with young people', 'public transport in kreuzberg',
+                        'is kreuzberg safe at night'):
+            self.assertIsNone(answer_data_question(message), message)
+
+    def test_ranking_within_a_borough(self):
+        self.assertIn("Friedrichshain has the lowest figure of all 2 neighborhoods in Friedrichshain-Kreuzberg",
+                      answer_data_question('what is the cheapest neighborhood in friedrichshain-kreuzberg'))
+
+    def test_fact_table_is_cached_and_invalidated(self):
+        answer_data_question('average rent in kreuzberg')
+        with self.assertNumQueries(0):
+            answer_data_question('average rent in kreuzberg')
+        RentData.objects.filter(neighborhood__name='Kreuzberg').update(avg_price=2000)
+        Neighborhood.objects.get(name='Kreuzberg').save()
+        self.assertIn('€2,000', answer_data_question('average rent in kreuzberg'))
+
+
+class KnowledgeBaseLoaderTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.data_dir = directory.name
+        self.write('website_responses.yaml', 'How do I search?: Use the search bar.\n')
+        self.write('factual_responses.yaml', 'What is the population of Berlin?: About 3.7 million.\n')
+        self.write('dialog.yaml', 'dialogs:\n  - user: hello\n    bot: Hi there!\n')
+        self.clock = FakeClock()
+        self.loader = KnowledgeBaseLoader(self.data_dir, check_interval=2, clock=self.clock)
+
+    def write(self, filename, content):
+        path = os.path.join(self.data_dir, filename)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        # Make sure the change is visible even on filesystems with coarse mtimes
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    def test_validate_source(self):
+        self.assertEqual(validate_source('website', {'q': 'a'}), [])
+        self.assertEqual(validate_source('factual', None), [])
+        self.assertTrue(validate_source('factual', ['not', 'a', 'mapping']))
+        self.assertTrue(validate_source('website', {'q': ['a']}))
+        self.assertTrue(validate_source('dialog', {'dialogs': [{'user': 'hi'}]}))
+        self.assertTrue(validate_source('dialog', {'other': []}))
+
+    def test_initial_load(self):
+        kb = self.loader.current()
+        self.assertEqual(kb.dialog_matcher.match('hello')['bot'], 'Hi there!')
+        self.assertEqual(kb.response_matcher.match('population of berlin'), 'About 3.7 million.')
+
+    def test_changed_file_is_reloaded_in_background(self):
+        old = self.loader.current()
+        self.write('dialog.yaml', 'dialogs:\n  - user: hello\n    bot: Welcome back!\n')
+        self.assertIs(self.loader.current(), old)  # not checked again before the interval
+
+        self.clock.now += 2
+        self.assertIs(self.loader.current(), old)  # the reload runs off the request path
+        deadline = time.monotonic() + 5
+        while self.loader.current() is old and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.loader.current().dialog_matcher.match('hello')['bot'], 'Welcome back!')
+
+    def test_unchanged_content_is_not_rebuilt(self):
+        old = self.loader.current()
+        self.write('dialog.yaml', 'dialogs:\n  - user: hello\n    bot: Hi there!\n')
+        self.assertFalse(self.loader.reload())
+        self.assertIs(self.loader.current(), old)
+
+    def test_invalid_edit_keeps_the_previous_version(self):
+        old = self.loader.current()
+        self.write('dialog.yaml', 'dialogs: [unclosed\n')
+        with self.assertLogs('neighborhoods.chat.knowledge', 'ERROR'):
+            self.assertFalse(self.loader.reload())
+        self.assertIs(self.loader.current(), old)
+
+    def test_compiled_snapshot(self):
+        snapshot_path = os.path.join(self.data_dir, 'kb.json')
+        call_command('compile_knowledge_base', data_dir=self.data_dir, output=snapshot_path, stdout=io.StringIO())
+
+        with patch('neighborhoods.chat.knowledge.read_sources') as read_sources:
+            kb = KnowledgeBaseLoader(self.data_dir, snapshot_path=snapshot_path).current()
+        read_sources.assert_not_called()
+        self.assertEqual(kb.dialog_matcher.match('hello')['bot'], 'Hi there!')
+
+        # A snapshot compiled from other file contents is ignored
+        self.write('dialog.yaml', 'dialogs:\n  - user: hello\n    bot: Changed!\n')
+        kb = KnowledgeBaseLoader(self.data_dir, snapshot_path=snapshot_path).current()
+        self.assertEqual(kb.dialog_matcher.match('hello')['bot'], 'Changed!')
+
+    def test_snapshot_is_plain_json(self):
+        snapshot_path = os.path.join(self.data_dir, 'kb.json')
+        call_command('compile_knowledge_base', data_dir=self.data_dir, output=snapshot_path, stdout=io.StringIO())
+        with open(snapshot_path, encoding='utf-8') as file:
+            snapshot = json.load(file)
+        self.assertEqual(snapshot['data']['dialog'], {'dialogs': [{'user': 'hello', 'bot': 'Hi there!'}]})
+
+        # A tampered snapshot that no longer validates falls back to the YAML files
+        snapshot['data']['dialog'] = {'dialogs': 'not a list'}
+        with open(snapshot_path, 'w', encoding='utf-8') as file:
+            json.dump(snapshot, file)
+        with self.assertLogs('neighborhoods.chat.knowledge', 'WARNING'):
+            kb = KnowledgeBaseLoader(self.data_dir, snapshot_path=snapshot_path).current()
+        self.assertEqual(kb.dialog_matcher.match('hello')['bot'], 'Hi there!')
+
+    def test_compile_rejects_invalid_files(self):
+        self.write('website_responses.yaml', '- just a list\n')
+        with self.assertRaises(CommandError):
+            call_command('compile_knowledge_base', data_dir=self.data_dir, output=os.path.join(self.data_dir, 'kb.json'),
+                         stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertFalse(os.path.exists(os.path.join(self.data_dir, 'kb.json')))
+
+
+class StartupImportTest(SimpleTestCase):
+    def test_chat_providers_are_not_imported_at_startup(self):
+        stdout = io.StringIO()
+        call_command('benchmark_startup', repeat=1, budget=60000, top=3, stdout=stdout)
+        self.assertIn('Startup import benchmark passed', stdout.getvalue())
+
+    def test_over_budget_fails(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_startup', repeat=1, budget=0, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_providers_import_on_first_use(self):
+        client = StubWikipedia()
+        self.assertIs(WikipediaProvider(client=client).client, client)
+        self.assertIsNone(WeatherProvider()._session)
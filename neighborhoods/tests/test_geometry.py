@@ -0,0 +1,50 @@
+from django.test import SimpleTestCase
+
+from neighborhoods.geometry import (
+    LOD_TOLERANCES,
+    resolve_tolerance,
+    simplify_geometries,
+    snap_tolerance,
+    tolerance_for_zoom,
+)
+
+
+class LevelOfDetailTest(SimpleTestCase):
+    def test_tolerance_for_zoom(self):
+        self.assertEqual(tolerance_for_zoom(18), 0.0)
+        self.assertEqual(tolerance_for_zoom(10.5), 0.002)
+        self.assertEqual(tolerance_for_zoom(3), max(LOD_TOLERANCES))
+
+    def test_snap_tolerance_picks_precomputed_level(self):
+        self.assertEqual(snap_tolerance(0.0007), 0.0005)
+        self.assertEqual(snap_tolerance(1), max(LOD_TOLERANCES))
+        self.assertEqual(snap_tolerance(-1), 0.0)
+
+    def test_resolve_tolerance_prefers_tolerance_over_zoom(self):
+        self.assertEqual(resolve_tolerance({'tolerance': '0.001', 'zoom': '18'}), 0.001)
+        self.assertEqual(resolve_tolerance({'zoom': '12'}), 0.0005)
+        self.assertEqual(resolve_tolerance({'zoom': 'abc'}), 0.0)
+        self.assertEqual(resolve_tolerance({}), 0.0)
+
+    def test_simplify_keeps_shared_borders(self):
+        # Two squares sharing a jagged edge must still share it after simplification
+        edge = [[13.1, 52.0 + 0.001 * i] for i in range(101)]
+        for point in edge[1:-1:2]:
+            point[0] += 0.00002
+        left = [[13.0, 52.0]] + edge + [[13.0, 52.1], [13.0, 52.0]]
+        right = [[13.2, 52.0], [13.2, 52.1]] + edge[::-1] + [[13.2, 52.0]]
+        simplified = simplify_geometries(
+            [{"type": "Polygon", "coordinates": [left]}, {"type": "Polygon", "coordinates": [right]}],
+            0.001,
+        )
+        left_points = {tuple(point) for point in simplified[0]['coordinates'][0]}
+        right_points = {tuple(point) for point in simplified[1]['coordinates'][0]}
+        self.assertLess(len(left_points), len(left))
+        self.assertEqual(
+            {point for point in left_points if point[0] > 13.05},
+            {point for point in right_points if point[0] < 13.15},
+        )
+
+    def test_simplify_passes_through_invalid_geometry(self):
+        geometries = [{"type": "Polygon", "coordinates": [[[]]]}, {"type": "Polygon", "coordinates": []}]
+        self.assertEqual(simplify_geometries(geometries, 0.001), geometries)
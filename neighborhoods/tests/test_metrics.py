@@ -0,0 +1,102 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+from neighborhoods.metrics import (
+    ChatTrace,
+    Counter,
+    Histogram,
+    Registry,
+    chat_answers,
+    chat_stage_seconds,
+)
+
+
+class FakeClock:
+    def __init__(self, *times):
+        self.times = list(times)
+
+    def __call__(self):
+        return self.times.pop(0)
+
+
+class RegistryTest(SimpleTestCase):
+    def test_render_counter_and_histogram(self):
+        registry = Registry()
+        counter = registry.register(Counter('answers', 'Answers.', ['stage']))
+        histogram = registry.register(Histogram('latency_seconds', 'Latency.', ['stage'], buckets=(0.1, 1.0)))
+        counter.inc(stage='ai')
+        counter.inc(2, stage='ai')
+        histogram.observe(0.05, stage='ai')
+        histogram.observe(0.5, stage='ai')
+        histogram.observe(3, stage='ai')
+
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE answers counter', lines)
+        self.assertIn('answers_total{stage="ai"} 3', lines)
+        self.assertIn('# TYPE latency_seconds histogram', lines)
+        self.assertIn('latency_seconds_bucket{stage="ai",le="0.1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{stage="ai",le="1.0"} 2', lines)
+        self.assertIn('latency_seconds_bucket{stage="ai",le="+Inf"} 3', lines)
+        self.assertIn('latency_seconds_sum{stage="ai"} 3.55', lines)
+        self.assertIn('latency_seconds_count{stage="ai"} 3', lines)
+
+    def test_label_values_are_escaped(self):
+        counter = Counter('events', 'Events.', ['name'])
+        counter.inc(name='say "hi"\n')
+        self.assertEqual(counter.samples(), [('events_total', '{name="say \\"hi\\"\\n"}', 1)])
+
+    def test_gauges_and_failing_callback(self):
+        registry = Registry()
+        registry.register_gauges(lambda: [('sessions', 'Sessions.', {}, 4)])
+
+        def broken():
+            raise RuntimeError('store unavailable')
+        registry.register_gauges(broken)
+
+        with self.assertLogs('neighborhoods.metrics', 'ERROR'):
+            lines = registry.render().splitlines()
+        self.assertEqual(lines, ['# HELP sessions Sessions.', '# TYPE sessions gauge', 'sessions 4'])
+
+
+class ChatTraceTest(SimpleTestCase):
+    def setUp(self):
+        chat_stage_seconds.clear()
+        chat_answers.clear()
+
+    def test_records_stages_and_first_answering_stage(self):
+        trace = ChatTrace('test', clock=FakeClock(0.0, 0.0, 0.001, 0.001, 0.201, 0.25))
+        self.assertIsNone(trace.run('dialog', lambda: None))
+        self.assertEqual(trace.run('ai', lambda message: message.upper(), 'hi'), 'HI')
+
+        self.assertEqual(trace.finish(), 0.25)
+        self.assertEqual(trace.answered_by, 'ai')
+        self.assertEqual([stage for stage, _ in trace.stages], ['dialog', 'ai'])
+        self.assertAlmostEqual(trace.stages[1][1], 0.2)
+        self.assertEqual(chat_stage_seconds.count(stage='dialog'), 1)
+        self.assertEqual(chat_answers.value(view='test', stage='ai'), 1)
+
+    def test_failing_stage_is_still_timed(self):
+        trace = ChatTrace('test')
+        with self.assertRaises(ValueError):
+            trace.timed('wiki', lambda: int('x'))()
+        self.assertEqual(chat_stage_seconds.count(stage='wiki'), 1)
+
+    def test_unanswered_message_counts_as_none(self):
+        ChatTrace('test').finish()
+        self.assertEqual(chat_answers.value(view='test', stage='none'), 1)
+
+    @override_settings(CHAT_TRACE_SAMPLE_RATE=1.0)
+    def test_sampled_trace_is_logged(self):
+        trace = ChatTrace('test')
+        trace.run('fuzzy', lambda: 'answer')
+        with self.assertLogs('neighborhoods.metrics', 'INFO') as logs:
+            trace.finish()
+        self.assertIn('view=test answered_by=fuzzy', logs.output[0])
+        self.assertIn('fuzzy=', logs.output[0])
+
+    @override_settings(CHAT_TRACE_SAMPLE_RATE=0.5)
+    def test_unsampled_trace_is_not_logged(self):
+        with patch('neighborhoods.metrics.random.random', return_value=0.9), \
+             self.assertNoLogs('neighborhoods.metrics', 'INFO'):
+            ChatTrace('test').finish()
@@ -1,5 +1,21 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+from io import StringIO
+
+from unittest.mock import patch
+
+import pandas as pd
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.signals import post_delete
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from shapely.geometry import Point, Polygon
 from neighborhoods.models import (
     Lifestyle,
     Borough,
@@ -9,7 +25,18 @@ from neighborhoods.models import (
     Demographics,
     Amenities,
     Transports,
+    BoroughStats,
+    NeighborhoodSummary,
+    FixtureLoad,
 )
+from neighborhoods.chat.facts import CHAT_FACTS_CACHE_KEY
+from neighborhoods import bulk_load
+from neighborhoods.bulk_load import iter_fixture, load_fixture
+from neighborhoods.importers import import_statistics, read_chunks
+from neighborhoods.geometry import representative_points
+from neighborhoods.mock_data import delete_mock_data, generate_mock_data
+from neighborhoods.spatial import update_neighborhood_locations
+from neighborhoods.stats import rebuild_borough_stats, refresh_neighborhood_summaries
 
 
 class LifestyleModelTest(TestCase):
@@ -272,3 +299,510 @@ class TransportsModelTest(TestCase):
         self.assertEqual(
             str(self.transport), "Transport in Test Neighborhood: Bus 42"
         )
+
+
+class BoroughStatsModelTest(TestCase):
+    def setUp(self):
+        self.borough = Borough.objects.create(
+            name="Test Borough",
+            minimum_rent=500,
+            latitude=52.5200,
+            longitude=13.4050,
+            geometry_coordinates={},
+        )
+        self.other_borough = Borough.objects.create(
+            name="Other Borough",
+            minimum_rent=700,
+            latitude=52.5200,
+            longitude=13.4050,
+            geometry_coordinates={},
+        )
+        self.neighborhood = Neighborhood.objects.create(
+            name="Test Neighborhood",
+            borough=self.borough,
+            latitude=52.5200,
+            longitude=13.4050,
+        )
+        for borough, total in ((self.borough, 100), (self.other_borough, 300)):
+            CrimeData.objects.create(
+                borough=borough,
+                total_crimes=total,
+                robbery=10,
+                total_assaults=20,
+                total_thefts=30,
+                total_residential_burglary=5,
+                total_arson_incidents=2,
+                total_vandalism=33,
+            )
+        for amenity_type in ("Park", "Park", "School", "Hospital"):
+            Amenities.objects.create(
+                borough=self.borough,
+                neighborhood=self.neighborhood,
+                amenity_type=amenity_type,
+                name="Amenity",
+            )
+
+    def test_rebuild_borough_stats(self):
+        self.assertEqual(rebuild_borough_stats(), 2)
+        stats = BoroughStats.objects.get(borough=self.borough)
+        self.assertEqual(str(stats), "Statistics for Test Borough")
+        self.assertEqual(stats.total_crimes, 100)
+        self.assertEqual(stats.berlin_total_crimes, 400)
+        self.assertEqual(stats.crime_percentages['thefts'], 30.0)
+        self.assertEqual(stats.amenity_counts, {"Park": 2, "School": 1, "Hospital": 1})
+        self.assertEqual(stats.amenity_percentages["Park"], 50.0)
+        self.assertEqual(stats.crime_data['total_vandalism'], 33)
+
+    def test_rebuild_without_data(self):
+        CrimeData.objects.all().delete()
+        Amenities.objects.all().delete()
+        rebuild_borough_stats()
+        stats = BoroughStats.objects.get(borough=self.other_borough)
+        self.assertEqual(stats.total_crimes, 0)
+        self.assertEqual(stats.crime_percentages['robbery'], 0.0)
+        self.assertEqual(stats.amenity_percentages, {})
+
+    def test_rebuild_command(self):
+        call_command('rebuild_borough_stats', stdout=StringIO())
+        self.assertEqual(BoroughStats.objects.count(), 2)
+
+
+class BoroughStatsSignalTest(TransactionTestCase):
+    def setUp(self):
+        self.borough = Borough.objects.create(
+            name="Test Borough",
+            minimum_rent=500,
+            latitude=52.5200,
+            longitude=13.4050,
+            geometry_coordinates={},
+        )
+        self.neighborhood = Neighborhood.objects.create(
+            name="Test Neighborhood",
+            borough=self.borough,
+            latitude=52.5200,
+            longitude=13.4050,
+        )
+
+    def test_stats_follow_crime_and_amenity_changes(self):
+        crime_data = CrimeData.objects.create(
+            borough=self.borough,
+            total_crimes=100,
+            robbery=10,
+            total_assaults=20,
+            total_thefts=30,
+            total_residential_burglary=5,
+            total_arson_incidents=2,
+            total_vandalism=33,
+        )
+        Amenities.objects.create(
+            borough=self.borough, neighborhood=self.neighborhood, amenity_type="Park", name="Park"
+        )
+        stats = BoroughStats.objects.get(borough=self.borough)
+        self.assertEqual(stats.berlin_total_crimes, 100)
+        self.assertEqual(stats.amenity_counts, {"Park": 1})
+
+        crime_data.delete()
+        self.assertEqual(BoroughStats.objects.get(borough=self.borough).total_crimes, 0)
+
+    def test_changes_in_one_transaction_share_one_rebuild(self):
+        with patch('neighborhoods.stats.rebuild_borough_stats') as rebuild:
+            with transaction.atomic():
+                for name in ("One", "Two", "Three"):
+                    Amenities.objects.create(
+                        borough=self.borough, neighborhood=self.neighborhood, amenity_type="Park", name=name
+                    )
+                Amenities.objects.all().delete()
+        rebuild.assert_called_once_with()
+
+
+class NeighborhoodSummarySignalTest(TransactionTestCase):
+    def setUp(self):
+        self.borough = Borough.objects.create(
+            name="Test Borough",
+            minimum_rent=500,
+            latitude=52.5200,
+            longitude=13.4050,
+            geometry_coordinates={},
+        )
+        self.neighborhood = Neighborhood.objects.create(
+            name="Test Neighborhood",
+            borough=self.borough,
+            latitude=52.5200,
+            longitude=13.4050,
+        )
+        self.other_neighborhood = Neighborhood.objects.create(
+            name="Other Neighborhood",
+            borough=self.borough,
+            latitude=52.5200,
+            longitude=13.4050,
+        )
+
+    def test_summary_follows_related_changes(self):
+        transport = Transports.objects.create(
+            borough=self.borough, neighborhood=self.neighborhood, type="U8", name="Hermannplatz"
+        )
+        summary = NeighborhoodSummary.objects.get(neighborhood=self.neighborhood)
+        self.assertEqual(str(summary), "Summary for Test Neighborhood")
+        self.assertEqual(summary.transport_stations, {"Hermannplatz": ["U8"]})
+        self.assertIsNone(summary.rent)
+
+        transport.delete()
+        summary.refresh_from_db()
+        self.assertEqual(summary.transport_stations, {})
+        # Only the neighborhood whose data changed is refreshed
+        self.assertFalse(NeighborhoodSummary.objects.filter(neighborhood=self.other_neighborhood).exists())
+
+    def test_changes_in_one_transaction_share_one_refresh(self):
+        with patch('neighborhoods.stats.refresh_neighborhood_summaries') as refresh:
+            with transaction.atomic():
+                for neighborhood in (self.neighborhood, self.other_neighborhood, self.neighborhood):
+                    Amenities.objects.create(
+                        borough=self.borough, neighborhood=neighborhood, amenity_type="Park", name="Park"
+                    )
+        refresh.assert_called_once_with({self.neighborhood.id, self.other_neighborhood.id})
+
+    def test_refresh_all_summaries(self):
+        self.assertEqual(refresh_neighborhood_summaries(), 2)
+        self.assertEqual(NeighborhoodSummary.objects.count(), 2)
+
+
+class FixtureLoadTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'fixture.json')
+        # Listed out of dependency order on purpose
+        self.objects = [
+            {"model": "neighborhoods.neighborhood", "pk": 5, "fields": {
+                "name": "Moabit", "borough": 7, "latitude": 52.53, "longitude": 13.36, "slug": "moabit"}},
+            {"model": "neighborhoods.amenities", "pk": 9, "fields": {
+                "borough": 7, "neighborhood": 5, "amenity_type": "Park", "name": "Kleiner Tiergarten"}},
+            {"model": "neighborhoods.borough", "pk": 7, "fields": {
+                "name": "Mitte", "minimum_rent": 800.0, "latitude": 52.52, "longitude": 13.4,
+                "geometry_coordinates": [[[13.3, 52.5], [13.4, 52.6], [13.5, 52.5]]], "slug": "mitte",
+                "description": "Central", "lifestyles": [3]}},
+            {"model": "neighborhoods.lifestyle", "pk": 3, "fields": {"name": "nightlife"}},
+        ]
+        self.write()
+
+    def write(self):
+        with open(self.path, 'w') as file:
+            json.dump(self.objects, file, indent=4)
+
+    def test_iter_fixture_reads_in_chunks(self):
+        with open(self.path) as file:
+            self.assertEqual(list(iter_fixture(file, chunk_size=7)), self.objects)
+        self.assertEqual(list(iter_fixture(io.StringIO('[]'))), [])
+        with self.assertRaises(ValueError):
+            list(iter_fixture(io.StringIO('{"model": "neighborhoods.lifestyle"}')))
+
+    def test_load_in_dependency_order(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            sha256, timings = load_fixture(self.path)
+        self.assertEqual(len(callbacks), 3)
+        labels = [label for label, _, _ in timings]
+        self.assertLess(labels.index('neighborhoods.Borough'), labels.index('neighborhoods.Neighborhood'))
+        self.assertLess(labels.index('neighborhoods.Neighborhood'), labels.index('neighborhoods.Amenities'))
+
+        borough = Borough.objects.get(pk=7)
+        self.assertEqual(list(borough.lifestyles.values_list('name', flat=True)), ['nightlife'])
+        self.assertEqual(Amenities.objects.get(pk=9).neighborhood.name, 'Moabit')
+        self.assertEqual(FixtureLoad.objects.get(fixture='fixture.json').sha256, sha256)
+
+    def test_load_rebuilds_derived_tables(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            load_fixture(self.path)
+        self.assertEqual(BoroughStats.objects.get(borough_id=7).amenity_counts, {'Park': 1})
+        self.assertEqual(NeighborhoodSummary.objects.get(neighborhood_id=5).amenity_counts, {'Park': 1})
+
+    def test_objects_are_inserted_in_bounded_batches(self):
+        lifestyles = [{"model": "neighborhoods.lifestyle", "pk": pk, "fields": {"name": f"style {pk}"}}
+                      for pk in range(10, 15)]
+        # Dependency order, as dumpdata writes it: nothing has to wait for a later model
+        self.objects = lifestyles + [self.objects[2], self.objects[0], self.objects[1]]
+        self.objects[5]['fields']['lifestyles'] = [10]
+        self.write()
+
+        batches = []
+        original = bulk_load._insert
+        def insert(model, objects, batch_size, using):
+            batches.append((model._meta.model_name, len(objects)))
+            original(model, objects, batch_size, using)
+
+        with patch('neighborhoods.bulk_load._insert', insert):
+            _, timings = load_fixture(self.path, batch_size=2)
+        self.assertEqual(batches, [('lifestyle', 2), ('lifestyle', 2), ('lifestyle', 1), ('borough', 1),
+                                   ('neighborhood', 1), ('amenities', 1)])
+        self.assertEqual(timings[0][:2], ('neighborhoods.Lifestyle', 5))
+        self.assertEqual(list(Borough.objects.get(pk=7).lifestyles.values_list('pk', flat=True)), [10])
+
+    def test_unchanged_fixture_is_skipped(self):
+        load_fixture(self.path)
+        with self.assertNumQueries(1):
+            _, timings = load_fixture(self.path)
+        self.assertIsNone(timings)
+
+    def test_changed_fixture_is_upserted(self):
+        load_fixture(self.path)
+        self.objects[2]['fields']['minimum_rent'] = 950.0
+        self.objects[2]['fields']['lifestyles'] = []
+        self.write()
+
+        _, timings = load_fixture(self.path)
+        self.assertIsNotNone(timings)
+        self.assertEqual(Borough.objects.count(), 1)
+        self.assertEqual(Borough.objects.get(pk=7).minimum_rent, 950.0)
+        self.assertEqual(Borough.objects.get(pk=7).lifestyles.count(), 0)
+        self.assertEqual(FixtureLoad.objects.count(), 1)
+
+    def test_command_reports_rows_per_second(self):
+        stdout = StringIO()
+        call_command('load_fixture', self.path, stdout=stdout)
+        self.assertIn('Loaded 4 rows', stdout.getvalue())
+        self.assertIn('rows/s', stdout.getvalue())
+
+        stdout = StringIO()
+        call_command('load_fixture', self.path, stdout=stdout)
+        self.assertIn('nothing to load', stdout.getvalue())
+
+
+class GenerateMockDataTest(TestCase):
+    def figures(self, prefix):
+        return (
+            list(RentData.objects.filter(borough__name__startswith=prefix).order_by('id').values_list('avg_price', 'max_size')),
+            list(Amenities.objects.filter(borough__name__startswith=prefix).order_by('id').values_list('amenity_type', 'name')),
+            list(Transports.objects.filter(borough__name__startswith=prefix).order_by('id').values_list('type', 'name')),
+        )
+
+    def test_full_schema_and_derived_tables(self):
+        features, counts = generate_mock_data(3, 10, 200, 60, seed=1, chunk_size=50)
+        self.assertEqual(counts, {'boroughs': 3, 'neighborhoods': 10, 'rent': 10, 'crime': 3,
+                                  'demographics': 10, 'amenities': 200, 'transports': 60})
+        self.assertEqual(Neighborhood.objects.filter(name__startswith='Mock ').count(), 10)
+        self.assertEqual(BoroughStats.objects.count(), 3)
+        self.assertEqual(NeighborhoodSummary.objects.count(), 10)
+
+        for demographics in Demographics.objects.all():
+            self.assertEqual(demographics.germans + demographics.foreigners, demographics.total)
+        borough = Borough.objects.get(name='Mock Borough 1')
+        ring = borough.geometry_coordinates[0]
+        self.assertEqual(ring[0], ring[-1])
+        self.assertEqual(len(features), 10)
+        self.assertEqual(features[0]['geometry']['type'], 'MultiPolygon')
+
+    def test_seed_reproduces_the_data(self):
+        generate_mock_data(2, 4, 30, 10, seed=7, prefix='First')
+        generate_mock_data(2, 4, 30, 10, seed=7, prefix='Second')
+        generate_mock_data(2, 4, 30, 10, seed=8, prefix='Third')
+        self.assertEqual(self.figures('First'), self.figures('Second'))
+        self.assertNotEqual(self.figures('First'), self.figures('Third'))
+
+    def test_command_replaces_earlier_data(self):
+        call_command('generate_mock_data', boroughs=2, neighborhoods=3, amenities=5, transports=5, stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('generate_mock_data', boroughs=2, neighborhoods=3, stdout=StringIO())
+
+        stdout = StringIO()
+        call_command('generate_mock_data', boroughs=1, neighborhoods=2, amenities=5, transports=5, replace=True, stdout=stdout)
+        self.assertIn('Deleted 2 generated boroughs', stdout.getvalue())
+        self.assertEqual(Borough.objects.count(), 1)
+        self.assertEqual(Amenities.objects.count(), 5)
+
+        call_command('generate_mock_data', delete=True, stdout=StringIO())
+        self.assertFalse(Borough.objects.exists())
+        self.assertFalse(Amenities.objects.exists())
+
+
+    def test_delete_keeps_other_data_and_refreshes_derived_tables(self):
+        borough = Borough.objects.create(name='Mitte', minimum_rent=800, latitude=52.52, longitude=13.4,
+                                         geometry_coordinates=[])
+        neighborhood = Neighborhood.objects.create(name='Moabit', borough=borough, latitude=52.53, longitude=13.36)
+        Amenities.objects.create(borough=borough, neighborhood=neighborhood, amenity_type='Park', name='Park')
+        generate_mock_data(2, 4, 30, 10, seed=3)
+        cache.set(CHAT_FACTS_CACHE_KEY, 'stale')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(delete_mock_data(), 2)
+        # Data rows are deleted without being loaded, and the receivers are back afterwards
+        self.assertFalse([query for query in queries if '"neighborhoods_amenities"."id"' in query['sql']])
+        self.assertTrue(post_delete.has_listeners(Amenities))
+        self.assertEqual(list(Borough.objects.values_list('name', flat=True)), ['Mitte'])
+        self.assertEqual(Amenities.objects.count(), 1)
+        self.assertEqual(list(BoroughStats.objects.values_list('borough__name', 'amenity_counts')),
+                         [('Mitte', {'Park': 1})])
+        self.assertEqual(list(NeighborhoodSummary.objects.values_list('neighborhood__name', flat=True)), ['Moabit'])
+        self.assertIsNone(cache.get(CHAT_FACTS_CACHE_KEY))
+
+
+class ImportStatisticsTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.mitte = Borough.objects.create(name="Mitte", minimum_rent=800, latitude=52.52, longitude=13.4,
+                                            geometry_coordinates={}, description="Central")
+        self.pankow = Borough.objects.create(name="Pankow", minimum_rent=700, latitude=52.57, longitude=13.4,
+                                             geometry_coordinates={}, description="North")
+        self.moabit = Neighborhood.objects.create(name="Moabit", borough=self.mitte, latitude=52.53, longitude=13.34)
+        self.buchholz = Neighborhood.objects.create(name="Französisch Buchholz", borough=self.pankow,
+                                                    latitude=52.6, longitude=13.43)
+        RentData.objects.create(neighborhood=self.moabit, borough=self.mitte, avg_price=1300, min_price=500,
+                                max_price=3000, avg_size=55, min_size=10, max_size=140)
+
+    def chunks(self, content, chunk_size=5000, **options):
+        path = os.path.join(self.directory, 'source.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return read_chunks(path, chunk_size, **options)
+
+    def test_dry_run_reports_the_diff_without_writing(self):
+        rows = (
+            "neighborhood,avg_price,min_price,max_price,avg_size,min_size,max_size\n"
+            "Moabit,1350,500,3000,55,10,140\n"
+            "Francosisch Buchholz,900,400,1500,60,20,120\n"
+            "Franzosisch Buchholz,900,400,1500,60,20,120\n"
+            "Moabit,1350,500,3000,55,10,140\n"
+        )
+        # Boroughs, neighborhoods and rent rows, plus the savepoint pair
+        with self.assertNumQueries(5):
+            result = import_statistics('rent', self.chunks(rows), dry_run=True)
+        self.assertEqual((result.created, result.updated, result.unchanged), (1, 1, 0))
+        self.assertEqual(result.added, ['Französisch Buchholz'])
+        self.assertEqual(result.changes, [('Moabit', 'avg_price', 1300.0, 1350.0)])
+        self.assertEqual(result.rejected, [(3, 'unknown or ambiguous neighborhood')])
+        self.assertEqual(RentData.objects.count(), 1)
+        self.assertEqual(RentData.objects.get().avg_price, 1300)
+
+    def test_upserts_in_chunks(self):
+        rows = (
+            "neighborhood,avg_price,min_price,max_price,avg_size,min_size,max_size\n"
+            "Moabit,1350,500,3000,55,10,140\n"
+            "Französisch Buchholz,900,400,1500,60,20,120\n"
+            "Moabit,1300,-1,3000,55,10,140\n"
+            "Französisch Buchholz,2000,400,1500,60,20,120\n"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            result = import_statistics('rent', self.chunks(rows, chunk_size=2))
+        self.assertEqual((result.created, result.updated), (1, 1))
+        self.assertEqual(result.rejected, [(4, 'negative value'), (5, 'avg_price outside min_price..max_price')])
+
+        buchholz = RentData.objects.get(neighborhood=self.buchholz)
+        self.assertEqual((buchholz.avg_price, buchholz.borough), (900, self.pankow))
+        self.assertEqual(RentData.objects.get(neighborhood=self.moabit).avg_price, 1350)
+        self.assertEqual(NeighborhoodSummary.objects.get(neighborhood=self.buchholz).rent['avg_price'], 900)
+
+        result = import_statistics('rent', self.chunks(rows))
+        self.assertEqual((result.created, result.updated, result.unchanged), (0, 0, 2))
+
+    def test_statistical_office_export(self):
+        CrimeData.objects.create(borough=self.mitte, total_crimes=100, robbery=2, total_assaults=10, total_thefts=40,
+                                 total_residential_burglary=3, total_arson_incidents=1, total_vandalism=9)
+        rows = "Bezirk;Straftaten insgesamt;Raub\nMitte;1.250;5\nPankow;900;3\nNowhere;1;1\n"
+        with self.captureOnCommitCallbacks(execute=True):
+            result = import_statistics('crime', self.chunks(rows, sep=';', thousands='.'))
+
+        # Only the columns in the file change; a borough without a row needs all of them
+        self.assertEqual(result.changes, [('Mitte', 'total_crimes', 100, 1250), ('Mitte', 'robbery', 2, 5)])
+        self.assertEqual(result.rejected[0], (4, 'unknown borough'))
+        self.assertIn('Pankow: no row to update', result.rejected[1][1])
+        crime = CrimeData.objects.get()
+        self.assertEqual((crime.total_crimes, crime.robbery, crime.total_thefts), (1250, 5, 40))
+        self.assertEqual(BoroughStats.objects.get(borough=self.mitte).total_crimes, 1250)
+
+    def test_german_numbers_next_to_placeholders(self):
+        rows = "Ortsteil;avg_price\nMoabit;1.500,5\nFranzösisch Buchholz;-\n"
+        result = import_statistics('rent', self.chunks(rows, sep=';', decimal=',', thousands='.'))
+        self.assertEqual(result.changes, [('Moabit', 'avg_price', 1300.0, 1500.5)])
+        self.assertEqual(result.rejected, [(3, 'missing or non-numeric value')])
+
+        # Excel sheets may hand the figures over as text
+        chunk = pd.DataFrame({'Ortsteil': ['Moabit', 'Französisch Buchholz'], 'avg_price': ['1.400,5', 'k. A.']})
+        result = import_statistics('rent', [chunk], decimal=',', thousands='.')
+        self.assertEqual(result.changes, [('Moabit', 'avg_price', 1500.5, 1400.5)])
+        self.assertEqual(result.rejected, [(3, 'missing or non-numeric value')])
+        self.assertEqual(RentData.objects.get().avg_price, 1400.5)
+
+    def test_command(self):
+        path = os.path.join(self.directory, 'rent.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write("Ortsteil;Bezirk;avg_price\nMoabit;Mitte;1299,5\n")
+
+        stdout = StringIO()
+        call_command('import_statistics', 'rent', path, '--sep', ';', '--decimal', ',', '--dry-run', stdout=stdout)
+        self.assertIn('~ Moabit: avg_price 1300.0 -> 1299.5', stdout.getvalue())
+        self.assertIn('Would import rent', stdout.getvalue())
+        self.assertEqual(RentData.objects.get().avg_price, 1300)
+
+        call_command('import_statistics', 'rent', path, '--sep', ';', '--decimal', ',', stdout=StringIO())
+        self.assertEqual(RentData.objects.get().avg_price, 1299.5)
+        with self.assertRaises(CommandError):
+            call_command('import_statistics', 'crime', path, stdout=StringIO())
+
+
+class ImportGeoJSONTest(TestCase):
+    # A "C" open to the east: its centroid lies in the gap, outside the polygon
+    CRESCENT = [[[0, 0], [3, 0], [3, 1], [1, 1], [1, 2], [3, 2], [3, 3], [0, 3], [0, 0]]]
+
+    def setUp(self):
+        borough = Borough.objects.create(name="Mitte", minimum_rent=800, latitude=52.52, longitude=13.4,
+                                         geometry_coordinates={}, description="Central")
+        for index in range(5):
+            Neighborhood.objects.create(name=f"Kiez {index}", borough=borough, latitude=0, longitude=0)
+
+    def square(self, west, south, size=1):
+        return [[[west, south], [west + size, south], [west + size, south + size], [west, south + size], [west, south]]]
+
+    def feature(self, name, coordinates):
+        return {'type': 'Feature', 'properties': {'name': name},
+                'geometry': {'type': 'Polygon', 'coordinates': coordinates}}
+
+    def test_points_lie_inside_the_polygon(self):
+        crescent = Polygon(self.CRESCENT[0])
+        (centroid,) = representative_points([crescent], 'centroid')
+        self.assertFalse(crescent.contains(Point(centroid)))
+        (point,) = representative_points([crescent])
+        self.assertTrue(crescent.contains(Point(point)))
+        (point,) = representative_points([Polygon(self.square(2, 4, 2)[0])])
+        self.assertEqual(point.tolist(), [3.0, 5.0])
+
+    def test_only_changed_neighborhoods_are_written_in_constant_queries(self):
+        features = [self.feature(f"Kiez {index}", self.square(index * 2, 0)) for index in range(5)]
+        features += [self.feature("kiez 4", self.square(8, 1)), self.feature("Nowhere", self.square(0, 0))]
+
+        # One SELECT and one UPDATE, plus the savepoint pair
+        with self.assertNumQueries(4):
+            changes, unchanged, unmatched = update_neighborhood_locations(features)
+        self.assertEqual((len(changes), unchanged, unmatched), (5, 0, ['nowhere']))
+        # Both parts of "Kiez 4" make up one neighborhood
+        kiez = Neighborhood.objects.get(name="Kiez 4")
+        self.assertEqual((kiez.longitude, kiez.latitude), (8.5, 1.0))
+
+        features[0] = self.feature("Kiez 0", self.CRESCENT)
+        with self.assertNumQueries(4):
+            changes, unchanged, _ = update_neighborhood_locations(features)
+        self.assertEqual(([neighborhood.name for neighborhood, _, _ in changes], unchanged), (["Kiez 0"], 4))
+        kiez = Neighborhood.objects.get(name="Kiez 0")
+        self.assertTrue(Polygon(self.CRESCENT[0]).contains(Point(kiez.longitude, kiez.latitude)))
+
+        with self.assertNumQueries(1):
+            changes, unchanged, _ = update_neighborhood_locations(features)
+        self.assertEqual((changes, unchanged), ([], 5))
+
+    def test_command(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'neighborhoods.geojson')
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({'type': 'FeatureCollection', 'features': [self.feature("Kiez 1", self.square(2, 4, 2))]}, file)
+
+        stdout = StringIO()
+        call_command('import_geojson', path, '--dry-run', stdout=stdout)
+        self.assertIn('Kiez 1: (0.0, 0.0) -> (5.0, 3.0)', stdout.getvalue())
+        self.assertEqual(Neighborhood.objects.get(name="Kiez 1").latitude, 0)
+
+        stdout = StringIO()
+        call_command('import_geojson', path, stdout=stdout)
+        self.assertIn('Updated 1 neighborhoods, 0 unchanged', stdout.getvalue())
+        self.assertEqual(Neighborhood.objects.get(name="Kiez 1").latitude, 5)
+        with self.assertRaises(CommandError):
+            call_command('import_geojson', os.path.join(directory.name, 'missing.geojson'), stdout=StringIO())
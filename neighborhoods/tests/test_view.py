@@ -1,10 +1,18 @@
+import json
+import time
+from types import SimpleNamespace
+
 from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.contrib.auth import get_user_model
 from neighborhoods.models import ( Borough, Neighborhood, CrimeData, Amenities,Lifestyle,
+    RentData, Transports,
 )
-from neighborhoods.views import manage_conversation_history, conversation_history
+from neighborhoods.stats import refresh_neighborhood_summaries
+from neighborhoods.chat.breaker import CircuitBreaker, ProviderGuard
+from neighborhoods.chat.wiki import WikipediaProvider
+from neighborhoods.views import ai_response_cache, manage_conversation_history, conversation_store, gemini_guard
 from unittest.mock import patch
 
 UserModel = get_user_model()
@@ -20,7 +28,9 @@ class ChatViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('response', response.json())
         self.assertEqual(response.json()['response'], "Hi there! How can I help you today?")
-        mock_dialog_response.assert_called_once_with('hi', None)
+        session_id = self.client.session.session_key
+        self.assertIsNotNone(session_id)
+        mock_dialog_response.assert_called_once_with('hi', session_id)
 
         # Test weather response
         mock_dialog_response.return_value = None
@@ -41,6 +51,25 @@ class ChatViewTest(TestCase):
             self.assertIn('response', response.json())
             self.assertEqual(response.json()['response'], "Berlin is the capital of Germany.")
 
+    def test_new_visitors_get_their_own_conversation(self):
+        conversation_store.clear()
+        with patch('neighborhoods.views.get_dialog_response', return_value="Hello!"):
+            self.client.post(reverse('chat_view'), {'message': 'Hi'})
+            other = Client()
+            other.post(reverse('chat_view'), {'message': 'Hey'})
+        first, second = self.client.session.session_key, other.session.session_key
+        self.assertNotEqual(first, second)
+        self.assertEqual(conversation_store.recent_messages(first), ["User: hi", "Bot: Hello!"])
+        self.assertEqual(conversation_store.recent_messages(second), ["User: hey", "Bot: Hello!"])
+        self.assertEqual(conversation_store.recent_messages(None), [])
+
+    def test_chat_view_matches_dialogs_once(self):
+        with patch('neighborhoods.views.get_dialog_response', return_value=None) as mock_dialog_response, \
+             patch('neighborhoods.views.get_ai_response', return_value="AI answer"):
+            response = self.client.post(reverse('chat_view'), {'message': 'Something unusual'})
+        self.assertEqual(response.json()['response'], "AI answer")
+        mock_dialog_response.assert_called_once()
+
     def test_chat_view_fallback_response(self):
         with patch('neighborhoods.views.get_dialog_response', return_value=None), \
              patch('neighborhoods.views.get_predefined_response', return_value=None), \
@@ -56,30 +85,223 @@ class ChatViewTest(TestCase):
                 "Did you know that honey never spoils?"
             ])
 
+    def test_hanging_provider_falls_back_quickly(self):
+        class HangingWikipedia:
+            exceptions = SimpleNamespace(DisambiguationError=LookupError, PageError=KeyError)
+
+            def summary(self, query, sentences=2):
+                time.sleep(2)
+
+        guard = ProviderGuard('wikipedia', timeout=0.2, breaker=CircuitBreaker('wikipedia', min_calls=1))
+        provider = WikipediaProvider(client=HangingWikipedia(), guard=guard)
+        with patch('neighborhoods.views.wikipedia_provider', provider), \
+             patch('neighborhoods.views.get_dialog_response', return_value=None), \
+             patch('neighborhoods.views.get_predefined_response', return_value=None), \
+             patch('neighborhoods.views.get_ai_response', return_value=None), \
+             self.assertLogs(level='WARNING'):
+            start = time.monotonic()
+            first = self.client.post(reverse('chat_view'), {'message': 'Tell me about Berlin'})
+            timed_out = time.monotonic() - start
+            # The circuit is open now: the next message does not wait at all
+            start = time.monotonic()
+            second = self.client.post(reverse('chat_view'), {'message': 'Tell me about Berlin'})
+            failed_fast = time.monotonic() - start
+
+        fun_facts = ["Did you know that the Eiffel Tower can be 15 cm taller during hot days?",
+                     "Octopuses have three hearts!", "Did you know that honey never spoils?"]
+        self.assertIn(first.json()['response'], fun_facts)
+        self.assertIn(second.json()['response'], fun_facts)
+        self.assertLess(timed_out, 1)
+        self.assertLess(failed_fast, 0.1)
+        self.assertEqual(guard.breaker.state, 'open')
+
     def test_manage_conversation_history(self):
         session_id = 'test_session'
         user_message = 'Hello'
         bot_message = 'Hi there!'
-        conversation_history.clear()
+        conversation_store.clear()
 
         manage_conversation_history(session_id, user_message, bot_message)
-        print(conversation_history)
-        self.assertIn(session_id, conversation_history)
-        self.assertEqual(len(conversation_history[session_id]['messages']), 2)
-        self.assertEqual(conversation_history[session_id]['messages'][0], f"User: {user_message}")
-        self.assertEqual(conversation_history[session_id]['messages'][1], f"Bot: {bot_message}")
+        self.assertIn(session_id, conversation_store)
+        self.assertEqual(len(conversation_store.get(session_id).messages), 2)
+        self.assertEqual(conversation_store.get(session_id).messages[0], f"User: {user_message}")
+        self.assertEqual(conversation_store.get(session_id).messages[1], f"Bot: {bot_message}")
 
         manage_conversation_history(session_id, "How are you?", "I'm fine.")
         manage_conversation_history(session_id, "What's your name?", "I'm ChatBot.")
         manage_conversation_history(session_id, "Tell me a fact.", "Octopuses have three hearts.")
         
         # Check the conversation length - should be 4 messages (last 4 due to history limit)
-        self.assertEqual(len(conversation_history[session_id]['messages']), 4)
+        self.assertEqual(len(conversation_store.get(session_id).messages), 4)
         # The first 4 messages (Hello exchange) were removed, only last 2 exchanges remain
-        self.assertEqual(conversation_history[session_id]['messages'][0], "User: What's your name?")
-        self.assertEqual(conversation_history[session_id]['messages'][1], "Bot: I'm ChatBot.")
-        self.assertEqual(conversation_history[session_id]['messages'][2], "User: Tell me a fact.")
-        self.assertEqual(conversation_history[session_id]['messages'][3], "Bot: Octopuses have three hearts.")
+        self.assertEqual(conversation_store.get(session_id).messages[0], "User: What's your name?")
+        self.assertEqual(conversation_store.get(session_id).messages[1], "Bot: I'm ChatBot.")
+        self.assertEqual(conversation_store.get(session_id).messages[2], "User: Tell me a fact.")
+        self.assertEqual(conversation_store.get(session_id).messages[3], "Bot: Octopuses have three hearts.")
+
+
+class FakeStreamingModel:
+    """Stands in for the Gemini model; yields the scripted chunks when called with stream=True."""
+
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+        self.prompts = []
+
+    def generate_content(self, prompt, stream=False):
+        self.prompts.append(prompt)
+        assert stream
+        for chunk in self.chunks:
+            yield SimpleNamespace(text=chunk)
+        if self.error:
+            raise self.error
+
+
+class ChatStreamViewTest(TestCase):
+    def setUp(self):
+        conversation_store.clear()
+        ai_response_cache.clear()
+        gemini_guard.breaker.reset()
+        patcher = patch.multiple('neighborhoods.views', get_dialog_response=lambda *args: None,
+                                 get_predefined_response=lambda *args: None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_events(self, response):
+        events = []
+        for chunk in response.streaming_content:
+            for block in chunk.decode().strip().split("\n\n"):
+                lines = dict(line.split(": ", 1) for line in block.split("\n"))
+                events.append((lines.get('event'), json.loads(lines['data'])))
+        return events
+
+    def test_streams_ai_tokens_then_updates_history(self):
+        model = FakeStreamingModel(["Kreuzberg ", "is lively", "."])
+        with patch('neighborhoods.views.get_gemini_model', return_value=model):
+            response = self.client.post(reverse('chat_stream_view'), {'message': 'Where to go out?'})
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            session_id = self.client.session.session_key
+            stream = iter(response.streaming_content)
+            next(stream)
+            # Nothing is recorded until the answer is complete
+            self.assertEqual(conversation_store.recent_messages(session_id), [])
+            events = [json.loads(chunk.decode().split("data: ", 1)[1]) for chunk in stream]
+
+        self.assertEqual([event.get('token') for event in events[:2]], ["is lively", "."])
+        self.assertEqual(events[-1], {"response": "Kreuzberg is lively."})
+        self.assertEqual(conversation_store.recent_messages(session_id),
+                         ["User: where to go out", "Bot: Kreuzberg is lively."])
+        self.assertIn("User: where to go out", model.prompts[0])
+
+    def test_completed_answers_are_cached(self):
+        model = FakeStreamingModel(["Mitte", " is central."])
+        with patch('neighborhoods.views.get_gemini_model', return_value=model):
+            self.read_events(self.client.post(reverse('chat_stream_view'), {'message': 'Where should I live?'}))
+            conversation_store.clear()
+            events = self.read_events(self.client.post(reverse('chat_stream_view'), {'message': 'where should i live'}))
+        self.assertEqual(events, [(None, {"token": "Mitte is central."}), ("done", {"response": "Mitte is central."})])
+        self.assertEqual(len(model.prompts), 1)
+
+    def test_local_answer_is_sent_as_one_token(self):
+        model = FakeStreamingModel(["unused"])
+        with patch('neighborhoods.views.get_dialog_response', return_value="Hello!"), \
+             patch('neighborhoods.views.get_gemini_model', return_value=model):
+            events = self.read_events(self.client.post(reverse('chat_stream_view'), {'message': 'Hi'}))
+        self.assertEqual(events, [(None, {"token": "Hello!"}), ("done", {"response": "Hello!"})])
+        self.assertEqual(model.prompts, [])
+
+    def test_falls_back_to_wikipedia_without_ai(self):
+        with patch('neighborhoods.views.get_gemini_model', return_value=None), \
+             patch('neighborhoods.views.get_wikipedia_summary', return_value="Berlin is the capital."):
+            events = self.read_events(self.client.post(reverse('chat_stream_view'), {'message': 'Tell me about Berlin'}))
+        self.assertEqual(events[-1], ("done", {"response": "Berlin is the capital."}))
+
+    def test_error_mid_stream_sends_an_error_and_skips_history(self):
+        model = FakeStreamingModel(["Partial"], error=RuntimeError("quota"))
+        with patch('neighborhoods.views.get_gemini_model', return_value=model), self.assertLogs(level='ERROR'):
+            events = self.read_events(self.client.post(reverse('chat_stream_view'), {'message': 'Question'}))
+        self.assertEqual(events, [(None, {"token": "Partial"}),
+                                  ("error", {"error": "The answer was interrupted. Please try again."})])
+        self.assertEqual(conversation_store.recent_messages(self.client.session.session_key), [])
+        self.assertEqual(ai_response_cache.stats()['entries'], 0)
+
+    def test_error_before_the_first_chunk_falls_back(self):
+        model = FakeStreamingModel([], error=RuntimeError("quota"))
+        with patch('neighborhoods.views.get_gemini_model', return_value=model), \
+             patch('neighborhoods.views.get_wikipedia_summary', return_value="Berlin is the capital."), \
+             self.assertLogs(level='ERROR'):
+            events = self.read_events(self.client.post(reverse('chat_stream_view'), {'message': 'Question'}))
+        self.assertEqual(events[-1], ("done", {"response": "Berlin is the capital."}))
+
+
+class ChatAsyncViewTest(TestCase):
+    def setUp(self):
+        conversation_store.clear()
+
+    def slow(self, answer, delay):
+        def provider(*args):
+            time.sleep(delay)
+            return answer
+        return provider
+
+    async def test_local_answers_skip_network_providers(self):
+        with patch('neighborhoods.views.get_dialog_response', return_value="Hello!"), \
+             patch('neighborhoods.views.get_ai_response') as mock_ai:
+            response = await self.async_client.post(reverse('chat_async_view'), {'message': 'Hi'})
+        self.assertEqual(response.json()['response'], "Hello!")
+        mock_ai.assert_not_called()
+
+    async def test_slow_ai_does_not_delay_wikipedia_fallback(self):
+        with patch('neighborhoods.views.get_dialog_response', return_value=None), \
+             patch('neighborhoods.views.get_predefined_response', return_value=None), \
+             patch('neighborhoods.views.get_ai_response', self.slow(None, 0.3)), \
+             patch('neighborhoods.views.get_wikipedia_summary', self.slow("Berlin is the capital.", 0.3)):
+            start = time.monotonic()
+            response = await self.async_client.post(reverse('chat_async_view'), {'message': 'Tell me about Berlin'})
+            elapsed = time.monotonic() - start
+        self.assertEqual(response.json()['response'], "Berlin is the capital.")
+        self.assertLess(elapsed, 0.55)
+        session = await self.async_client.asession()
+        self.assertEqual(conversation_store.recent_messages(session.session_key)[-1], "Bot: Berlin is the capital.")
+
+    async def test_ai_answer_preferred_over_wikipedia(self):
+        with patch('neighborhoods.views.get_dialog_response', return_value=None), \
+             patch('neighborhoods.views.get_predefined_response', return_value=None), \
+             patch('neighborhoods.views.get_ai_response', self.slow("AI answer", 0.2)), \
+             patch('neighborhoods.views.get_wikipedia_summary', self.slow("Wiki answer", 0)):
+            response = await self.async_client.post(reverse('chat_async_view'), {'message': 'Tell me about Berlin'})
+        self.assertEqual(response.json()['response'], "AI answer")
+
+    async def test_get_not_allowed(self):
+        response = await self.async_client.get(reverse('chat_async_view'))
+        self.assertEqual(response.status_code, 405)
+
+
+class MetricsViewTest(TestCase):
+    def test_staff_only(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(User.objects.create_user(username='member', password='pw'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_chat_message_shows_up_in_metrics(self):
+        self.client.force_login(User.objects.create_user(username='staff', password='pw', is_staff=True))
+        with patch('neighborhoods.views.get_dialog_response', return_value="Hello!"):
+            self.client.post(reverse('chat_view'), {'message': 'Hi'})
+            self.client.post(reverse('chat_view'), {'message': 'Hi'})
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE chat_request_seconds histogram', lines)
+        self.assertIn('chat_stage_seconds_count{stage="dialog"}', response.content.decode())
+        answered = [line for line in lines if line.startswith('chat_answers_total{view="sync",stage="dialog"}')]
+        self.assertEqual(len(answered), 1)
+        self.assertGreaterEqual(int(answered[0].split()[-1]), 2)
+        self.assertIn('chat_ai_cache_hit_rate', response.content.decode())
 
 
 class BoroughListViewTest(TestCase):
@@ -114,6 +336,17 @@ class BoroughListViewTest(TestCase):
         self.assertTemplateUsed(response, 'neighborhoods/borough_list.html')
         self.assertEqual(len(response.context['boroughs']), 2)
 
+    def test_borough_list_map_knows_the_detail_levels(self):
+        response = self.client.get(reverse('borough_list'))
+        self.assertEqual(response.context['lod_zooms'], [0, 10, 11, 12, 13, 15])
+        self.assertContains(response, '<script id="lod-zooms" type="application/json">[0, 10, 11, 12, 13, 15]</script>')
+        self.assertContains(response, "boroughMap.on('zoomend', () => loadBoroughs(geojson))")
+
+    def test_borough_list_prefetches_lifestyles(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('borough_list'))
+        self.assertEqual(response.context['boroughs'][0]['lifestyles'], ['Active'])
+
     def test_borough_list_with_max_rent(self):
         response = self.client.get(reverse('borough_list'), {'max_rent': 600})
         self.assertEqual(len(response.context['boroughs']), 1)
@@ -181,6 +414,12 @@ class NeighborhoodListViewTest(TestCase):
         self.assertEqual(len(response.context['neighborhoods']), 2)
         self.assertEqual(response.context['borough'], self.borough)
 
+    def test_neighborhood_list_map_knows_the_detail_levels(self):
+        response = self.client.get(reverse('neighborhood_list', args=[self.borough.slug]))
+        self.assertEqual(response.context['lod_zooms'], [0, 10, 11, 12, 13, 15])
+        self.assertContains(response, '<script id="lod-zooms" type="application/json">[0, 10, 11, 12, 13, 15]</script>')
+        self.assertContains(response, "map.on('zoomend', loadNeighborhoods)")
+
     def test_crime_data_aggregation(self):
         response = self.client.get(reverse('neighborhood_list', args=[self.borough.slug]))
         crime_percentages = response.context['crime_percentages']
@@ -196,6 +435,14 @@ class NeighborhoodListViewTest(TestCase):
         amenity_percentages = response.context['amenity_percentages']
         self.assertEqual(amenity_percentages['Park'], 100.0)
 
+    def test_neighborhood_list_reads_precomputed_stats(self):
+        self.client.get(reverse('neighborhood_list', args=[self.borough.slug]))
+        # Session lookup aside, the view reads the stats row and the neighborhoods only
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('neighborhood_list', args=[self.borough.slug]))
+        self.assertEqual(response.context['total_crimes_berlin'], 100)
+        self.assertEqual(response.context['total_crimes_borough'], 100)
+
     def test_neighborhood_list_no_neighborhoods(self):
         Neighborhood.objects.all().delete()
         response = self.client.get(reverse('neighborhood_list', args=[self.borough.slug]))
@@ -205,3 +452,92 @@ class NeighborhoodListViewTest(TestCase):
     def test_neighborhood_list_invalid_borough_slug(self):
         response = self.client.get(reverse('neighborhood_list', args=['invalid-slug']))
         self.assertEqual(response.status_code, 404)
+
+
+class NeighborhoodDetailViewTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.borough = Borough.objects.create(
+            name='Borough One',
+            minimum_rent=500,
+            latitude=52.5200,
+            longitude=13.4050,
+            geometry_coordinates=[],
+            slug='borough-one',
+        )
+        self.neighborhood = Neighborhood.objects.create(
+            name='Neighborhood One',
+            borough=self.borough,
+            latitude=52.5200,
+            longitude=13.4050,
+        )
+        RentData.objects.create(
+            neighborhood=self.neighborhood,
+            borough=self.borough,
+            avg_price=1000,
+            min_price=500,
+            max_price=2000,
+            avg_size=50,
+            min_size=20,
+            max_size=120,
+        )
+        for name, transport_type in (('Alexanderplatz', 'U2'), ('Alexanderplatz', 'S5'), ('Hackescher Markt', 'S7')):
+            Transports.objects.create(
+                borough=self.borough, neighborhood=self.neighborhood, name=name, type=transport_type
+            )
+        for amenity_type in ('Park', 'Park', 'School'):
+            Amenities.objects.create(
+                borough=self.borough, neighborhood=self.neighborhood, amenity_type=amenity_type, name='Amenity'
+            )
+
+    def test_neighborhood_detail_view(self):
+        response = self.client.get(reverse('neighborhood_detail', args=[self.neighborhood.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'neighborhoods/neighborhood_detail.html')
+        self.assertEqual(response.context['borough'], self.borough)
+        self.assertEqual(response.context['rent_data']['avg_price'], 1000)
+        self.assertIsNone(response.context['demographics'])
+        self.assertEqual(
+            response.context['transport_data'],
+            {'Alexanderplatz': ['U2', 'S5'], 'Hackescher Markt': ['S7']},
+        )
+        self.assertEqual(json.loads(response.context['amenities_data_json']), {'Park': 2, 'School': 1})
+
+    def test_neighborhood_detail_uses_one_query_then_cache(self):
+        refresh_neighborhood_summaries()
+        with self.assertNumQueries(1):
+            self.client.get(reverse('neighborhood_detail', args=[self.neighborhood.id]))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('neighborhood_detail', args=[self.neighborhood.id]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_neighborhood_detail_reflects_rename(self):
+        self.client.get(reverse('neighborhood_detail', args=[self.neighborhood.id]))
+        self.neighborhood.name = 'Renamed'
+        self.neighborhood.save()
+        response = self.client.get(reverse('neighborhood_detail', args=[self.neighborhood.id]))
+        self.assertEqual(response.context['neighborhood'].name, 'Renamed')
+
+    def test_neighborhood_detail_reflects_raw_borough_save(self):
+        self.client.get(reverse('neighborhood_detail', args=[self.neighborhood.id]))
+        self.borough.name = 'Loaded From Fixture'
+        self.borough.save_base(raw=True)
+        response = self.client.get(reverse('neighborhood_detail', args=[self.neighborhood.id]))
+        self.assertEqual(response.context['borough'].name, 'Loaded From Fixture')
+
+    def test_neighborhood_detail_is_gone_after_delete(self):
+        url = reverse('neighborhood_detail', args=[self.neighborhood.id])
+        self.client.get(url)
+        self.neighborhood.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_neighborhood_detail_is_gone_after_borough_delete(self):
+        url = reverse('neighborhood_detail', args=[self.neighborhood.id])
+        self.client.get(url)
+        # The delete cascades to the neighborhood
+        self.borough.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_neighborhood_detail_invalid_id(self):
+        response = self.client.get(reverse('neighborhood_detail', args=[999]))
+        self.assertEqual(response.status_code, 404)
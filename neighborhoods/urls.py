@@ -35,8 +35,12 @@ urlpatterns = [
     path('borough_data_api/', views.borough_data_api, name='borough_data_api'),
     path('borough/<slug:borough_slug>/', views.neighborhood_list, name='neighborhood_list'),  # Uses slug for borough
     path('neighborhood_data_api/<slug:borough_slug>/', views.neighborhood_data_api, name='neighborhood_data_api'),  # Slug for neighborhoods data
+    path('locate/', views.locate_api, name='locate_api'),  # Point-in-polygon lookup for one or many coordinates
     path('neighborhood/<int:neighborhood_id>/', views.neighborhood_detail, name='neighborhood_detail'),
     path('chat/', views.chat_view, name='chat_view'),  
+    path('chat/stream/', views.chat_stream_view, name='chat_stream_view'),  # Server-Sent Events
+    path('chat/async/', views.chat_async_view, name='chat_async_view'),  # Concurrent providers, for ASGI
+    path('metrics/', views.metrics_view, name='metrics'),  # Prometheus text format, staff only
     
     # Auth-related paths for login and logout
     path('login/', auth_views.LoginView.as_view(template_name='neighborhoods/login.html'), name='login'),
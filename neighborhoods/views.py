@@ -1,103 +1,68 @@
+import functools
 import json
 import os
 import logging
-import yaml
 import string
 import random
-import requests
-import wikipedia
-from wikipedia import summary, exceptions
-from collections import Counter, defaultdict
+import time
 from django.conf import settings
-import google.generativeai as genai
+from django.core.cache import cache
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
-from django.db.models import Q ,Sum, Count 
-from .models import Borough, Neighborhood, CrimeData, Demographics, RentData, Amenities, Transports
-from .serializers import NeighborhoodSerializer, BoroughSerializer
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db.models import Prefetch
+from .models import Borough, BoroughStats, Neighborhood
+from .serializers import (
+    NEIGHBORHOOD_EXPANSIONS,
+    BoroughSerializer,
+    NeighborhoodSerializer,
+    requested_expansions,
+    sparse_field_names,
+)
+from .pagination import IdCursorPagination
+from .chat.breaker import ProviderTimeout, ProviderUnavailable, provider_guard
+from .chat.facts import answer_data_question
+from .chat.knowledge import KnowledgeBaseLoader
+from .chat.pipeline import first_answer
+from .chat.prompts import PromptCache, prompt_cache_key
+from .chat.state import build_conversation_store
+from .chat.weather import build_weather_provider
+from .chat.wiki import build_wikipedia_provider
+from .geojson_index import neighborhood_geojson
+from .geometry import LOD_LEVELS, resolve_tolerance, simplify_geometries
+from .metrics import REGISTRY, ChatTrace, chat_upstream_requests
+from .signals import borough_geojson_cache_key, borough_geojson_version
+from .spatial import LOCATE_MAX_POINTS, locate_points
+from .stats import get_borough_stats, get_neighborhood_summary, neighborhood_detail_cache_key
 from rest_framework import viewsets
+from rest_framework.decorators import api_view
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import AuthenticationForm
+from django.core.exceptions import PermissionDenied
 from .permissions import IsAdminOrReadOnly
 from .forms import CustomUserCreationForm
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_POST
+from asgiref.sync import sync_to_async
+from django.utils.cache import patch_cache_control
 from dotenv import load_dotenv
-from fuzzywuzzy import fuzz, process
 
-# Load YAML-based website responses
-def load_website_responses():
-    file_path = os.path.join(settings.BASE_DIR, 'data', 'website_responses.yaml')
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return yaml.safe_load(file)
-    except FileNotFoundError:
-        logging.error(f"Website responses YAML file not found at {file_path}.")
-        return {}
-
-# Load YAML-based factual responses
-def load_factual_responses():
-    file_path = os.path.join(settings.BASE_DIR, 'data', 'factual_responses.yaml')
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return yaml.safe_load(file)
-    except FileNotFoundError:
-        logging.error(f"Factual responses YAML file not found at {file_path}.")
-        return {}
-
-# Load YAML-based dialog responses
-def load_dialog_responses():
-    file_path = os.path.join(settings.BASE_DIR, 'data', 'dialog.yaml')
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            dialogs = yaml.safe_load(file)
-            if not isinstance(dialogs, dict) or 'dialogs' not in dialogs:
-                raise ValueError("Invalid structure: 'dialog.yaml' must contain a 'dialogs' key.")
-            if not isinstance(dialogs['dialogs'], list):
-                raise ValueError("'dialogs' must be a list.")
-            return dialogs
-    except FileNotFoundError:
-        logging.error(f"Dialog YAML file not found at {file_path}.")
-        return {}
-    except Exception as e:
-        logging.error(f"Error loading dialog.yaml: {e}")
-        return {}
+# YAML knowledge base (website, factual and dialog responses), reloaded when the files change
+knowledge_base = KnowledgeBaseLoader(
+    os.path.join(settings.BASE_DIR, 'data'),
+    snapshot_path=settings.KNOWLEDGE_BASE_SNAPSHOT_PATH,
+    check_interval=settings.KNOWLEDGE_BASE_CHECK_INTERVAL,
+)
 
-# Load YAML responses
-website_responses = load_website_responses()
-factual_responses = load_factual_responses()
-dialog_responses = load_dialog_responses()
 
+wikipedia_provider = build_wikipedia_provider()
 
-def preprocess_query(query):
-    # Remove common prefixes
-    prefixes = ["what do you know about", "tell me about", "do you know about"]
-    for prefix in prefixes:
-        if query.startswith(prefix):
-            query = query[len(prefix):].strip()
-    return query
 
-
-
-# Wikipedia summary fetch
+# Wikipedia summary fetch, cached by normalized query
 def get_wikipedia_summary(query):
-    try:
-        query = preprocess_query(query)  # Preprocess user query
-        # Attempt to fetch a summary for the query
-        summary_text = summary(query, sentences=2)
-        return summary_text
-    except exceptions.DisambiguationError as e:
-        # Provide options if there are multiple results
-        logging.warning(f"Disambiguation error for '{query}': {e.options}")
-        return f"Multiple results found for '{query}': {', '.join(e.options[:3])}. Please specify further."
-    except exceptions.PageError:
-        # Handle missing pages
-        return f"Sorry, I couldn't find any relevant information about '{query}'."
-    except Exception as e:
-        logging.error(f"Unexpected error in get_wikipedia_summary: {e}")
-        return "Sorry, there was a problem retrieving the information."
+    return wikipedia_provider.summary(query)
 
 
 # Initialize Google Gemini AI
@@ -105,58 +70,30 @@ dotenv_path = os.path.join(settings.BASE_DIR, '.env_docker')
 load_dotenv(dotenv_path)
 
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if GEMINI_API_KEY and GEMINI_API_KEY != 'your_gemini_api_key_here':
-    genai.configure(api_key=GEMINI_API_KEY)
-    gemini_model = genai.GenerativeModel('gemini-flash-latest')  # Free tier model
-else:
-    gemini_model = None
-    logging.warning("Gemini API key not configured. AI chat will use fallback responses.")
-
-# Weather data fetching for Berlin
-def get_weather_in_berlin():
-    try:
-        api_key = os.getenv('WEATHER_API_KEY')
-        if not api_key:
-            logging.error("Weather API key is missing in the .env_docker file.")
-            return "Weather API key is not configured."
+gemini_guard = provider_guard('gemini', settings.CHAT_STAGE_TIMEOUTS['ai'])
 
-        city = "Berlin"
-        url = f"http://api.weatherapi.com/v1/current.json?key={api_key}&q={city}"
-        response = requests.get(url)  # Get the raw response first
 
-        # Log the response for debugging
-        logging.debug(f"Weather API Response: {response.status_code} {response.text}")
+# Gemini model, created on first use: importing google.generativeai takes longer than the
+# rest of startup combined, and most requests never reach the AI stage
+@functools.lru_cache(maxsize=None)
+def get_gemini_model():
+    if not GEMINI_API_KEY or GEMINI_API_KEY == 'your_gemini_api_key_here':
+        logging.warning("Gemini API key not configured. AI chat will use fallback responses.")
+        return None
 
-        # Check the HTTP status code
-        if response.status_code != 200:
-            logging.error(f"Weather API returned an error: {response.status_code} {response.text}")
-            return "Sorry, I couldn't fetch the weather data right now."
+    import google.generativeai as genai
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai.GenerativeModel('gemini-flash-latest')  # Free tier model
 
-        # Parse the JSON response
-        data = response.json()
+weather_provider = build_weather_provider()
 
-        # Extract weather details
-        if 'current' in data:
-            temp = data['current']['temp_c']
-            condition = data['current']['condition']['text']
-            humidity = data['current']['humidity']
-            wind_speed = data['current']['wind_kph']
 
-            return f"The current temperature in Berlin is {temp}°C with {condition}. Humidity is {humidity}% and wind speed is {wind_speed} km/h."
-        else:
-            logging.error("Weather data is missing the 'current' key in the response.")
-            return "Sorry, I couldn't fetch the weather data right now."
-
-    except requests.exceptions.RequestException as e:
-        logging.error(f"RequestException occurred: {e}")
-        return "Sorry, there was a problem retrieving the weather data."
-    except Exception as e:
-        logging.error(f"Unexpected error in get_weather_in_berlin: {e}")
-        return "Sorry, there was a problem retrieving the weather data."
+# Weather data fetching for Berlin, cached and refreshed in the background
+def get_weather_in_berlin():
+    return weather_provider.current()
 
-# Manage conversation history
-conversation_history = {}
-user_data = {}
+# Conversation state (dialog stage, recent messages, user's name) per session
+conversation_store = build_conversation_store()
 
 # Fallback responses
 fallback_responses = [
@@ -167,87 +104,59 @@ fallback_responses = [
 
 # Manage conversation history
 def manage_conversation_history(session_id, user_message, bot_message):
-    # Initialize session history if it doesn't exist
-    if session_id not in conversation_history:
-        conversation_history[session_id] = {'state': None, 'messages': []}
-
-    # Append user and bot messages to the 'messages' list
-    conversation_history[session_id]['messages'].append(f"User: {user_message}")
-    conversation_history[session_id]['messages'].append(f"Bot: {bot_message}")
-
-    # Limit the history to the last 4 messages for simplicity
-    if len(conversation_history[session_id]['messages']) > 4:
-        conversation_history[session_id]['messages'] = conversation_history[session_id]['messages'][-4:]
+    # Append user and bot messages, keeping the last 4 messages for simplicity
+    conversation_store.append_exchange(session_id, user_message, bot_message)
 
 
 
 
 # Get responses from dialog.yaml
 def get_dialog_response(user_message, session_id):
-    # Normalize user input to lowercase
-    user_message = user_message.strip().lower()
-
-    if not isinstance(dialog_responses, dict):
-        logging.error(f"dialog_responses is not a dictionary: {type(dialog_responses)}")
+    kb = knowledge_base.current()
+    if not isinstance(kb.dialog_responses, dict):
+        logging.error(f"dialog_responses is not a dictionary: {type(kb.dialog_responses)}")
         return None
 
-    dialogs = dialog_responses.get('dialogs', [])
-    if not dialogs:
+    if not len(kb.dialog_matcher):
         logging.error("No dialogs found in dialog_responses.")
         return "Sorry, I couldn't find any information for that query."
 
-    # Initialize session if needed
-    if session_id not in conversation_history:
-        conversation_history[session_id] = {'state': None, 'messages': []}
-
-    # Exact match prioritization
-    for dialog in dialogs:
-        if user_message == dialog['user'].strip().lower():
-            logging.debug(f"Exact match found: {dialog['user']}")
-            if 'next_stage' in dialog:
-                conversation_history[session_id]['state'] = dialog.get('next_stage')
-
-            if "{{ weather_response }}" in dialog['bot']:
-                weather_data = get_weather_in_berlin()
-                if weather_data:
-                    logging.info(f"Replacing placeholder with weather data: {weather_data}")
-                    return dialog['bot'].replace("{{ weather_response }}", weather_data)
-                else:
-                    logging.error("Failed to fetch weather data.")
-                    return "Sorry, I couldn't fetch the weather data right now."
-
-            return dialog['bot']
-
-    # Partial matching fallback
-    for dialog in dialogs:
-        if dialog['user'].strip().lower() in user_message:
-            logging.debug(f"Partial match found: {dialog['user']}")
-            if 'next_stage' in dialog:
-                conversation_history[session_id]['state'] = dialog.get('next_stage')
-
-            if "{{ weather_response }}" in dialog['bot']:
-                weather_data = get_weather_in_berlin()
-                if weather_data:
-                    logging.info(f"Replacing placeholder with weather data: {weather_data}")
-                    return dialog['bot'].replace("{{ weather_response }}", weather_data)
-                else:
-                    logging.error("Failed to fetch weather data.")
-                    return "Sorry, I couldn't fetch the weather data right now."
+    # Exact match first, then the first dialog contained in the message; see chat/matching.py
+    dialog = kb.dialog_matcher.match(user_message)
+    if dialog is None:
+        logging.warning(f"No dialog match found for: {user_message}")
+        return None
 
-            return dialog['bot']
+    logging.debug(f"Dialog match found: {dialog['user']}")
+    if 'next_stage' in dialog:
+        conversation_store.set_state(session_id, dialog.get('next_stage'))
 
-    logging.warning(f"No dialog match found for: {user_message}")
-    return None
+    if "{{ weather_response }}" in dialog['bot']:
+        weather_data = get_weather_in_berlin()
+        if weather_data:
+            logging.info(f"Replacing placeholder with weather data: {weather_data}")
+            return dialog['bot'].replace("{{ weather_response }}", weather_data)
+        else:
+            logging.error("Failed to fetch weather data.")
+            return "Sorry, I couldn't fetch the weather data right now."
 
+    return dialog['bot']
 
 
 
+
+# Answer questions about rents, crime, amenities and population from the database
+def get_data_response(user_message):
+    try:
+        return answer_data_question(user_message)
+    except Exception as e:
+        logging.error(f"Error answering data question: {e}")
+        return None
+
+
 # Get predefined responses from YAML file
 def get_website_response(user_message):
-    best_match, score = process.extractOne(user_message, website_responses.keys(), scorer=fuzz.token_set_ratio)
-    if score > 70:
-        return website_responses[best_match]
-    return None
+    return knowledge_base.current().response_matcher.match(user_message, sources=('website',))
 
 # Check for predefined responses and handle name cases
 def get_predefined_response(user_message, session_id):
@@ -256,46 +165,44 @@ def get_predefined_response(user_message, session_id):
     # Handle name introduction
     if "my name is" in user_message:
         user_name = user_message.split("my name is")[-1].strip().capitalize()
-        user_data[session_id] = user_name
+        conversation_store.set_name(session_id, user_name)
         return f"Nice to meet you, {user_name}!"
 
     # Refer to the user's name if known
-    if ("what's my name" in user_message or "what is my name" in user_message) and session_id in user_data:
-        return f"Your name is {user_data[session_id]}, right?"
-
+    if "what's my name" in user_message or "what is my name" in user_message:
+        user_name = conversation_store.get_name(session_id)
+        if user_name:
+            return f"Your name is {user_name}, right?"
 
 
- # Check dialog responses first
-    bot_message = get_dialog_response(user_message, session_id)
-    if bot_message:
-        return bot_message
-    
-    
-   # Check factual responses first
-    best_match, score = process.extractOne(user_message, factual_responses.keys(), scorer=fuzz.token_set_ratio)
-    if score > 80:  # Increase threshold for higher precision
-        return factual_responses[best_match]
+    # Dialog responses are matched once per message by chat_view before this is called
 
-    # Check website responses next
-    best_match, score = process.extractOne(user_message, website_responses.keys(), scorer=fuzz.token_set_ratio)
-    if score > 70:
-        return website_responses[best_match]
-
-    return None
+    # Check factual responses first, then website responses, scored in one batch
+    return knowledge_base.current().response_matcher.match(user_message)
 
 # Fallback response generator
 def get_fallback_response():
     return random.choice(fallback_responses)
 
 # AI-powered response using Google Gemini
-def get_ai_response(user_message, session_id):
-    """Generate AI response using Google Gemini with Berlin rental context"""
-    if not gemini_model:
-        return None
-    
-    try:
-        # Build context about Berlin RentWise
-        system_context = """You are a helpful AI assistant for Berlin RentWise, a website that helps people find rental apartments in Berlin. 
+# Gemini answers, keyed on the normalized question and recent history
+ai_response_cache = PromptCache(
+    ttl=settings.AI_RESPONSE_CACHE_TTL,
+    max_entries=settings.AI_RESPONSE_CACHE_MAX_ENTRIES,
+)
+
+
+# Cache and session figures for the metrics endpoint, read when it is scraped
+@REGISTRY.register_gauges
+def chat_state_gauges():
+    for name, value in ai_response_cache.stats().items():
+        yield f'chat_ai_cache_{name}', f'Gemini answer cache: {name.replace("_", " ")}.', {}, value
+    for name, value in conversation_store.stats().items():
+        if value is not None:
+            yield f'chat_conversation_{name}', f'Chat conversation store: {name}.', {}, value
+
+# Build context about Berlin RentWise
+AI_SYSTEM_CONTEXT = """You are a helpful AI assistant for Berlin RentWise, a website that helps people find rental apartments in Berlin. 
         You have access to information about Berlin neighborhoods, boroughs, rental prices, crime statistics, and amenities.
         
         Key features of the website:
@@ -306,79 +213,322 @@ def get_ai_response(user_message, session_id):
         
         When users ask about neighborhoods, rents, or living in Berlin, provide helpful, conversational responses.
         Keep responses concise (2-3 sentences) and friendly."""
-        
-        # Get conversation history for context
-        history_context = ""
-        if session_id in conversation_history:
-            recent_messages = conversation_history[session_id]['messages'][-4:]
-            history_context = "\n".join(recent_messages)
-        
-        # Combine context and user message
-        full_prompt = f"{system_context}\n\nConversation history:\n{history_context}\n\nUser: {user_message}\n\nAssistant:"
-        
-        # Generate response
-        response = gemini_model.generate_content(full_prompt)
-        return response.text.strip()
-        
-    except Exception as e:
-        logging.error(f"Error generating AI response: {e}")
+
+
+def build_ai_prompt(user_message, history):
+    # Recent conversation history for context
+    history_context = "\n".join(history)
+
+    # Combine context and user message
+    return f"{AI_SYSTEM_CONTEXT}\n\nConversation history:\n{history_context}\n\nUser: {user_message}\n\nAssistant:"
+
+
+def get_ai_response(user_message, session_id):
+    """Generate AI response using Google Gemini with Berlin rental context"""
+    gemini_model = get_gemini_model()
+    if not gemini_model:
         return None
+    
+    history = conversation_store.recent_messages(session_id)
+
+    def generate():
+        try:
+            # Generate response, bounded by the AI timeout and skipped while Gemini keeps failing
+            response = gemini_guard.call(gemini_model.generate_content, build_ai_prompt(user_message, history))
+            chat_upstream_requests.inc(provider='gemini', status='ok')
+            return response.text.strip()
+
+        except ProviderUnavailable as e:
+            logging.warning(f"Skipping Gemini: {e}")
+            status = 'timeout' if isinstance(e, ProviderTimeout) else 'unavailable'
+            chat_upstream_requests.inc(provider='gemini', status=status)
+            return None
+        except Exception as e:
+            logging.error(f"Error generating AI response: {e}")
+            chat_upstream_requests.inc(provider='gemini', status='error')
+            return None
+
+    # Near-identical questions with the same recent history share one answer and one upstream call
+    return ai_response_cache.get_or_generate(prompt_cache_key(user_message, history), generate)
+
+
+class AIStreamInterrupted(Exception):
+    """Gemini failed after part of its answer had already been sent."""
+
+
+def stream_ai_response(user_message, session_id):
+    """
+    Yield the Gemini response in chunks as they are generated. Raises
+    AIStreamInterrupted if Gemini fails after the first chunk.
+    """
+    gemini_model = get_gemini_model()
+    if not gemini_model:
+        return
+
+    history = conversation_store.recent_messages(session_id)
+    key = prompt_cache_key(user_message, history)
+    cached = ai_response_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    # A stream shows progress as it goes, so only the circuit breaker applies here, not the timeout
+    if not gemini_guard.breaker.allow():
+        logging.warning("Skipping Gemini: circuit is open")
+        chat_upstream_requests.inc(provider='gemini', status='unavailable')
+        return
+
+    chunks = []
+    start = time.monotonic()
+    try:
+        for chunk in gemini_model.generate_content(build_ai_prompt(user_message, history), stream=True):
+            if chunk.text:
+                chunks.append(chunk.text)
+                yield chunk.text
+    except Exception as e:
+        logging.error(f"Error streaming AI response: {e}")
+        gemini_guard.breaker.record_failure()
+        chat_upstream_requests.inc(provider='gemini', status='error')
+        if chunks:
+            raise AIStreamInterrupted(str(e)) from e
+        return
+    gemini_guard.breaker.record_success()
+    chat_upstream_requests.inc(provider='gemini', status='ok')
+
+    # Only complete answers are cached
+    ai_response_cache.set(key, "".join(chunks).strip(), time.monotonic() - start)
+
+
+def chat_session_id(request):
+    """The visitor's session key; a first message creates the session."""
+    if request.session.session_key is None:
+        request.session.create()
+    return request.session.session_key
+
+
+async def achat_session_id(request):
+    if request.session.session_key is None:
+        await request.session.acreate()
+    return request.session.session_key
+
+
+def chat_stages(user_message, session_id):
+    """
+    The answering stages for one message in priority order, as ``(name, provider,
+    kind)``. ``provider`` takes no arguments; ``kind`` is 'local' for lookups in
+    this process, 'network' for external services and 'fallback' for the stage
+    that always answers. Every chat view walks this list.
+    """
+    stages = [
+        # Priority 1: Check dialog responses for specific patterns
+        ('dialog', lambda: get_dialog_response(user_message, session_id), 'local'),
+        # Priority 2: Answer data questions (rents, crime, amenities) from the database
+        ('data', lambda: get_data_response(user_message), 'local'),
+        # Priority 3: Check for predefined or factual responses
+        ('fuzzy', lambda: get_predefined_response(user_message, session_id), 'local'),
+    ]
+    # Priority 4: Handle live weather check if requested
+    if "temperature" in user_message and "berlin" in user_message:
+        stages.append(('weather', lambda: get_weather_in_berlin(), 'network'))
+    stages += [
+        # Priority 5: Use AI for natural conversation
+        ('ai', lambda: get_ai_response(user_message, session_id), 'network'),
+        # Priority 6: Use Wikipedia for broader queries if AI not available
+        ('wiki', lambda: get_wikipedia_summary(user_message), 'network'),
+        # Priority 7: If all else fails, fallback to a fun fact
+        ('fallback', lambda: get_fallback_response(), 'fallback'),
+    ]
+    return stages
+
+
+# Timeouts in CHAT_STAGE_TIMEOUTS of the network stages
+STAGE_TIMEOUT_NAMES = {'weather': 'weather', 'ai': 'ai', 'wiki': 'wikipedia'}
+
 
 # Chat view to handle chat requests
 @csrf_exempt
 def chat_view(request):
-    session_id = request.session.session_key or request.session.create()
+    session_id = chat_session_id(request)
 
     if request.method == 'POST':
        user_message = request.POST.get('message', '').lower().strip(string.punctuation)
 
-    if session_id not in conversation_history:
-            conversation_history[session_id] = {'state': None, 'messages': []}
 
+    # Each stage is timed; see metrics.ChatTrace
+    trace = ChatTrace('sync')
 
-    # Priority 1: Check dialog responses for specific patterns
-    bot_message = get_dialog_response(user_message, session_id)
-    
-    # Priority 2: Check for predefined or factual responses
-    if not bot_message:
-        bot_message = get_predefined_response(user_message, session_id)
+    bot_message = None
+    for stage, provider, _ in chat_stages(user_message, session_id):
+        bot_message = trace.run(stage, provider)
+        if bot_message:
+            break
 
-    # Priority 3: Handle live weather check if requested
-    if not bot_message and "temperature" in user_message and "berlin" in user_message:
-        bot_message = get_weather_in_berlin()
+    trace.finish()
+        # Manage conversation history
+    manage_conversation_history(session_id, user_message, bot_message)
 
-    # Priority 4: Use AI for natural conversation (NEW!)
-    if not bot_message:
-        bot_message = get_ai_response(user_message, session_id)
+    return JsonResponse({"response": bot_message})
+
+    return render(request, 'neighborhoods/chatbox.html')
+
+
+def sse_event(data, event=None):
+    # One Server-Sent Event; JSON keeps newlines inside the data line
+    return (f"event: {event}\n" if event else "") + f"data: {json.dumps(data)}\n\n"
 
-    # Priority 5: Use Wikipedia for broader queries if AI not available
+
+# Streaming variant of chat_view: sends the answer as Server-Sent Events. Gemini
+# answers arrive token by token; any other answer is sent as a single token.
+@csrf_exempt
+@require_POST
+def chat_stream_view(request):
+    session_id = chat_session_id(request)
+    user_message = request.POST.get('message', '').lower().strip(string.punctuation)
+
+    def events():
+        trace = ChatTrace('stream')
+
+        bot_message = None
+        for stage, provider, _ in chat_stages(user_message, session_id):
+            if stage != 'ai':
+                bot_message = trace.run(stage, provider)
+                if bot_message:
+                    yield sse_event({"token": bot_message})
+                    break
+                continue
+
+            # Stream the AI answer as it is generated
+            tokens = []
+            start = time.perf_counter()
+            try:
+                for token in stream_ai_response(user_message, session_id):
+                    tokens.append(token)
+                    yield sse_event({"token": token})
+            except AIStreamInterrupted:
+                # The tokens sent so far are not an answer: keep them out of the history
+                trace.record('ai', time.perf_counter() - start)
+                trace.finish()
+                yield sse_event({"error": "The answer was interrupted. Please try again."}, event="error")
+                return
+            trace.record('ai', time.perf_counter() - start)
+            bot_message = "".join(tokens).strip()
+            if bot_message:
+                trace.answered_by = 'ai'
+                break
+
+        # Only a completed answer becomes part of the conversation history
+        manage_conversation_history(session_id, user_message, bot_message)
+        trace.finish()
+        yield sse_event({"response": bot_message}, event="done")
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# Async variant of chat_view for ASGI deployments. The local lookups run first;
+# weather, Gemini and Wikipedia then run concurrently under per-stage timeouts
+# and one overall deadline, and the highest-priority answer in time wins.
+@csrf_exempt
+@require_POST
+async def chat_async_view(request):
+    session_id = await achat_session_id(request)
+    user_message = request.POST.get('message', '').lower().strip(string.punctuation)
+
+    trace = ChatTrace('async')
+    stages = chat_stages(user_message, session_id)
+
+    # The local lookups run one after the other
+    bot_message = None
+    for stage, provider, kind in stages:
+        if kind == 'local':
+            bot_message = await sync_to_async(trace.run)(stage, provider)
+            if bot_message:
+                break
+
+    # Network-bound providers, started together
     if not bot_message:
-        bot_message = get_wikipedia_summary(user_message)
+        timeouts = settings.CHAT_STAGE_TIMEOUTS
+        providers = [
+            (stage, trace.timed(stage, provider), timeouts[STAGE_TIMEOUT_NAMES[stage]])
+            for stage, provider, kind in stages if kind == 'network'
+        ]
+        trace.answered_by, bot_message = await first_answer(providers, settings.CHAT_DEADLINE)
 
-    # Priority 6: If all else fails, fallback to a fun fact
     if not bot_message:
-        bot_message = get_fallback_response()
+        for stage, provider, kind in stages:
+            if kind == 'fallback':
+                bot_message = trace.run(stage, provider)
 
-        # Manage conversation history
-    manage_conversation_history(session_id, user_message, bot_message)
+    trace.finish()
+
+    await sync_to_async(manage_conversation_history)(session_id, user_message, bot_message)
 
     return JsonResponse({"response": bot_message})
 
-    return render(request, 'neighborhoods/chatbox.html')
+# Chat latency, answering stage, cache and upstream metrics in the Prometheus text format (staff only)
+def metrics_view(request):
+    if not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
+# Defers the columns a sparse fieldset leaves out, so they are never loaded
+class SparseFieldsetsViewSetMixin:
+    def get_deferred_fields(self):
+        serializer_class = self.get_serializer_class()
+        model = serializer_class.Meta.model
+        names = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+        kept = sparse_field_names(
+            self.request, self.action, names, getattr(serializer_class.Meta, 'list_omit', ())
+        )
+        return [name for name in names if name not in kept]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        deferred = self.get_deferred_fields()
+        return queryset.defer(*deferred) if deferred else queryset
+
 # API Viewsets
-class NeighborhoodViewSet(viewsets.ModelViewSet):
+class NeighborhoodViewSet(SparseFieldsetsViewSetMixin, viewsets.ModelViewSet):
     queryset = Neighborhood.objects.all()
     serializer_class = NeighborhoodSerializer
     permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
-
-class BoroughViewSet(viewsets.ModelViewSet):
+    pagination_class = IdCursorPagination
+
+    def get_expansions(self):
+        return requested_expansions(self.request, NEIGHBORHOOD_EXPANSIONS)
+
+    def get_deferred_fields(self):
+        deferred = super().get_deferred_fields()
+        # Crime rows are prefetched through the borough foreign key
+        if 'crime' in self.get_expansions():
+            deferred = [name for name in deferred if name != 'borough']
+        return deferred
+
+    def get_queryset(self):
+        # ?expand= costs one query per relation, however many neighborhoods are listed
+        queryset = super().get_queryset()
+        prefetches = []
+        for name in self.get_expansions():
+            lookup, serializer_class = NEIGHBORHOOD_EXPANSIONS[name]
+            if '__' in lookup:
+                # Only the key of the intermediate row is needed; a borough row carries its polygons
+                relation = lookup.split('__')[0]
+                related_model = queryset.model._meta.get_field(relation).related_model
+                prefetches.append(Prefetch(relation, queryset=related_model.objects.only('id')))
+            prefetches.append(Prefetch(lookup, queryset=serializer_class.Meta.model.objects.order_by('id')))
+        return queryset.prefetch_related(*prefetches) if prefetches else queryset
+
+class BoroughViewSet(SparseFieldsetsViewSetMixin, viewsets.ModelViewSet):
     queryset = Borough.objects.all()
     serializer_class = BoroughSerializer
     permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
+    pagination_class = IdCursorPagination
 
 # Home view
 def home(request):
@@ -403,216 +553,180 @@ def borough_list(request):
     if lifestyles:
         boroughs = boroughs.filter(lifestyles__name__in=lifestyles).distinct()
 
+    # Load every borough's lifestyles in one query instead of one per borough
+    boroughs = boroughs.prefetch_related('lifestyles')
+
     boroughs_data = [{
         'name': borough.name,
         'minimum_rent': borough.minimum_rent,
-        'lifestyles': list(borough.lifestyles.values_list('name', flat=True)),
+        'lifestyles': [lifestyle.name for lifestyle in borough.lifestyles.all()],
         'latitude': borough.latitude,
         'longitude': borough.longitude,
         'slug': borough.slug
     } for borough in boroughs]
 
-    return render(request, 'neighborhoods/borough_list.html', {'boroughs': boroughs_data})
+    return render(request, 'neighborhoods/borough_list.html', {
+        'boroughs': boroughs_data,
+        # The map refetches the polygons when the zoom crosses one of these levels
+        'lod_zooms': sorted(min_zoom for min_zoom, _ in LOD_LEVELS),
+    })
 
 # View to display neighborhoods within a selected borough
-from django.db.models import F, FloatField
-
 def neighborhood_list(request, borough_slug):
-    # Get the borough based on slug
-    borough = get_object_or_404(Borough, slug=borough_slug)
-    
+    # Crime and amenity statistics are precomputed in BoroughStats; see stats.py
+    try:
+        stats = get_borough_stats(borough_slug)
+    except Borough.DoesNotExist:
+        raise Http404("No Borough matches the given query.")
+    borough = stats.borough
+
     # Query all neighborhoods in the borough
     neighborhoods = Neighborhood.objects.filter(borough=borough)
 
-    # Total crimes for all of Berlin
-    total_crimes_berlin = CrimeData.objects.aggregate(total_crimes=Sum('total_crimes'))['total_crimes'] or 0
-
-    # Total crimes for the current borough
-    crime_data = CrimeData.objects.filter(borough=borough).aggregate(
-        total_crimes=Sum('total_crimes'),
-        total_robbery=Sum('robbery'),
-        total_assaults=Sum('total_assaults'),
-        total_thefts=Sum('total_thefts'),
-        total_residential_burglary=Sum('total_residential_burglary'),
-        total_arson_incidents=Sum('total_arson_incidents'),
-        total_vandalism=Sum('total_vandalism'),
-    )
-    total_crimes_borough = crime_data.get('total_crimes', 0)
-
-    # Calculate crime percentages for the current borough
-    total_crimes = crime_data.get('total_crimes') or 0
-    if total_crimes > 0:
-        crime_percentages = {
-            'robbery': round((crime_data.get('total_robbery', 0) / total_crimes) * 100, 1),
-            'assaults': round((crime_data.get('total_assaults', 0) / total_crimes) * 100, 1),
-            'thefts': round((crime_data.get('total_thefts', 0) / total_crimes) * 100, 1),
-            'burglary': round((crime_data.get('total_residential_burglary', 0) / total_crimes) * 100, 1),
-            'arson': round((crime_data.get('total_arson_incidents', 0) / total_crimes) * 100, 1),
-            'vandalism': round((crime_data.get('total_vandalism', 0) / total_crimes) * 100, 1),
-        }
-    else:
-        crime_percentages = {key: 0.0 for key in ['robbery', 'assaults', 'thefts', 'burglary', 'arson', 'vandalism']}
-
     # Total crimes for each borough
-    borough_crime_totals = CrimeData.objects.values('borough__name').annotate(
-        total_crimes=Sum('total_crimes')
-    )
-
-    # Aggregate amenities data for the current borough
-    amenities = Amenities.objects.filter(borough=borough)
-    amenity_counts = amenities.values('amenity_type').annotate(count=Count('amenity_type'))
-
-    # Calculate total and percentages for amenities
-    total_amenities = sum(item['count'] for item in amenity_counts)
-    if total_amenities > 0:
-        amenity_percentages = {
-            item['amenity_type']: round((item['count'] / total_amenities) * 100, 1)
-            for item in amenity_counts
-        }
-    else:
-        amenity_percentages = {item['amenity_type']: 0.0 for item in amenity_counts}
+    borough_crime_totals = BoroughStats.objects.values('borough__name', 'total_crimes')
 
     context = {
         'borough': borough,
         'neighborhoods': neighborhoods,
-        'crime_data': crime_data,
-        'crime_percentages': crime_percentages,
-        'amenity_percentages': amenity_percentages,
-        'total_crimes_berlin': total_crimes_berlin,
-        'total_crimes_borough': total_crimes_borough,
+        'crime_data': stats.crime_data,
+        'crime_percentages': stats.crime_percentages,
+        'amenity_percentages': stats.amenity_percentages,
+        'total_crimes_berlin': stats.berlin_total_crimes,
+        'total_crimes_borough': stats.total_crimes,
         'borough_crime_totals': borough_crime_totals,
+        # The map refetches the polygons when the zoom crosses one of these levels
+        'lod_zooms': sorted(min_zoom for min_zoom, _ in LOD_LEVELS),
     }
 
     return render(request, 'neighborhoods/neighborhood_list.html', context)
 
 # Neighborhood detail view with related data
 def neighborhood_detail(request, neighborhood_id):
-    # Fetch the neighborhood and borough data
-    neighborhood = get_object_or_404(Neighborhood, id=neighborhood_id)
-    borough = neighborhood.borough
-
-    # Related data - fetching demographics and rent data for the neighborhood
-    demographics = Demographics.objects.filter(neighborhood=neighborhood).first()
-    rent_data = RentData.objects.filter(neighborhood=neighborhood).first()
-    transport_stations = Transports.objects.filter(neighborhood=neighborhood)
-    
-    # Group transport data by station name and collect all available types
-    transport_data = defaultdict(list)
-    for transport in transport_stations:
-        transport_data[transport.name].append(transport.type)
-        
-        
-      
-      
-    # Create dictionaries for ethnic distribution and age distribution
-    ethnic_distribution = {}
-    age_distribution = {}
-
-    if demographics:
-        # Update ethnic distribution based on actual fields in demographics model
-        ethnic_distribution = {
-            'germans': getattr(demographics, 'germans', 0),  # Replace with correct field names
-            'turkey': getattr(demographics, 'turkey', 0),  # Replace with correct field names
-            'poland': getattr(demographics, 'poland', 0),  # Replace with correct field names
-            'other_percentage': getattr(demographics, 'other_percentage', 0)  # Replace with correct field names
-        }
-
-        # Update age distribution fields
-        age_distribution = {
-            'under_6': getattr(demographics, 'under_6', 0),
-            'six_to_15': getattr(demographics, 'six_to_15', 0),
-            'fifteen_to_18': getattr(demographics, 'fifteen_to_18', 0),
-            'eighteen_to_27': getattr(demographics, 'eighteen_to_27', 0),
-            'twenty_seven_to_45': getattr(demographics, 'twenty_seven_to_45', 0),
-            'forty_five_to_55': getattr(demographics, 'forty_five_to_55', 0),
-            'fifty_five_and_more': getattr(demographics, 'fifty_five_and_more', 0)
+    # The related data is precomputed in NeighborhoodSummary; see stats.py
+    cache_key = neighborhood_detail_cache_key(neighborhood_id)
+    context = cache.get(cache_key)
+    if context is None:
+        try:
+            summary = get_neighborhood_summary(neighborhood_id)
+        except Neighborhood.DoesNotExist:
+            raise Http404("No Neighborhood matches the given query.")
+        neighborhood = summary.neighborhood
+
+        # Context dictionary to pass data to the template
+        context = {
+            'neighborhood': neighborhood,
+            'borough': neighborhood.borough,
+            'demographics': summary.demographics,
+            'rent_data': summary.rent,
+            'ethnic_distribution_json': json.dumps(summary.ethnic_distribution),  # JSON format for ethnic distribution
+            'age_distribution_json': json.dumps(summary.age_distribution),        # JSON format for age distribution
+            'amenities_data_json': json.dumps(summary.amenity_counts),            # JSON format for amenities data
+            'transport_data': summary.transport_stations                          # Grouped transport data by station name
         }
-        
-        
-    
-
-    # Aggregate amenities data for the neighborhood
-    amenities = Amenities.objects.filter(neighborhood=neighborhood)
-    amenity_counts = amenities.values('amenity_type').annotate(count=Count('amenity_type'))
-
-    # Extract labels and counts for the pie chart
-    amenities_data = {item['amenity_type']: item['count'] for item in amenity_counts}
-
-    # Context dictionary to pass data to the template
-    context = {
-        'neighborhood': neighborhood,
-        'borough': borough,
-        'demographics': demographics,
-        'rent_data': rent_data,
-        'ethnic_distribution_json': json.dumps(ethnic_distribution),  # JSON format for ethnic distribution
-        'age_distribution_json': json.dumps(age_distribution),        # JSON format for age distribution
-        'amenities_data_json': json.dumps(amenities_data),            # JSON format for amenities data
-        'transport_data': dict(transport_data)                        # Grouped transport data by station name
-    }
+        cache.set(cache_key, context)
 
     return render(request, 'neighborhoods/neighborhood_detail.html', context)
 
 
-
-
 # API view to provide neighborhood data as GeoJSON
 def neighborhood_data_api(request, borough_slug):
     borough = get_object_or_404(Borough, slug=borough_slug)
+    neighborhood_names = Neighborhood.objects.filter(borough=borough).values_list('name', flat=True)
+    tolerance = resolve_tolerance(request.GET)
 
-    geojson_file_path = os.path.join(settings.BASE_DIR, 'static', 'geojson', 'berlin_neighborhoods.geojson')
+    # The GeoJSON file is parsed once per process; see geojson_index.py
     try:
-        with open(geojson_file_path, 'r', encoding='utf-8') as f:
-            geojson_data = json.load(f)
+        payload = neighborhood_geojson.feature_collection(borough.slug, neighborhood_names, tolerance)
     except FileNotFoundError:
         return JsonResponse({"error": "GeoJSON file not found."}, status=404)
 
-    neighborhoods = Neighborhood.objects.filter(borough=borough)
-    neighborhood_names = neighborhoods.values_list('name', flat=True)
-
-    filtered_features = [
-        feature for feature in geojson_data['features']
-        if feature['properties'].get('name', '').strip().lower() in [name.strip().lower() for name in neighborhood_names]
-    ]
-
-    if not filtered_features:
+    if payload is None:
         return JsonResponse({"error": "No neighborhoods found for this borough."}, status=404)
 
-    filtered_geojson = {
-        "type": "FeatureCollection",
-        "features": filtered_features
-    }
+    return HttpResponse(payload, content_type='application/json')
 
-    return JsonResponse(filtered_geojson)
+# ETag for borough_data_api: the data version plus the level of detail
+def borough_data_etag(request):
+    return f'"{borough_geojson_version()}-{resolve_tolerance(request.GET)}"'
 
-# API view to provide borough data with GeoJSON structure
+# API view to provide borough data with GeoJSON structure. The serialized
+# collection is cached per level of detail until a borough or lifestyle changes
+# (or for DATA_CACHE_TTL seconds, see borough_geojson_version),
+# and the ETag lets browsers revalidate without downloading the polygons again.
+@condition(etag_func=borough_data_etag)
 def borough_data_api(request):
-    boroughs = Borough.objects.all()
-
-    features = []
-    for borough in boroughs:
-        lifestyles = list(borough.lifestyles.all().values_list('name', flat=True))
-
-        feature = {
-            "type": "Feature",
-            "geometry": {
-                "type": "Polygon",
-                "coordinates": borough.geometry_coordinates
-            },
-            "properties": {
-                "name": borough.name,
-                "slug": borough.slug,
-                "minimum_rent": borough.minimum_rent,
-                "lifestyles": lifestyles
+    tolerance = resolve_tolerance(request.GET)
+    cache_key = borough_geojson_cache_key(borough_geojson_version(), tolerance)
+    payload = cache.get(cache_key)
+
+    if payload is None:
+        boroughs = list(Borough.objects.prefetch_related('lifestyles'))
+        geometries = simplify_geometries(
+            [{"type": "Polygon", "coordinates": borough.geometry_coordinates} for borough in boroughs],
+            tolerance,
+        )
+
+        features = []
+        for borough, geometry in zip(boroughs, geometries):
+            lifestyles = [lifestyle.name for lifestyle in borough.lifestyles.all()]
+
+            feature = {
+                "type": "Feature",
+                "geometry": geometry,
+                "properties": {
+                    "name": borough.name,
+                    "slug": borough.slug,
+                    "minimum_rent": borough.minimum_rent,
+                    "lifestyles": lifestyles
+                }
             }
+            features.append(feature)
+
+        geojson = {
+            "type": "FeatureCollection",
+            "features": features
         }
-        features.append(feature)
+        payload = json.dumps(geojson, separators=(',', ':')).encode('utf-8')
+        cache.set(cache_key, payload, settings.DATA_CACHE_TTL)
 
-    geojson = {
-        "type": "FeatureCollection",
-        "features": features
-    }
+    response = HttpResponse(payload, content_type='application/json')
+    patch_cache_control(response, no_cache=True)
+    return response
 
-    return JsonResponse(geojson)
+# Parse a latitude/longitude pair, returning None when it is not a valid coordinate
+def parse_point(lat, lon):
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+# API view mapping coordinates to the neighborhood and borough that contain them.
+# GET ?lat=&lon= looks up one point; POST {"points": [[lat, lon], ...]} a batch.
+@api_view(['GET', 'POST'])
+def locate_api(request):
+    if request.method == 'GET':
+        point = parse_point(request.query_params.get('lat'), request.query_params.get('lon'))
+        if point is None:
+            return Response({"error": "Valid 'lat' and 'lon' parameters are required."}, status=400)
+        return Response(locate_points([point[0]], [point[1]])[0])
+
+    points = request.data.get('points') if isinstance(request.data, dict) else None
+    if not isinstance(points, list) or not points:
+        return Response({"error": "'points' must be a non-empty list of [lat, lon] pairs."}, status=400)
+    if len(points) > LOCATE_MAX_POINTS:
+        return Response({"error": f"At most {LOCATE_MAX_POINTS} points can be located per request."}, status=400)
+
+    parsed = [parse_point(*item) if isinstance(item, (list, tuple)) and len(item) == 2 else None for item in points]
+    invalid = [i for i, point in enumerate(parsed) if point is None]
+    if invalid:
+        return Response({"error": "Invalid points.", "invalid_indexes": invalid[:100]}, status=400)
+
+    lats, lons = zip(*parsed)
+    return Response({"results": locate_points(lats, lons)})
 
 # User registration view
 def register(request):
@@ -115,8 +115,23 @@ else:
 DATABASES['default']['TEST'] = {
     'NAME': 'test_berlin_capstone',  # Define a test database name
 }
-from django.conf import settings
-print(settings.DATABASES)
+
+# Django cache. The default LocMemCache is per process: gunicorn workers and management
+# commands do not see each other's entries. Set CACHE_BACKEND to a shared backend, e.g.
+# django.core.cache.backends.db.DatabaseCache with CACHE_LOCATION=django_cache (after
+# `manage.py createcachetable`), or FileBasedCache with a directory, to share it.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Seconds that cached values derived from the database (borough GeoJSON and its version,
+# the point lookup, the chat fact table) are kept. Each write invalidates them only in the
+# cache of the process that made it, so with a per-process cache this bounds how long
+# other workers serve stale data.
+DATA_CACHE_TTL = int(os.getenv('DATA_CACHE_TTL', '300'))
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -233,3 +248,70 @@ LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+
+
+# Chatbot Wikipedia lookups: successful summaries are cached for WIKIPEDIA_CACHE_TTL
+# seconds, page misses and disambiguations for WIKIPEDIA_CACHE_NEGATIVE_TTL.
+# Set WIKIPEDIA_CACHE_PATH to keep warm entries across worker restarts.
+WIKIPEDIA_CACHE_MAX_ENTRIES = int(os.getenv('WIKIPEDIA_CACHE_MAX_ENTRIES', '1024'))
+WIKIPEDIA_CACHE_TTL = int(os.getenv('WIKIPEDIA_CACHE_TTL', '86400'))
+WIKIPEDIA_CACHE_NEGATIVE_TTL = int(os.getenv('WIKIPEDIA_CACHE_NEGATIVE_TTL', '600'))
+WIKIPEDIA_CACHE_PATH = os.getenv('WIKIPEDIA_CACHE_PATH') or None
+
+# Chatbot weather lookups: reports are fresh for WEATHER_CACHE_TTL seconds and served
+# stale (while one background refresh runs) up to WEATHER_STALE_TTL.
+WEATHER_API_URL = os.getenv('WEATHER_API_URL', 'https://api.weatherapi.com/v1/current.json')
+WEATHER_CACHE_TTL = int(os.getenv('WEATHER_CACHE_TTL', '300'))
+WEATHER_STALE_TTL = int(os.getenv('WEATHER_STALE_TTL', '1800'))
+WEATHER_CONNECT_TIMEOUT = float(os.getenv('WEATHER_CONNECT_TIMEOUT', '2'))
+WEATHER_READ_TIMEOUT = float(os.getenv('WEATHER_READ_TIMEOUT', '3'))
+
+# Chatbot conversation state. The in-process default is per worker; set
+# CHAT_CONVERSATION_BACKEND=neighborhoods.chat.state.CacheConversationStore to keep
+# conversations in the default cache. That only shares them between workers when CACHES
+# is a shared backend (CACHE_BACKEND above); with the default LocMemCache it is per worker too.
+CHAT_CONVERSATION_STORE = {
+    'BACKEND': os.getenv('CHAT_CONVERSATION_BACKEND', 'neighborhoods.chat.state.LocMemConversationStore'),
+    'OPTIONS': {
+        'idle_ttl': int(os.getenv('CHAT_CONVERSATION_IDLE_TTL', '3600')),
+    },
+}
+if CHAT_CONVERSATION_STORE['BACKEND'].endswith('LocMemConversationStore'):
+    CHAT_CONVERSATION_STORE['OPTIONS']['max_sessions'] = int(os.getenv('CHAT_CONVERSATION_MAX_SESSIONS', '10000'))
+
+# Per-provider chat timeouts in seconds, enforced on every chat endpoint, and the overall
+# answer deadline of the async endpoint (/chat/async/)
+CHAT_DEADLINE = float(os.getenv('CHAT_DEADLINE', '8'))
+CHAT_STAGE_TIMEOUTS = {
+    'weather': float(os.getenv('CHAT_WEATHER_TIMEOUT', '5')),
+    'ai': float(os.getenv('CHAT_AI_TIMEOUT', '8')),
+    'wikipedia': float(os.getenv('CHAT_WIKIPEDIA_TIMEOUT', '5')),
+}
+
+# Circuit breakers for weatherapi.com, Wikipedia and Gemini: once `failure_rate` of at least
+# `min_calls` calls in the last `window` seconds failed, calls fail fast for `open_seconds`
+CHAT_CIRCUIT_BREAKER = {
+    'failure_rate': float(os.getenv('CHAT_CIRCUIT_FAILURE_RATE', '0.5')),
+    'min_calls': int(os.getenv('CHAT_CIRCUIT_MIN_CALLS', '5')),
+    'window': float(os.getenv('CHAT_CIRCUIT_WINDOW', '60')),
+    'open_seconds': float(os.getenv('CHAT_CIRCUIT_OPEN_SECONDS', '30')),
+    # Calls per provider still running (timed-out ones included) before new calls fail fast
+    'max_concurrency': int(os.getenv('CHAT_CIRCUIT_MAX_CONCURRENCY', '4')),
+}
+
+# Gemini answers cached per normalized question and recent history
+AI_RESPONSE_CACHE_TTL = int(os.getenv('AI_RESPONSE_CACHE_TTL', '3600'))
+AI_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('AI_RESPONSE_CACHE_MAX_ENTRIES', '2048'))
+
+# Chatbot YAML knowledge base in data/: changed files are picked up within
+# KNOWLEDGE_BASE_CHECK_INTERVAL seconds. `manage.py compile_knowledge_base` writes a
+# JSON snapshot of the parsed files that workers load at start while it matches them.
+KNOWLEDGE_BASE_CHECK_INTERVAL = float(os.getenv('KNOWLEDGE_BASE_CHECK_INTERVAL', '2'))
+KNOWLEDGE_BASE_SNAPSHOT_PATH = os.getenv('KNOWLEDGE_BASE_SNAPSHOT_PATH', os.path.join(BASE_DIR, 'data', 'knowledge_base.json'))
+
+# Share of chat messages whose per-stage timings are logged (0 disables, 1 logs every message);
+# the aggregated timings are always available at /metrics/
+CHAT_TRACE_SAMPLE_RATE = float(os.getenv('CHAT_TRACE_SAMPLE_RATE', '0'))
+
+# Import time allowed for starting a worker, checked by `manage.py benchmark_startup`
+STARTUP_IMPORT_BUDGET_MS = float(os.getenv('STARTUP_IMPORT_BUDGET_MS', '400'))